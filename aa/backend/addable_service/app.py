@@ -1,7 +1,7 @@
 import os
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from supabase import create_client
+from shared.clients import get_supabase_client
 from dotenv import load_dotenv
 import jwt
 from datetime import datetime, timezone, timedelta
@@ -25,7 +25,7 @@ jwt_secret_key = os.getenv("JWT_SECRET_KEY")
 if not supabase_url or not supabase_key or not jwt_secret_key:
     raise ValueError("Missing Supabase credentials or JWT Secret Key")
 
-supabase = create_client(supabase_url, supabase_key)
+supabase = get_supabase_client(supabase_url, supabase_key)
 
 @app.route('/addable', methods=['POST'])
 def addable():
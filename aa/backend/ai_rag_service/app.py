@@ -1,11 +1,14 @@
 import os
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from supabase import create_client, Client
+from supabase import Client
+from shared.clients import get_supabase_client
+from shared.db import Database
 from dotenv import load_dotenv
 from openai import OpenAI
 
 from rag.rag import Rag
+from rag.embedding_cache import EmbeddingCache, RAG_EMBEDDING_CACHE_PATH
 from rag.bot import Bot
 
 # Load environment variables
@@ -27,7 +30,8 @@ supabase_key = os.getenv("SUPABASE_KEY")
 if not supabase_url or not supabase_key:
     raise ValueError("Missing Supabase credentials")
 
-supabase_client: Client = create_client(supabase_url, supabase_key)
+supabase_client: Client = get_supabase_client(supabase_url, supabase_key)
+db = Database() # Survey reads go through the version-checked survey cache
 
 # Initialize openai
 openai_key = os.getenv("OPENAI_API_KEY")
@@ -39,7 +43,9 @@ openai_client = OpenAI(api_key=openai_key)
 OPEN_AI_EMBEDDING_MODEL = "text-embedding-ada-002"
 OPEN_AI_ENCODING_FORMAT = "float"
 
-rag = Rag(supabase_client, openai_client, OPEN_AI_EMBEDDING_MODEL, OPEN_AI_ENCODING_FORMAT)
+# Repeated answers and queries are embedded once; set RAG_EMBEDDING_CACHE_PATH empty to disable
+embedding_cache = EmbeddingCache() if RAG_EMBEDDING_CACHE_PATH else None
+rag = Rag(supabase_client, openai_client, OPEN_AI_EMBEDDING_MODEL, OPEN_AI_ENCODING_FORMAT, embedding_cache=embedding_cache)
 bot = Bot(openai_client, rag)
 
 @app.route('/persist_response_into_vector_store', methods=['POST'])
@@ -48,15 +54,15 @@ def persist_response_into_vector_store():
     survey_id = data.get("survey_id")
     user_ids = data.get("user_ids")
 
-    # query supabase surveys table for the specific survey_id
-    survey_response = supabase_client.table('surveys').select("*").eq('survey_id', survey_id).execute()
-    if not survey_response.data:
+    # query the surveys table for the specific survey_id (cached while its version is unchanged)
+    survey = db.get_survey_by_id(survey_id)
+    if not survey:
         return jsonify({
             'success': False,
             'error': f"Survey with id {survey_id} not found."
         }), 404
 
-    questions = survey_response.data[0]['questions']
+    questions = survey['questions']
 
     response_responses = supabase_client.table('responses').select("*").eq('survey_id_fk', survey_id).in_('UID_fk', user_ids).execute()
     
@@ -70,11 +76,28 @@ def persist_response_into_vector_store():
     
     survey_responses = response_responses.data
 
-    rag.persist_response_into_vector_store(survey_responses, questions)
-    
+    result = rag.persist_response_into_vector_store(survey_responses, questions)
+    failed = result['failed']
+
+    if failed:
+        # Name the respondents and questions that did not make it, so just those can be resent
+        failed_uids = sorted({failure['uid'] for failure in failed})
+        return jsonify({
+            'success': False,
+            'error': f"Failed to persist {len(failed)} of {result['answers']} answers",
+            'inserted': result['inserted'],
+            'cached': result['cached'],
+            'failed_user_ids': failed_uids,
+            'failed': failed,
+            'skipped': result['skipped']
+        }), 207 if result['inserted'] else 502
+
     return jsonify({
         'success': True,
-        'message': 'Query Succeeed'
+        'message': 'Query Succeeed',
+        'inserted': result['inserted'],
+        'cached': result['cached'],
+        'skipped': result['skipped']
     }), 200
 
 @app.route('/query_text_for_user', methods=['POST'])
@@ -123,7 +146,8 @@ def attempt_to_answer_question():
 def health():
     return jsonify({
         'success': True,
-        'message': 'AI RAG service is healthy'
+        'message': 'AI RAG service is healthy',
+        'embedding_cache': rag.embedding_cache_stats()
     }), 200
 
 if __name__ == '__main__':
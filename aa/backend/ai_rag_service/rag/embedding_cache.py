@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+# Local SQLite file for cached embeddings; empty disables the cache
+RAG_EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE_PATH", "embedding_cache.db")
+# Least recently used embeddings are evicted past this many (about 6 KiB each for 1536 dimensions)
+RAG_EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("RAG_EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+
+# SQLite's default limit on ? parameters per statement is 999
+_LOOKUP_CHUNK = 500
+
+
+def embedding_key(model, encoding_format, text):
+    """Content address of an embedding: the same text, model and format always map to the same vector"""
+    payload = '\0'.join((model, encoding_format, text)).encode()
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def _encode(embedding):
+    # base64-format embeddings are strings; float ones are packed as float32,
+    # the precision the API computes them in
+    if isinstance(embedding, str):
+        return embedding.encode(), -1
+    return array('f', embedding).tobytes(), len(embedding)
+
+
+def _decode(blob, dims):
+    if dims < 0:
+        return blob.decode()
+    vector = array('f')
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """
+    Embeddings already fetched from OpenAI, in a local SQLite file.
+
+    Entries are keyed by a hash of (model, encoding_format, text), so repeated
+    answers ("Do you drive?: Yes") and repeated queries are embedded once. Every
+    hit bumps the entry's last_used stamp; once the table grows past
+    max_entries, the entries with the oldest stamps are deleted. Several workers
+    may share the file, so the size and the newest stamp are read from it rather
+    than tracked per process. Losing the file only costs new embedding calls, so
+    writes are not fsynced.
+    """
+
+    def __init__(self, path=RAG_EMBEDDING_CACHE_PATH, max_entries=RAG_EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY, vector BLOB NOT NULL, dims INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _tick(self):
+        # A counter rather than a timestamp, so recency never ties; read from the
+        # file (via the last_used index) so other workers' stamps are seen
+        return self._conn.execute("SELECT COALESCE(MAX(last_used), 0) + 1 FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, encoding_format, texts):
+        """
+        Cached embeddings for the texts that have one
+
+        Returns:
+            dict: text -> embedding, for hits only
+        """
+        keys = {embedding_key(model, encoding_format, text): text for text in set(texts)}
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            for start in range(0, len(key_list), _LOOKUP_CHUNK):
+                chunk = key_list[start:start + _LOOKUP_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT key, vector, dims FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob, dims in rows:
+                    found[keys[key]] = _decode(blob, dims)
+            if found:
+                clock = self._tick()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(clock, embedding_key(model, encoding_format, text)) for text in found]
+                )
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, model, encoding_format, text):
+        return self.get_many(model, encoding_format, [text]).get(text)
+
+    def put_many(self, model, encoding_format, embeddings):
+        """Store {text: embedding}, evicting the least recently used entries past max_entries"""
+        if not embeddings:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                clock = self._tick()
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, dims, last_used) VALUES (?, ?, ?, ?)",
+                    [(embedding_key(model, encoding_format, text), *_encode(embedding), clock)
+                     for text, embedding in embeddings.items()]
+                )
+                size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                evicted = 0
+                if size > self.max_entries:
+                    evicted = self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN"
+                        " (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (size - self.max_entries,)
+                    ).rowcount
+                self._conn.execute("COMMIT")
+            except BaseException:
+                # Leave the connection usable for the next call (SQLite may already have rolled back)
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self.evictions += evicted
+
+    def put(self, model, encoding_format, text, embedding):
+        self.put_many(model, encoding_format, {text: embedding})
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                'size': size,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
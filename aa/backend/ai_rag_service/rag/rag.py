@@ -1,50 +1,207 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from supabase import Client
-from openai import OpenAI
+from openai import OpenAI, BadRequestError
+
+from rag.embedding_cache import EmbeddingCache
+
+# Answers embedded per embeddings.create call (the API accepts up to 2048 inputs)
+RAG_EMBEDDING_BATCH_SIZE = int(os.getenv("RAG_EMBEDDING_BATCH_SIZE", "100"))
+# Embedding calls in flight at once
+RAG_EMBEDDING_CONCURRENCY = int(os.getenv("RAG_EMBEDDING_CONCURRENCY", "4"))
+# Rows per multi-row insert into answer-rag
+RAG_INSERT_BATCH_SIZE = int(os.getenv("RAG_INSERT_BATCH_SIZE", "500"))
+
+
+def _chunks(items, size):
+    size = max(1, size)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 
 class Rag:
-    def __init__(self, supabase_client: Client, openai_client: OpenAI, openai_embedding_model: str, openai_encoding_format: str):
+    def __init__(self, supabase_client: Client, openai_client: OpenAI, openai_embedding_model: str, openai_encoding_format: str,
+                 embedding_batch_size: int = RAG_EMBEDDING_BATCH_SIZE, embedding_concurrency: int = RAG_EMBEDDING_CONCURRENCY,
+                 insert_batch_size: int = RAG_INSERT_BATCH_SIZE, embedding_cache: EmbeddingCache = None):
         self.supabase_client = supabase_client
         self.openai_client = openai_client
         self.openai_embedding_model = openai_embedding_model
         self.openai_encoding_format = openai_encoding_format
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_concurrency = embedding_concurrency
+        self.insert_batch_size = insert_batch_size
+        self.embedding_cache = embedding_cache
+
+    def _embed(self, texts):
+        """One embeddings.create call; vectors come back in input order"""
+        response = self.openai_client.embeddings.create(
+            input=texts, model=self.openai_embedding_model, encoding_format=self.openai_encoding_format
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def _embed_batch(self, texts):
+        """
+        Embed a batch of texts, narrowing down rejected inputs
+
+        A request the API rejects (e.g. one answer over the token limit) is split
+        in half and retried, so only the offending texts fail. Other errors
+        (network, auth, rate limits after the client's own retries) fail the batch.
+
+        Returns:
+            tuple: ({text: embedding}, {text: error})
+        """
+        try:
+            vectors = self._embed(texts)
+        except BadRequestError as e:
+            if len(texts) == 1:
+                return {}, {texts[0]: str(e)}
+            middle = len(texts) // 2
+            embedded, failed = self._embed_batch(texts[:middle])
+            more_embedded, more_failed = self._embed_batch(texts[middle:])
+            return dict(embedded, **more_embedded), dict(failed, **more_failed)
+        except Exception as e:
+            return {}, {text: str(e) for text in texts}
+        return dict(zip(texts, vectors)), {}
+
+    def embed_texts(self, texts):
+        """
+        Embeddings for many texts: cached ones first, the rest in concurrent batches
+
+        Each distinct text is embedded at most once, and new embeddings are
+        added to the cache.
+
+        Returns:
+            tuple: ({text: embedding}, {text: error}, number of distinct texts served from the cache)
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        embedded = {}
+        if self.embedding_cache:
+            embedded = self.embedding_cache.get_many(self.openai_embedding_model, self.openai_encoding_format, unique_texts)
+        cached = len(embedded)
+
+        missing = [text for text in unique_texts if text not in embedded]
+        batches = list(_chunks(missing, self.embedding_batch_size))
+        print(f"Embedding {len(missing)} of {len(unique_texts)} distinct texts in {len(batches)} batches ({cached} cached)")
+
+        failed = {}
+        if batches:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.embedding_concurrency, len(batches)))) as pool:
+                for batch_embedded, batch_failed in pool.map(self._embed_batch, batches):
+                    if self.embedding_cache:
+                        self.embedding_cache.put_many(self.openai_embedding_model, self.openai_encoding_format, batch_embedded)
+                    embedded.update(batch_embedded)
+                    failed.update(batch_failed)
+        return embedded, failed, cached
+
+    def _insert(self, rows):
+        """
+        Multi-row inserts into answer-rag; a rejected chunk is retried row by row
+
+        Returns:
+            tuple: (rows inserted, [(row, error), ...])
+        """
+        inserted = 0
+        failed = []
+        for chunk in _chunks(rows, self.insert_batch_size):
+            try:
+                self.supabase_client.table('answer-rag').insert(chunk).execute()
+                inserted += len(chunk)
+                continue
+            except Exception as e:
+                if len(chunk) == 1:
+                    failed.append((chunk[0], str(e)))
+                    continue
+                print(f"Insert of {len(chunk)} answer-rag rows failed, retrying row by row: {e}")
+            for row in chunk:
+                try:
+                    self.supabase_client.table('answer-rag').insert(row).execute()
+                    inserted += 1
+                except Exception as e:
+                    failed.append((row, str(e)))
+        return inserted, failed
+
+    def embedding_cache_stats(self):
+        return self.embedding_cache.stats() if self.embedding_cache else None
 
     def persist_response_into_vector_store(self, survey_responses: list, questions: list):
+        """
+        Embed every answer of the given responses and store them in answer-rag
+
+        Answers are grouped into batched embedding calls, run a few at a time,
+        and the embedded rows are written with multi-row inserts. Repeated
+        answer texts are embedded once, and cached ones not at all.
+
+        Answers without a response, or whose question_id is not one of the
+        survey's questions, have nothing to embed and are listed as skipped.
+
+        Returns:
+            dict: {'answers': n, 'inserted': n, 'cached': distinct texts served from the cache,
+                   'failed': [{uid, question_id, stage, error}, ...],
+                   'skipped': [{uid, question_id, reason}, ...]}
+        """
+        question_texts = {question['id']: question['question'] for question in questions}
+
+        rows = []
+        skipped = []
         for survey_response in survey_responses:
-            answers = survey_response['answers']
             uid = survey_response['UID_fk']
+            # match answers to their questions by id, so skipped questions don't shift the rest
+            for answer in survey_response.get('answers') or []:
+                question_id = answer.get('question_id')
+                if question_id not in question_texts:
+                    skipped.append({'uid': uid, 'question_id': question_id, 'reason': 'unknown question'})
+                    continue
+                if answer.get('response') is None:
+                    skipped.append({'uid': uid, 'question_id': question_id, 'reason': 'no response'})
+                    continue
+                rows.append({
+                    "survey_id_fk": survey_response['survey_id_fk'],
+                    "uid_fk": uid,
+                    "response": f"{question_texts[question_id]}: {answer['response']}",
+                    "question_id": question_id
+                })
+
+        vectors, embed_failed, cached = self.embed_texts([row['response'] for row in rows])
 
-            # zip answers with the respective questions of the survey
-            zipped_answers = zip(answers, questions)
-            for answer, question in zipped_answers:
-                question_id = question['id']
-                question_text = question['question']
-                response = answer['response']
-                print(f'question_id: {question_id}, question_text: {question_text}, response: {response}')
-
-                formatted_response = f"{question_text}: {response}"
-                response = self.openai_client.embeddings.create(
-                    input=formatted_response, model=self.openai_embedding_model, encoding_format=self.openai_encoding_format
-                )
-
-                embedding = response.data[0].embedding
-
-                self.supabase_client.table('answer-rag').insert(
-                    {
-                        "survey_id_fk": survey_response['survey_id_fk'],
-                        "uid_fk": uid,
-                        "vector": embedding,
-                        "response": formatted_response,
-                        "question_id": question_id
-                    }
-                ).execute()
+        embedded = []
+        failed = []
+        for row in rows:
+            if row['response'] in vectors:
+                row['vector'] = vectors[row['response']]
+                embedded.append(row)
+            else:
+                failed.append((row, 'embedding', embed_failed.get(row['response'], 'not embedded')))
+
+        inserted, insert_failed = self._insert(embedded)
+        failed.extend((row, 'insert', error) for row, error in insert_failed)
+
+        if skipped:
+            print(f"Skipped {len(skipped)} answers with no response or an unknown question")
+        if failed:
+            print(f"Failed to persist {len(failed)} of {len(rows)} answers")
+        return {
+            'answers': len(rows),
+            'inserted': inserted,
+            'cached': cached,
+            'failed': [
+                {'uid': row['uid_fk'], 'question_id': row['question_id'], 'stage': stage, 'error': error}
+                for row, stage, error in failed
+            ],
+            'skipped': skipped
+        }
 
     def query_vector_store(self, query_text: str, user_id: str):
-        response = self.openai_client.embeddings.create(
-            input=query_text,
-            model=self.openai_embedding_model,
-            encoding_format=self.openai_encoding_format
-        )
-        embedding = response.data[0].embedding
+        embedding = self.embedding_cache.get(self.openai_embedding_model, self.openai_encoding_format, query_text) if self.embedding_cache else None
+        if embedding is None:
+            response = self.openai_client.embeddings.create(
+                input=query_text,
+                model=self.openai_embedding_model,
+                encoding_format=self.openai_encoding_format
+            )
+            embedding = response.data[0].embedding
+            if self.embedding_cache:
+                self.embedding_cache.put(self.openai_embedding_model, self.openai_encoding_format, query_text, embedding)
 
         response = self.supabase_client.rpc('cosine_similarity_search_with_user',
             {
@@ -55,4 +212,3 @@ class Rag:
         ).execute()
 
         return response.data
-        
\ No newline at end of file
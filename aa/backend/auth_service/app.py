@@ -1,12 +1,15 @@
 import os
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from supabase import create_client
+from shared.clients import get_supabase_client
+from shared.auth import verify_token
 from dotenv import load_dotenv
 import jwt
 from datetime import datetime, timezone, timedelta
 import traceback
 
+from token_blacklist import TokenBlacklistReplica, parse_timestamp
+
 # Load environment variables
 load_dotenv()
 
@@ -25,7 +28,11 @@ jwt_secret_key = os.getenv("JWT_SECRET_KEY")
 if not supabase_url or not supabase_key or not jwt_secret_key:
     raise ValueError("Missing Supabase credentials or JWT Secret Key")
 
-supabase = create_client(supabase_url, supabase_key)
+supabase = get_supabase_client(supabase_url, supabase_key)
+
+# In-process copy of token_blacklist so /verify needs no database round-trip
+token_blacklist = TokenBlacklistReplica(supabase)
+token_blacklist.start()
 
 # Helper function
 def generate_jwt(user_id: str):
@@ -43,9 +50,8 @@ def generate_jwt(user_id: str):
 
 def decode(token):
     try:
-        # ✅ Verify token signature and decode
-        decoded_token = jwt.decode(token, jwt_secret_key, algorithms=["HS256"])
-        user_id = decoded_token.get("sub")
+        # ✅ Verify token signature and decode (cached until the token expires)
+        user_id = verify_token(token, jwt_secret_key)
         
         if not user_id:
             return jsonify({
@@ -211,6 +217,7 @@ def reset_password():
             },
             on_conflict="user_id"  # This is the key line - specify which column is unique
         ).execute()
+        token_blacklist.record(user_id, now)
         
         # Generate a new JWT token for the user
         jwt_token = generate_jwt(user_id)
@@ -262,6 +269,7 @@ def logout():
             },
             on_conflict="user_id"  # This is the key line - specify which column is unique
         ).execute()
+        token_blacklist.record(user_id, now)
         
         return jsonify({
             "message": "Logout is successful",
@@ -271,28 +279,42 @@ def logout():
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/verify', methods=['POST'])
-def verify_jwt():
-    # 🔐 Get token from Authorization header
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({
-            'success': False,
-            'error': 'Authorization token missing or malformed'
-        }), 401
-    
-    token = auth_header.split(" ")[1]
-    
+# Upper bound on tokens per /verify/batch call, keeps the bulk revocation query URL short
+VERIFY_BATCH_MAX = int(os.getenv("VERIFY_BATCH_MAX", "200"))
+
+def _get_valid_after_bulk(user_ids):
+    """Revocation times for several users: from the replica, or with one Supabase query
+    if the replica has not loaded yet. Users without a blacklist entry are omitted."""
+    user_ids = list(dict.fromkeys(user_ids))
+    if token_blacklist.loaded:
+        valid_after = {}
+        for user_id in user_ids:
+            entry = token_blacklist.get_valid_after(user_id)
+            if entry is not None:
+                valid_after[user_id] = entry
+        return valid_after
+
+    if not user_ids:
+        return {}
+    result = supabase.table("token_blacklist").select("user_id,valid_after").in_("user_id", user_ids).execute()
+    return {row["user_id"]: parse_timestamp(row["valid_after"]) for row in (result.data or [])}
+
+def _get_valid_after(user_id):
+    """Revocation time for user_id, or None when the user has no blacklist entry"""
+    return _get_valid_after_bulk([user_id]).get(user_id)
+
+def _decode_token(token):
+    """Verify the token signature and expiration once and read user_id and issue time.
+    Returns (user_id, token_issue_time, None) or (None, None, (error_body, status))."""
     if not token:
-        return jsonify({"error": "Token is required"}), 400
-        
+        return None, None, ({"error": "Token is required"}, 400)
+
     try:
-        # First decode the token without verification to get user_id and issue time
-        unverified_payload = jwt.decode(token, options={"verify_signature": False})
-        user_id = unverified_payload.get("sub")
+        payload = jwt.decode(token, jwt_secret_key, algorithms=["HS256"])
+        user_id = payload.get("sub")
         
         # More robust handling of the issued-at time
-        iat = unverified_payload.get("iat", 0)
+        iat = payload.get("iat", 0)
         try:
             token_issue_time = datetime.fromtimestamp(iat, tz=timezone.utc)
         except (ValueError, TypeError) as e:
@@ -300,55 +322,96 @@ def verify_jwt():
             token_issue_time = datetime.fromtimestamp(0, tz=timezone.utc)  # Fallback
             
         if not user_id:
-            return jsonify({"error": "Invalid token format"}), 401
-            
-        print(f"Checking token for user: {user_id}, issued at: {token_issue_time}")
-        
-        # Check if there's a blacklist entry for this user
-        try:
-            result = supabase.table("token_blacklist").select("valid_after").eq("user_id", user_id).execute()
-            print(f"Blacklist result: {result.data}")
-            
-            # If user has a blacklist entry, check if token was issued before valid_after time
-            if result.data and len(result.data) > 0:
-                valid_after_str = result.data[0]["valid_after"]
-                print(f"Valid after string: {valid_after_str}")
-                
-                # Use Approach 1 which worked, but add timezone information
-                valid_after = datetime.fromisoformat(valid_after_str.replace('Z', '+00:00'))
-                # Ensure timezone awareness
-                if valid_after.tzinfo is None:
-                    valid_after = valid_after.replace(tzinfo=timezone.utc)
-                    
-                print(f"Comparing: token issued {token_issue_time} vs valid after {valid_after}")
-                
-                # If token was issued before valid_after, it's invalid
-                if token_issue_time < valid_after:
-                    return jsonify({"error": "Token has been invalidated"}), 401
-                    
-        except Exception as e:
-            print(f"Error during blacklist check: {str(e)}")
-            traceback.print_exc()
-            # Continue with validation even if blacklist check fails
-            
-        # Now verify the token signature and expiration
-        decoded_token = jwt.decode(token, jwt_secret_key, algorithms=["HS256"])
-        
-        # Token is valid
-        return jsonify({"message": "Token is valid", "id": user_id})
+            return None, None, ({"error": "Invalid token format"}, 401)
+
+        return user_id, token_issue_time, None
         
     except jwt.ExpiredSignatureError:
-        return jsonify({"error": "Token has expired"}), 401
+        return None, None, ({"error": "Token has expired"}, 401)
     except jwt.InvalidTokenError:
-        return jsonify({"error": "Invalid token"}), 401
+        return None, None, ({"error": "Invalid token"}, 401)
     except Exception as e:
         print(f"Unexpected error in verify_jwt: {str(e)}")
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return None, None, ({"error": str(e)}, 500)
+
+def _check_revocation(user_id, token_issue_time, lookup_valid_after):
+    """Returns an (error_body, status) if the token was issued before the user's
+    valid_after time, otherwise None. Blacklist lookup failures do not reject the token."""
+    try:
+        valid_after = lookup_valid_after(user_id)
+        
+        # If token was issued before valid_after, it's invalid
+        if valid_after is not None and token_issue_time < valid_after:
+            return {"error": "Token has been invalidated"}, 401
+                
+    except Exception as e:
+        print(f"Error during blacklist check: {str(e)}")
+        traceback.print_exc()
+        # Continue with validation even if blacklist check fails
+    return None
+
+@app.route('/verify', methods=['POST'])
+def verify_jwt():
+    # 🔐 Get token from Authorization header
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return jsonify({
+            'success': False,
+            'error': 'Authorization token missing or malformed'
+        }), 401
+    
+    token = auth_header.split(" ")[1]
+
+    user_id, token_issue_time, error = _decode_token(token)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    error = _check_revocation(user_id, token_issue_time, _get_valid_after)
+    if error:
+        return jsonify(error[0]), error[1]
+    
+    # Token is valid
+    return jsonify({"message": "Token is valid", "id": user_id})
+
+@app.route('/verify/batch', methods=['POST'])
+def verify_jwt_batch():
+    """Verify many tokens at once with the same rules as /verify.
+    Body: {"tokens": [...]}. Results are returned in request order, each carrying the
+    status code and body /verify would have returned for that token."""
+    data = request.get_json(silent=True) or {}
+    tokens = data.get("tokens")
+
+    if not isinstance(tokens, list):
+        return jsonify({'success': False, 'error': 'tokens must be a list'}), 400
+    if len(tokens) > VERIFY_BATCH_MAX:
+        return jsonify({'success': False, 'error': f'At most {VERIFY_BATCH_MAX} tokens per batch'}), 400
+
+    decoded = [_decode_token(token if isinstance(token, str) else None) for token in tokens]
+
+    # One revocation lookup for every distinct user in the batch
+    try:
+        valid_after = _get_valid_after_bulk([user_id for user_id, _, error in decoded if not error])
+        lookup_valid_after = valid_after.get
+    except Exception as e:
+        print(f"Error during blacklist check: {str(e)}")
+        traceback.print_exc()
+        lookup_valid_after = lambda user_id: None
+
+    results = []
+    for user_id, token_issue_time, error in decoded:
+        if not error:
+            error = _check_revocation(user_id, token_issue_time, lookup_valid_after)
+        if error:
+            results.append({**error[0], "valid": False, "status": error[1]})
+        else:
+            results.append({"message": "Token is valid", "id": user_id, "valid": True, "status": 200})
+
+    return jsonify({'success': True, 'results': results})
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "service": "authentication"})
+    return jsonify({"status": "healthy", "service": "authentication", "token_blacklist": token_blacklist.stats()})
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', debug=True, port=5005)
\ No newline at end of file
@@ -0,0 +1,155 @@
+# token_blacklist.py
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timezone, timedelta
+
+# How often other replicas' logouts/password resets are picked up (delta refresh)
+REFRESH_INTERVAL = float(os.getenv("TOKEN_BLACKLIST_REFRESH_SECONDS", "5"))
+# How often the whole table is reloaded, which also drops rows deleted elsewhere
+FULL_RELOAD_INTERVAL = float(os.getenv("TOKEN_BLACKLIST_FULL_RELOAD_SECONDS", "600"))
+# Delta queries look back this far past the high-water mark to tolerate clock skew
+# between replicas writing valid_after
+SKEW_MARGIN = timedelta(seconds=float(os.getenv("TOKEN_BLACKLIST_SKEW_SECONDS", "30")))
+PAGE_SIZE = 1000
+
+
+def parse_timestamp(value):
+    """Parse a valid_after value from Supabase into an aware UTC datetime"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+class TokenBlacklistReplica:
+    """
+    In-process copy of the token_blacklist table (user_id -> valid_after).
+
+    Loaded in full at startup, updated immediately by this process's own logouts
+    and password resets, and kept in sync with other replicas by a background
+    thread that pulls rows newer than the last seen valid_after.
+    """
+
+    def __init__(self, supabase, refresh_interval=REFRESH_INTERVAL, full_reload_interval=FULL_RELOAD_INTERVAL):
+        self.supabase = supabase
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._high_water = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.loaded = False
+        self.last_full_load = None
+        self.last_refresh = None
+        self.refresh_errors = 0
+
+    def _fetch(self, since=None):
+        """Page through token_blacklist, optionally only rows with valid_after >= since"""
+        rows = []
+        offset = 0
+        while True:
+            query = self.supabase.table("token_blacklist").select("user_id,valid_after")
+            if since is not None:
+                query = query.gte("valid_after", since.isoformat())
+            page = query.order("valid_after").range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
+
+    def _apply(self, rows, entries):
+        """Merge rows into `entries`, keeping the latest valid_after per user. Caller holds the lock."""
+        for row in rows:
+            valid_after = parse_timestamp(row["valid_after"])
+            current = entries.get(row["user_id"])
+            if current is None or valid_after > current:
+                entries[row["user_id"]] = valid_after
+            if self._high_water is None or valid_after > self._high_water:
+                self._high_water = valid_after
+
+    def load(self):
+        """Replace the replica with a full copy of the table"""
+        started = datetime.now(timezone.utc)
+        rows = self._fetch()
+        with self._lock:
+            previous = self._entries
+            self._high_water = None
+            entries = {}
+            self._apply(rows, entries)
+            # Keep revocations recorded locally while the snapshot was being read
+            for user_id, valid_after in previous.items():
+                current = entries.get(user_id)
+                if valid_after >= started - SKEW_MARGIN and (current is None or valid_after > current):
+                    entries[user_id] = valid_after
+            self._entries = entries
+        self.loaded = True
+        self.last_full_load = time.time()
+        print(f"Token blacklist replica loaded with {len(rows)} entries")
+
+    def refresh(self):
+        """Pull entries written since the high-water mark (by any replica)"""
+        with self._lock:
+            since = self._high_water
+        if since is None:
+            return self.load()
+        rows = self._fetch(since - SKEW_MARGIN)
+        with self._lock:
+            self._apply(rows, self._entries)
+        self.last_refresh = time.time()
+
+    def record(self, user_id, valid_after):
+        """Apply a logout/password reset made by this process without waiting for a refresh"""
+        if isinstance(valid_after, str):
+            valid_after = parse_timestamp(valid_after)
+        elif valid_after.tzinfo is None:
+            valid_after = valid_after.replace(tzinfo=timezone.utc)
+        with self._lock:
+            current = self._entries.get(user_id)
+            if current is None or valid_after > current:
+                self._entries[user_id] = valid_after
+
+    def get_valid_after(self, user_id):
+        """Tokens for user_id issued before the returned time are revoked (None if no entry)"""
+        with self._lock:
+            return self._entries.get(user_id)
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                if not self.loaded or time.time() - (self.last_full_load or 0) >= self.full_reload_interval:
+                    self.load()
+                else:
+                    self.refresh()
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"Token blacklist refresh failed: {str(e)}")
+                traceback.print_exc()
+
+    def start(self):
+        """Load the table and start the background refresh thread"""
+        try:
+            self.load()
+        except Exception as e:
+            # /verify falls back to querying Supabase until a background load succeeds
+            print(f"Initial token blacklist load failed: {str(e)}")
+        self._thread = threading.Thread(target=self._run, name="token-blacklist-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+            high_water = self._high_water
+        return {
+            "loaded": self.loaded,
+            "entries": size,
+            "high_water": high_water.isoformat() if high_water else None,
+            "last_full_load": self.last_full_load,
+            "last_refresh": self.last_refresh,
+            "refresh_errors": self.refresh_errors,
+        }
@@ -2,7 +2,8 @@ import os
 from flask import Flask, request, jsonify, redirect
 from flask_cors import CORS
 from datetime import datetime, timezone
-from supabase import create_client
+from shared.clients import get_supabase_client
+from shared.auth import verify_token
 from dotenv import load_dotenv
 import stripe
 import jwt
@@ -44,14 +45,13 @@ DOMAIN_NAME = "http://localhost:3000"
 if not supabase_url or not supabase_key:
     raise ValueError("Missing Supabase credentials")
 
-supabase = create_client(supabase_url, supabase_key)
+supabase = get_supabase_client(supabase_url, supabase_key)
 
 #Helper Functions
 def decode(token):
     try:
-        # ✅ Verify token signature and decode
-        decoded_token = jwt.decode(token, jwt_secret_key, algorithms=["HS256"])
-        user_id = decoded_token.get("sub")
+        # ✅ Verify token signature and decode (cached until the token expires)
+        user_id = verify_token(token, jwt_secret_key)
         
         if not user_id:
             return jsonify({
@@ -1,7 +1,9 @@
 import os
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from supabase import create_client
+from shared.clients import get_supabase_client
+from shared.auth import verify_token
+from shared.db import Database
 from dotenv import load_dotenv
 import jwt
 from datetime import datetime, timezone, timedelta
@@ -26,13 +28,13 @@ jwt_secret_key = os.getenv("JWT_SECRET_KEY")
 if not supabase_url or not supabase_key or not jwt_secret_key:
     raise ValueError("Missing Supabase credentials or JWT Secret Key")
 
-supabase = create_client(supabase_url, supabase_key)
+supabase = get_supabase_client(supabase_url, supabase_key)
+db = Database() # Survey reads go through the version-checked survey cache
 
 def decode(token):
     try:
-        # ✅ Verify token signature and decode
-        decoded_token = jwt.decode(token, jwt_secret_key, algorithms=["HS256"])
-        user_id = decoded_token.get("sub")
+        # ✅ Verify token signature and decode (cached until the token expires)
+        user_id = verify_token(token, jwt_secret_key)
         
         if not user_id:
             return jsonify({
@@ -86,8 +88,8 @@ def recsys():
         survey_id = request_data["survey_id"]
 
         # First check if survey exists
-        survey_response = supabase.table('surveys').select("*").eq('survey_id', survey_id).execute()
-        if not survey_response.data:
+        survey = db.get_survey_by_id(survey_id)
+        if not survey:
             return jsonify({
                 'success': False,
                 'error': f"Survey with id {survey_id} not found."
@@ -96,7 +98,7 @@ def recsys():
         # INCLUDE RECSYS SYSTEM HERE, for now skip this to recommend to x amount of users
         
         # Retrieve num of users to propagate the survey to, change default to 0 once in production
-        num_users = survey_response.data[0].get("num_users", 50) 
+        num_users = survey.get("num_users", 50) 
 
         # Call the function to get random users
         user_response = supabase.rpc('get_random_users', {'num': num_users}).execute()
@@ -0,0 +1,274 @@
+# aggregates.py
+"""
+Per-question result counters for surveys.
+
+Usage:
+    python aggregates.py rebuild [--survey-id SURVEY_ID]
+"""
+import os
+import argparse
+import threading
+import traceback
+from collections import Counter
+
+from shared.conditional_logic import question_ids
+from export import iter_pages
+
+# supabase keeps counters in the response_aggregates table (sql/response_aggregates.sql),
+# shared by every replica; memory is for local runs and tests
+RESPONSE_AGGREGATES_STORE = os.getenv("RESPONSE_AGGREGATES_STORE", "supabase")
+
+# Counter for the number of responses to a survey
+SURVEY_TOTAL = ('_survey', 'responses')
+# Per-question bucket counting answered (non-empty) responses
+ANSWERED_BUCKET = '_answered'
+# Question types whose answers are tallied by value
+COUNTED_TYPES = ('SINGLE_CHOICE', 'MULTIPLE_CHOICE', 'RATING', 'YES_NO')
+
+
+def _bucket_values(question, response):
+    """The value buckets one answer falls into, as strings"""
+    question_type = question.get('type')
+    if question_type == 'MULTIPLE_CHOICE':
+        values = response if isinstance(response, list) else [response]
+        return {value for value in values if isinstance(value, str)}
+    if question_type == 'SINGLE_CHOICE':
+        return {response} if isinstance(response, str) else set()
+    if question_type == 'YES_NO':
+        if isinstance(response, bool):
+            return {'yes' if response else 'no'}
+        return {response.strip().lower()} if isinstance(response, str) else set()
+    if question_type == 'RATING':
+        try:
+            rating = float(response)
+        except (TypeError, ValueError):
+            return set()
+        return {str(int(rating)) if rating.is_integer() else str(rating)}
+    return set()
+
+
+def count_answers(questions, answers):
+    """
+    Counters contributed by one response
+
+    Args:
+        questions (list): The survey's question definitions
+        answers (list): [{question_id, response}, ...]
+
+    Returns:
+        Counter: (question_id, bucket) -> 1, including the survey total
+    """
+    questions = [question for question in questions or [] if isinstance(question, dict)]
+    by_id = dict(zip(question_ids(questions), questions))
+    counts = Counter({SURVEY_TOTAL: 1})
+    for answer in answers or []:
+        if not isinstance(answer, dict):
+            continue
+        question_id = answer.get('question_id')
+        question = by_id.get(question_id)
+        response = answer.get('response')
+        if question is None or response in (None, '', []):
+            continue
+        counts[(question_id, ANSWERED_BUCKET)] = 1
+        for value in _bucket_values(question, response):
+            counts[(question_id, value)] = 1
+    return counts
+
+
+def answer_deltas(questions, old_answers, new_answers):
+    """
+    Counter changes for a response going from old_answers to new_answers
+
+    Either side may be None for a response being created or deleted.
+
+    Returns:
+        list: [{question_id, bucket, delta}, ...] for the counters that change
+    """
+    deltas = Counter()
+    if new_answers is not None:
+        deltas.update(count_answers(questions, new_answers))
+    if old_answers is not None:
+        deltas.subtract(count_answers(questions, old_answers))
+    return [
+        {'question_id': question_id, 'bucket': bucket, 'delta': delta}
+        for (question_id, bucket), delta in deltas.items() if delta
+    ]
+
+
+class InMemoryAggregateStore:
+    """Counters held in process memory (per replica, lost on restart)"""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def apply(self, survey_id, deltas):
+        with self._lock:
+            counts = self._counts.setdefault(survey_id, Counter())
+            for delta in deltas:
+                counts[(delta['question_id'], delta['bucket'])] += delta['delta']
+
+    def replace(self, survey_id, counts):
+        with self._lock:
+            self._counts[survey_id] = Counter(counts)
+
+    def rows(self, survey_id):
+        with self._lock:
+            counts = self._counts.get(survey_id, {})
+            return [{'question_id': q, 'bucket': b, 'count': n} for (q, b), n in counts.items()]
+
+
+class SupabaseAggregateStore:
+    """Counters in the response_aggregates table, changed atomically by RPC"""
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def apply(self, survey_id, deltas):
+        self.supabase.rpc('apply_response_aggregates', {'p_survey_id': survey_id, 'p_deltas': deltas}).execute()
+
+    def replace(self, survey_id, counts):
+        rows = [{'question_id': q, 'bucket': b, 'count': n} for (q, b), n in counts.items() if n]
+        self.supabase.rpc('replace_response_aggregates', {'p_survey_id': survey_id, 'p_counts': rows}).execute()
+
+    def rows(self, survey_id):
+        response = self.supabase.table('response_aggregates').select('question_id,bucket,count').eq('survey_id', survey_id).execute()
+        return response.data or []
+
+
+def make_aggregate_store(supabase, kind=RESPONSE_AGGREGATES_STORE):
+    if kind == 'memory':
+        return InMemoryAggregateStore()
+    if kind == 'supabase':
+        return SupabaseAggregateStore(supabase)
+    raise ValueError(f"Unknown aggregate store: {kind}")
+
+
+class ResponseAggregates:
+    """
+    Keeps per-survey, per-question counters in step with saved responses.
+
+    Every create, save and delete applies the difference between the old and
+    new answers, so a summary is read from O(questions) counter rows instead of
+    from the responses. Counter updates never fail the request that triggered
+    them; if one is lost (or two saves of the same response race), rebuild()
+    recounts the survey from its responses.
+    """
+
+    def __init__(self, supabase, db, store=None):
+        self.supabase = supabase
+        self.db = db
+        self.store = store or make_aggregate_store(supabase)
+        self.failures = 0
+
+    def _questions(self, survey_id):
+        survey = self.db.get_survey_by_id(survey_id)
+        return (survey or {}).get('questions') or []
+
+    def record(self, survey_id, old_answers, new_answers):
+        """Apply the change from old_answers to new_answers (None for a created/deleted response)"""
+        try:
+            deltas = answer_deltas(self._questions(survey_id), old_answers, new_answers)
+            if deltas:
+                self.store.apply(survey_id, deltas)
+        except Exception as e:
+            self.failures += 1
+            print(f"Failed to update aggregates for survey {survey_id}: {type(e).__name__} - {e}")
+
+    def summary(self, survey_id):
+        """
+        Results for a survey in question order
+
+        Returns:
+            dict: responses total and, per question, answered count and value counts
+                  (every option / rating point / yes-no listed, including zeros)
+        """
+        survey = self.db.get_survey_by_id(survey_id) or {}
+        counts = {}
+        for row in self.store.rows(survey_id):
+            counts.setdefault(row['question_id'], {})[row['bucket']] = row['count']
+
+        questions = []
+        survey_questions = [question for question in survey.get('questions') or [] if isinstance(question, dict)]
+        for question_id, question in zip(question_ids(survey_questions), survey_questions):
+            question_counts = dict(counts.get(question_id, {}))
+            entry = {
+                'question_id': question_id,
+                'question': question.get('question'),
+                'type': question.get('type'),
+                'answered': question_counts.pop(ANSWERED_BUCKET, 0),
+            }
+            if question.get('type') in COUNTED_TYPES:
+                if question.get('type') == 'YES_NO':
+                    buckets = ['yes', 'no']
+                elif question.get('type') == 'RATING':
+                    scale = question.get('scale')
+                    buckets = [str(point) for point in range(1, scale + 1)] if isinstance(scale, int) else []
+                else:
+                    buckets = [option for option in question.get('options') or [] if isinstance(option, str)]
+                value_counts = {bucket: question_counts.pop(bucket, 0) for bucket in buckets}
+                # Values no longer offered (e.g. options removed by an edit) are kept at the end
+                value_counts.update(sorted(question_counts.items()))
+                entry['counts'] = value_counts
+            questions.append(entry)
+
+        return {
+            'survey_id': survey_id,
+            'version': survey.get('version'),
+            'responses': counts.get(SURVEY_TOTAL[0], {}).get(SURVEY_TOTAL[1], 0),
+            'questions': questions,
+        }
+
+    def rebuild(self, survey_id=None):
+        """
+        Recount counters from the responses table, for one survey or all of them
+
+        Responses are read in keyset pages, so memory holds one page plus one
+        survey's counters. Writes made while a survey is being recounted can be
+        missed, so run it when the survey is quiet.
+
+        Returns:
+            dict: survey_id -> number of responses counted
+        """
+        rebuilt = {}
+        current, questions, counts = None, None, Counter()
+        for page in iter_pages(self.supabase, survey_id):
+            for row in page:
+                if row['survey_id_fk'] != current:
+                    if current is not None:
+                        self.store.replace(current, counts)
+                        rebuilt[current] = counts[SURVEY_TOTAL]
+                    current, counts = row['survey_id_fk'], Counter()
+                    questions = self._questions(current)
+                counts.update(count_answers(questions, row.get('answers')))
+        if current is not None:
+            self.store.replace(current, counts)
+            rebuilt[current] = counts[SURVEY_TOTAL]
+        elif survey_id:
+            # No responses left: clear whatever counters the survey had
+            self.store.replace(survey_id, counts)
+            rebuilt[survey_id] = 0
+        return rebuilt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--survey-id', help="Only rebuild this survey's counters")
+    args = parser.parse_args()
+
+    from shared.db import Database
+    db = Database()
+    aggregates = ResponseAggregates(db.supabase, db)
+    try:
+        rebuilt = aggregates.rebuild(args.survey_id)
+    except Exception:
+        traceback.print_exc()
+        raise SystemExit(1)
+    for survey_id, responses in rebuilt.items():
+        print(f"Rebuilt aggregates for survey {survey_id}: {responses} responses")
+    print(f"Rebuilt {len(rebuilt)} surveys")
+
+
+if __name__ == '__main__':
+    main()
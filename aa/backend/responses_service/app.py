@@ -1,27 +1,58 @@
 # Responses service
 import os
+import atexit
 import uuid
 import traceback
 import jwt
 from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from supabase import create_client
+from shared.clients import get_supabase_client
+from shared.auth import verify_token, token_cache, require_service_token
+from shared.db import Database
+from shared.conditional_logic import compile_survey, ConditionalLogicError, compiled_survey_cache
 from dotenv import load_dotenv
 from postgrest.exceptions import APIError
 
+from aggregates import ResponseAggregates
+from ingest import RESPONSE_WRITE_MODE, WriteBehindIngestor
+from patches import RESPONSE_PATCH_MAX_ATTEMPTS, PatchError, answers_version, merge_answers
+from submissions import RESPONSE_SUBMITTED_FILTER, IdempotencyStore, SubmittedFilter
+from columnar import COLUMNAR_FORMATS, COLUMNAR_MIMETYPES, columnar_available, stream_columnar, survey_pages
+from export import EXPORT_FORMATS, MIMETYPES, CursorError, decode_cursor, encode_cursor, fetch_page, iter_pages, page_size_arg, render
+
 # --- Constants and Setup ---
 load_dotenv()
 app = Flask(__name__)
-CORS(app, resources={r"/*": { "origins": "*", "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]}})
+CORS(app, resources={r"/*": { "origins": "*", "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"]}})
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 if not supabase_url or not supabase_key or not JWT_SECRET_KEY:
     raise ValueError("Missing Supabase credentials or JWT Secret Key")
-supabase = create_client(supabase_url, supabase_key)
+supabase = get_supabase_client(supabase_url, supabase_key)
 print("Supabase initialized successfully for Responses Service!")
 STATIC_GUEST_UID = "00000000-0000-0000-0000-000000000000"
+db = Database() # Cached survey reads for answer validation
+# Check answers against the survey's questions and conditional logic before saving
+RESPONSE_FLOW_VALIDATION = os.getenv("RESPONSE_FLOW_VALIDATION", "1") == "1"
+aggregates = ResponseAggregates(supabase, db) # Per-question result counters
+idempotency = IdempotencyStore() # Replays results of POSTs retried with an Idempotency-Key
+submitted = None
+if RESPONSE_SUBMITTED_FILTER:
+    # Known (survey_id, UID) pairs, so repeat submissions get 409 without a database round trip
+    submitted = SubmittedFilter(supabase)
+    submitted.start()
+ingestor = None
+if RESPONSE_WRITE_MODE == 'write_behind':
+    # Submissions are queued locally and inserted in batches by a background thread;
+    # a pair neither the queue nor the submitted filter knows is claimed in the database
+    # (sql/response_claims.sql) before it is acknowledged, so duplicates still get 409
+    ingestor = WriteBehindIngestor(supabase, on_inserted=lambda row: aggregates.record(row['survey_id_fk'], None, row['answers']), submitted=submitted)
+    ingestor.start()
+    atexit.register(ingestor.stop)
+elif RESPONSE_WRITE_MODE != 'sync':
+    raise ValueError(f"Unknown RESPONSE_WRITE_MODE: {RESPONSE_WRITE_MODE}")
 
 # --- Helper Functions ---
 def is_valid_uuid(uuid_to_test, version=4):
@@ -45,8 +76,7 @@ def _verify_and_get_uid_from_token(token):
     if not JWT_SECRET_KEY: return None, ("Server authentication configuration error", 500)
 
     try:
-        decoded_token = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"]) # Use your algorithm
-        user_id = decoded_token.get("sub")
+        user_id = verify_token(token, JWT_SECRET_KEY) # Cached until the token expires
 
         if not user_id:
             return None, ('Invalid token format (missing sub)', 401)
@@ -66,16 +96,106 @@ def _verify_and_get_uid_from_token(token):
         return None, ("Internal error during token verification", 500)
 
 
+def _validate_answers(survey_id, answers):
+    """
+    Checks answers against the survey flow and question settings.
+    Returns (answers to save, dropped answer messages, None), or (None, None, (error, status, details)).
+    """
+    if not RESPONSE_FLOW_VALIDATION: return answers, [], None
+    survey = db.get_survey_by_id(survey_id)
+    if not survey: return None, None, ('Survey not found', 404, None)
+    try:
+        compiled = compile_survey(survey) # Compiled once per survey version, then cached
+    except ConditionalLogicError as e:
+        # Surveys saved before rules were validated should still accept responses
+        print(f"Survey {survey_id} has invalid conditional logic, skipping flow validation: {e}")
+        return answers, [], None
+    kept, dropped, errors = compiled.clean_answers(answers)
+    if errors: return None, None, ('Answers do not match the survey', 400, errors)
+    if dropped: print(f"Dropped answers for survey {survey_id}: {dropped}")
+    return kept, dropped, None
+
+def _invalid_answers_response(validation_error):
+    error, status, details = validation_error
+    body = {'success': False, 'error': error}
+    if details: body['details'] = details
+    return jsonify(body), status
+
+
+def _list_responses(survey_id=None):
+    """
+    Responses in key order, either one page at a time or streamed in full.
+
+    ?limit=N[&cursor=...] returns one page plus next_cursor. Without them every
+    row is streamed as it is fetched, page_size rows per database read, in the
+    ?format= json (the usual envelope), ndjson or csv.
+    """
+    export_format = request.args.get('format', 'json')
+    if export_format not in EXPORT_FORMATS: return jsonify({'success': False, 'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        page_size = page_size_arg(request.args.get('limit') or request.args.get('page_size'))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, survey_id) if cursor else None
+    except CursorError as e: return jsonify({'success': False, 'error': str(e)}), 400
+    except ValueError: return jsonify({'success': False, 'error': 'limit and page_size must be integers'}), 400
+
+    try:
+        # The first page is read up front so database errors still get a 500
+        first_page = fetch_page(supabase, survey_id, after, page_size)
+    except Exception as e:
+        print(f"GET responses Error: {type(e).__name__} - {e}")
+        return jsonify({'success': False, 'error': "DB error"}), 500
+
+    if 'limit' in request.args or cursor:
+        next_cursor = encode_cursor(first_page[-1], survey_id) if len(first_page) == page_size else None
+        return jsonify({'success': True, 'data': first_page, 'next_cursor': next_cursor}), 200
+
+    def generate():
+        try:
+            yield from render(iter_pages(supabase, survey_id, after, page_size, first_page=first_page), export_format)
+        except Exception as e:
+            # Headers are already sent; the truncated body is the only signal left
+            print(f"Response export for {survey_id or 'all surveys'} failed mid-stream: {type(e).__name__} - {e}")
+
+    stream = Response(stream_with_context(generate()), status=200, mimetype=MIMETYPES[export_format])
+    if export_format == 'csv':
+        stream.headers['Content-Disposition'] = f"attachment; filename=responses-{survey_id or 'all'}.csv"
+    return stream
+
+
+def _save_new_response(survey_id, uid, answers):
+    """Validates and stores a first submission. Returns a (response, status) tuple."""
+    already_submitted = (jsonify({'success': False, 'error': 'Already submitted'}), 409)
+    if submitted and (survey_id, uid) in submitted: return already_submitted
+
+    # Validate answers against the survey's questions and conditional logic
+    answers, dropped, validation_error = _validate_answers(survey_id, answers)
+    if validation_error: return _invalid_answers_response(validation_error)
+
+    # Insert Response (or queue it in write-behind mode)
+    if ingestor:
+        if not ingestor.submit(survey_id, uid, answers): return already_submitted
+        if submitted: submitted.add(survey_id, uid)
+        return jsonify({ 'success': True, 'data': { 'survey_id': survey_id, 'UID': uid, 'message': 'Response accepted', 'queued': True, 'dropped': dropped }}), 202
+    response_data = { 'survey_id_fk': survey_id, 'UID_fk': uid, 'answers': answers }
+    try:
+        supabase.table('responses').insert(response_data).execute()
+    except APIError as api_error:
+        if api_error.code == '23505':
+            if submitted: submitted.add(survey_id, uid)
+            return already_submitted
+        else: return jsonify({'success': False, 'error': "DB insert error"}), 500
+    if submitted: submitted.add(survey_id, uid)
+    aggregates.record(survey_id, None, answers)
+    return jsonify({ 'success': True, 'data': { 'survey_id': survey_id, 'UID': uid, 'message': 'Response created', 'dropped': dropped }}), 201
+
+
 # --- API Endpoints ---
 
 @app.route('/responses', methods=['GET'])
 def get_all_responses():
     # ... (no changes needed unless GET needs auth) ...
-    try:
-        response = supabase.table("responses").select("*").execute()
-        if hasattr(response, 'error') and response.error: return jsonify({'success': False, 'error': "DB error"}), 500
-        return jsonify({'success': True, 'data': response.data}), 200
-    except Exception: return jsonify({'success': False, 'error': "Server error"}), 500
+    return _list_responses()
 
 @app.route('/responses', methods=['POST'])
 def create_response():
@@ -117,16 +237,18 @@ def create_response():
             else: # Non-blank UID in body WITHOUT valid token -> Reject
                 return jsonify({'success': False, 'error': 'Authentication required for specified UID'}), 401
 
-        # 5. Insert Response
-        response_data = { 'survey_id_fk': survey_id, 'UID_fk': final_uid, 'answers': answers }
+        # 5. Replay a retried request instead of submitting it again
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key: return _save_new_response(survey_id, final_uid, answers)
+        replay = idempotency.begin(final_uid, idempotency_key, data)
+        if replay: return replay
         try:
-            supabase.table('responses').insert(response_data).execute()
-        except APIError as api_error:
-            if api_error.code == '23505': return jsonify({'success': False, 'error': 'Already submitted'}), 409
-            else: return jsonify({'success': False, 'error': "DB insert error"}), 500
-
-        # 6. Success
-        return jsonify({ 'success': True, 'data': { 'survey_id': survey_id, 'UID': final_uid, 'message': 'Response created' }}), 201
+            result = _save_new_response(survey_id, final_uid, answers)
+        except Exception:
+            idempotency.abandon(final_uid, idempotency_key)
+            raise
+        idempotency.finish(final_uid, idempotency_key, data, result)
+        return result
 
     except Exception as e:
         print(f"POST /responses Error: {type(e).__name__} - {e}")
@@ -137,11 +259,7 @@ def create_response():
 def get_responses_by_survey(survey_id):
     # TODO: Add auth?
     if not is_valid_uuid(survey_id): return jsonify({'success': False, 'error': 'Invalid survey ID format'}), 400
-    try:
-        response = supabase.table("responses").select("*").eq("survey_id_fk", survey_id).execute()
-        if hasattr(response, 'error') and response.error: return jsonify({'success': False, 'error': "DB error"}), 500
-        return jsonify({'success': True, 'data': response.data}), 200
-    except Exception: return jsonify({'success': False, 'error': "Server error"}), 500
+    return _list_responses(survey_id)
 
 @app.route('/responses/survey/<survey_id>', methods=['GET'])
 def get_responses_by_survey_and_user(survey_id):
@@ -182,11 +300,63 @@ def save_responses_by_survey_and_user(survey_id):
             'error': str(e)
         }), 500
 
+    # {"patch": [...]} merges changed answers by question_id; {"answers": [...]} replaces them all.
+    # Either may carry base_version (the version returned by the last save) to refuse
+    # overwriting a save made elsewhere in the meantime.
+    patch = request_data.get("patch")
+    base_version = request_data.get("base_version")
+
+    def updated_answers(current):
+        """(new answers, None), or (None, error response) for the saved `current`"""
+        if base_version and base_version != answers_version(current):
+            return None, (jsonify({'success': False, 'error': 'Response was changed by another save', 'version': answers_version(current)}), 409)
+        try:
+            new_answers = merge_answers(current, patch) if patch is not None else answer_data
+        except PatchError as e:
+            return None, (jsonify({'success': False, 'error': str(e)}), 400)
+        new_answers, _, validation_error = _validate_answers(survey_id, new_answers)
+        if validation_error: return None, _invalid_answers_response(validation_error)
+        return new_answers, None
+
     try:
-        response = supabase.table("responses").update({"answers" : answer_data}).eq("survey_id_fk", survey_id).eq("UID_fk", verified_uid).execute()
-        if hasattr(response, 'error') and response.error: return jsonify({'success': False, 'error': "DB error"}), 500
-        return jsonify({'success': True}), 200
-    except Exception: return jsonify({'success': False, 'error': "Server error"}), 500
+        if ingestor:
+            pending = ingestor.update_pending(survey_id, verified_uid, updated_answers)
+            if pending:
+                new_answers, error = pending
+                if error: return error
+                return jsonify({'success': True, 'version': answers_version(new_answers)}), 200
+
+        if patch is None and not base_version:
+            # Unconditional full replace, as before; a body without answers still stores null
+            if answer_data is not None:
+                answer_data, _, validation_error = _validate_answers(survey_id, answer_data)
+                if validation_error: return _invalid_answers_response(validation_error)
+            # One statement swaps the answers and returns the ones it replaced
+            # (sql/response_revision.sql), so concurrent replaces never move the
+            # result counters from the same previous answers twice
+            response = supabase.rpc('replace_response_answers', {'p_survey_id': survey_id, 'p_uid': verified_uid, 'p_answers': answer_data}).execute()
+            if hasattr(response, 'error') and response.error: return jsonify({'success': False, 'error': "DB error"}), 500
+            for replaced in response.data or []: aggregates.record(survey_id, replaced.get('previous_answers') or [], answer_data or [])
+            return jsonify({'success': True, 'version': answers_version(answer_data)}), 200
+
+        # Compare-and-set: the update only matches if the row's revision (bumped by every
+        # update of answers, sql/response_revision.sql) is still the one read
+        for _ in range(RESPONSE_PATCH_MAX_ATTEMPTS):
+            previous = supabase.table("responses").select("answers,revision").eq("survey_id_fk", survey_id).eq("UID_fk", verified_uid).execute()
+            if not previous.data: return jsonify({'success': False, 'error': 'Response not found'}), 404
+            current = previous.data[0].get('answers') or []
+            new_answers, error = updated_answers(current)
+            if error: return error
+            response = supabase.table("responses").update({"answers": new_answers}).eq("survey_id_fk", survey_id).eq("UID_fk", verified_uid).eq("revision", previous.data[0]['revision']).execute()
+            if hasattr(response, 'error') and response.error: return jsonify({'success': False, 'error': "DB error"}), 500
+            if response.data:
+                aggregates.record(survey_id, current, new_answers)
+                return jsonify({'success': True, 'version': answers_version(new_answers)}), 200
+            # Lost the race: re-read and try again (a stale base_version now gets 409)
+        return jsonify({'success': False, 'error': 'Response is being changed by another save, please retry'}), 409
+    except Exception as e:
+        print(f"PUT /responses/survey Error: {type(e).__name__} - {e}")
+        return jsonify({'success': False, 'error': "Server error"}), 500
 
 @app.route('/responses/survey/<survey_id>/user/<uid_in_url>', methods=['DELETE'])
 def delete_specific_response(survey_id, uid_in_url):
@@ -209,15 +379,74 @@ def delete_specific_response(survey_id, uid_in_url):
 
     # Delete
     try:
+        if submitted: submitted.discard(survey_id, verified_uid)
+        if ingestor and ingestor.remove_pending(survey_id, verified_uid): return jsonify({'success': True, 'message': 'Response deleted'}), 200
         delete_response = supabase.table('responses').delete().eq('survey_id_fk', survey_id).eq('UID_fk', verified_uid).execute()
         if hasattr(delete_response, 'error') and delete_response.error: return jsonify({'success': False, 'error': "DB delete error"}), 500
+        for deleted in delete_response.data or []: aggregates.record(survey_id, deleted.get('answers'), None)
         return jsonify({'success': True, 'message': 'Response deleted'}), 200
     except Exception: return jsonify({'success': False, 'error': "Server error"}), 500
 
 
+@app.route('/responses/survey/<survey_id>/export', methods=['GET'])
+def export_survey_responses(survey_id):
+    """A survey's responses with one typed column per question, as ?format=parquet (default) or arrow"""
+    if not is_valid_uuid(survey_id): return jsonify({'success': False, 'error': 'Invalid survey ID format'}), 400
+    if not columnar_available(): return jsonify({'success': False, 'error': 'Columnar export requires pyarrow'}), 501
+    export_format = request.args.get('format', 'parquet')
+    if export_format not in COLUMNAR_FORMATS: return jsonify({'success': False, 'error': f"format must be one of {', '.join(COLUMNAR_FORMATS)}"}), 400
+    try:
+        page_size = page_size_arg(request.args.get('page_size'))
+    except ValueError: return jsonify({'success': False, 'error': 'page_size must be an integer'}), 400
+
+    try:
+        survey = db.get_survey_by_id(survey_id)
+        if not survey: return jsonify({'success': False, 'error': 'Survey not found'}), 404
+        # The first page is read up front so database errors still get a 500
+        first_page = fetch_page(supabase, survey_id, limit=page_size, columns='survey_id_fk,UID_fk,answers')
+    except Exception as e:
+        print(f"Columnar export Error: {type(e).__name__} - {e}")
+        return jsonify({'success': False, 'error': "DB error"}), 500
+
+    def generate():
+        try:
+            yield from stream_columnar(survey, survey_pages(supabase, survey_id, page_size, first_page=first_page), export_format)
+        except Exception as e:
+            # Headers are already sent; the truncated file is the only signal left
+            print(f"Columnar export of survey {survey_id} failed mid-stream: {type(e).__name__} - {e}")
+
+    stream = Response(stream_with_context(generate()), status=200, mimetype=COLUMNAR_MIMETYPES[export_format])
+    stream.headers['Content-Disposition'] = f"attachment; filename=responses-{survey_id}.{export_format}"
+    return stream
+
+
+@app.route('/responses/survey/<survey_id>/summary', methods=['GET'])
+def get_survey_summary(survey_id):
+    """Response count and per-question results, read from the incrementally maintained counters"""
+    if not is_valid_uuid(survey_id): return jsonify({'success': False, 'error': 'Invalid survey ID format'}), 400
+    try:
+        if not db.get_survey_by_id(survey_id): return jsonify({'success': False, 'error': 'Survey not found'}), 404
+        return jsonify({'success': True, 'data': aggregates.summary(survey_id)}), 200
+    except Exception as e:
+        print(f"GET summary Error: {type(e).__name__} - {e}")
+        return jsonify({'success': False, 'error': "Server error"}), 500
+
+
+@app.route('/cache/surveys/<survey_id>', methods=['DELETE'])
+@require_service_token
+def invalidate_cached_survey(survey_id):
+    """Called by survey_publisher when a survey is updated or deleted"""
+    removed = db.invalidate_survey(survey_id)
+    return jsonify({'success': True, 'data': {'survey_id': survey_id, 'invalidated': removed}}), 200
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy"})
+    return jsonify({"status": "healthy", "token_cache": token_cache.stats(),
+                    "survey_cache": db.get_survey_cache_stats(), "compiled_survey_cache": compiled_survey_cache.stats(),
+                    "aggregates": {"store": type(aggregates.store).__name__, "failures": aggregates.failures},
+                    "write_mode": RESPONSE_WRITE_MODE, "ingest": ingestor.stats() if ingestor else None,
+                    "idempotency": idempotency.stats(), "submitted_filter": submitted.stats() if submitted else None})
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5101))
@@ -0,0 +1,160 @@
+# responses_service/benchmarks/columnar_export_benchmark.py
+"""
+Compare the JSON/NDJSON response exports with the Parquet/Arrow columnar export.
+
+Usage (from responses_service/, with pyarrow installed):
+    python benchmarks/columnar_export_benchmark.py [--responses 50000] [--questions 20]
+        [--page-size 1000] [--row-group-size 10000]
+
+Synthetic responses for a survey with a mix of question types are fed through
+each exporter page by page, as the endpoints do. For every format it reports:
+    export   time to encode the whole survey, and the peak Python memory used
+    size     bytes sent to the client
+    load     time for an analyst to get one column per question back
+             (json.loads plus reshaping the answers arrays, or pyarrow's reader)
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pyarrow as pa  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+
+from columnar import stream_columnar  # noqa: E402
+from export import render  # noqa: E402
+
+QUESTION_TYPES = ['SINGLE_CHOICE', 'MULTIPLE_CHOICE', 'RATING', 'YES_NO', 'SHORT_TEXT', 'DATE']
+OPTIONS = ['Option 1', 'Option 2', 'Option 3', 'Option 4']
+WORDS = ['fine', 'great', 'slow', 'checkout', 'delivery', 'price', 'support', 'app']
+
+
+def make_survey(questions):
+    return {
+        'survey_id': str(uuid.uuid4()),
+        'version': 1,
+        'questions': [
+            {'id': f"q{i + 1}", 'type': QUESTION_TYPES[i % len(QUESTION_TYPES)], 'options': OPTIONS, 'scale': 5}
+            for i in range(questions)
+        ],
+    }
+
+
+def make_response(survey, rng):
+    answers = []
+    for question in survey['questions']:
+        if rng.random() < 0.1:
+            continue  # Skipped question
+        question_type = question['type']
+        if question_type == 'SINGLE_CHOICE':
+            response = rng.choice(OPTIONS)
+        elif question_type == 'MULTIPLE_CHOICE':
+            response = rng.sample(OPTIONS, rng.randint(1, 3))
+        elif question_type == 'RATING':
+            response = rng.randint(1, 5)
+        elif question_type == 'YES_NO':
+            response = rng.choice(['Yes', 'No'])
+        elif question_type == 'DATE':
+            response = f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        else:
+            response = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+        answers.append({'question_id': question['id'], 'response': response})
+    return {'survey_id_fk': survey['survey_id'], 'UID_fk': str(uuid.UUID(int=rng.getrandbits(128))), 'answers': answers}
+
+
+def make_pages(survey, responses, page_size, seed=7):
+    """Regenerated per run, so one page at a time is alive as with keyset reads"""
+    rng = random.Random(seed)
+    for start in range(0, responses, page_size):
+        yield [make_response(survey, rng) for _ in range(min(page_size, responses - start))]
+
+
+def load_json(data, survey):
+    rows = json.loads(data)['data']
+    columns = {'UID': [row['UID_fk'] for row in rows]}
+    for question in survey['questions']:
+        columns[question['id']] = []
+    for row in rows:
+        answers = {answer['question_id']: answer['response'] for answer in row['answers']}
+        for question in survey['questions']:
+            columns[question['id']].append(answers.get(question['id']))
+    return columns
+
+
+def load_ndjson(data, survey):
+    return load_json(b'{"data": [' + b','.join(data.splitlines()) + b']}', survey)
+
+
+def load_parquet(data, survey):
+    return pq.read_table(io.BytesIO(data))
+
+
+def load_arrow(data, survey):
+    return pa.ipc.open_file(io.BytesIO(data)).read_all()
+
+
+def encoder(export_format, survey, row_group_size):
+    if export_format in ('json', 'ndjson'):
+        return lambda pages: (chunk.encode() for chunk in render(pages, export_format))
+    return lambda pages: stream_columnar(survey, pages, export_format, row_group_size)
+
+
+def run(export_format, loader, survey, args):
+    encode = encoder(export_format, survey, args.row_group_size)
+
+    start = time.perf_counter()
+    size = 0
+    chunks = []
+    for chunk in encode(make_pages(survey, args.responses, args.page_size)):
+        size += len(chunk)
+        chunks.append(chunk)
+    export_seconds = time.perf_counter() - start
+    data = b''.join(chunks)
+    chunks = None
+
+    # Separate pass for memory: tracemalloc slows everything down. Chunks are
+    # dropped as they are produced, the way they leave a streaming response.
+    tracemalloc.start()
+    for _ in encode(make_pages(survey, args.responses, args.page_size)):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    loader(data, survey)
+    load_seconds = time.perf_counter() - start
+
+    print(f"{export_format:<8} export {export_seconds:>7.2f}s  peak {peak / 2**20:>7.1f} MiB  "
+          f"size {size / 2**20:>8.1f} MiB  load {load_seconds:>7.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--responses', type=int, default=50000)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--row-group-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    survey = make_survey(args.questions)
+    print(f"{args.responses} responses x {args.questions} questions, pages of {args.page_size}, "
+          f"row groups of {args.row_group_size}")
+    # Export times include building the synthetic pages; this is that share
+    start = time.perf_counter()
+    for _ in make_pages(survey, args.responses, args.page_size):
+        pass
+    print(f"{'pages':<8} build  {time.perf_counter() - start:>7.2f}s  (included in every export time below)")
+    for export_format, loader in (('json', load_json), ('ndjson', load_ndjson),
+                                  ('parquet', load_parquet), ('arrow', load_arrow)):
+        run(export_format, loader, survey, args)
+
+
+if __name__ == '__main__':
+    main()
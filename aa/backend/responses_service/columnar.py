@@ -0,0 +1,247 @@
+# columnar.py
+"""
+Export one survey's responses as Parquet or Arrow, one column per question.
+
+Usage:
+    python columnar.py SURVEY_ID OUTPUT_PATH [--format parquet|arrow] [--row-group-size N]
+"""
+import os
+import json
+import argparse
+from datetime import date
+
+from shared.conditional_logic import question_ids
+from export import iter_pages
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional: the export endpoint answers 501 without it
+    pa = None
+    pq = None
+
+# Rows buffered per Parquet row group / Arrow record batch; bounds export memory
+RESPONSES_COLUMNAR_ROW_GROUP_SIZE = int(os.getenv("RESPONSES_COLUMNAR_ROW_GROUP_SIZE", "10000"))
+
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+COLUMNAR_MIMETYPES = {'parquet': 'application/vnd.apache.parquet', 'arrow': 'application/vnd.apache.arrow.file'}
+UID_COLUMN = 'UID'
+
+
+def columnar_available():
+    return pa is not None
+
+
+def _text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+
+def _choices(value):
+    if value is None:
+        return None
+    values = value if isinstance(value, list) else [value]
+    return [item if isinstance(item, str) else _text(item) for item in values]
+
+
+def _number(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _yes_no(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return {'yes': True, 'no': False}.get(value.strip().lower())
+    return None
+
+
+def _date(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+
+
+def _column_types():
+    """Arrow type and converter per question type; anything else is stored as text"""
+    return {
+        'MULTIPLE_CHOICE': (pa.list_(pa.string()), _choices),
+        'RATING': (pa.float64(), _number),
+        'YES_NO': (pa.bool_(), _yes_no),
+        'DATE': (pa.date32(), _date),
+    }
+
+
+def survey_schema(survey):
+    """
+    Arrow schema for a survey: UID, then one nullable column per question in question order
+
+    Returns:
+        tuple: (schema, [(question_id, converter), ...])
+    """
+    types = _column_types()
+    fields = [pa.field(UID_COLUMN, pa.string(), nullable=False)]
+    columns = []
+    questions = [question for question in survey.get('questions') or [] if isinstance(question, dict)]
+    for question_id, question in zip(question_ids(questions), questions):
+        arrow_type, convert = types.get(question.get('type'), (pa.string(), _text))
+        metadata = {'type': str(question.get('type')), 'question': str(question.get('question') or '')}
+        fields.append(pa.field(question_id, arrow_type, metadata=metadata))
+        columns.append((question_id, convert))
+    metadata = {'survey_id': str(survey.get('survey_id')), 'survey_version': str(survey.get('version'))}
+    return pa.schema(fields, metadata=metadata), columns
+
+
+class _ChunkSink:
+    """Write-only file object that keeps what was written until drained"""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ColumnarWriter:
+    """
+    Flattens responses into question columns and writes them in row groups.
+
+    Only one row group of converted values is held at a time; each is written
+    (and, when streaming, handed to the client) before the next is built.
+    """
+
+    def __init__(self, survey, sink, export_format='parquet', row_group_size=RESPONSES_COLUMNAR_ROW_GROUP_SIZE):
+        if not columnar_available():
+            raise RuntimeError("pyarrow is not installed")
+        if export_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unknown columnar format: {export_format}")
+        self.schema, self.columns = survey_schema(survey)
+        self.row_group_size = max(1, row_group_size)
+        if export_format == 'parquet':
+            self._writer = pq.ParquetWriter(sink, self.schema, compression='snappy')
+        else:
+            self._writer = pa.ipc.new_file(sink, self.schema)
+        self._reset()
+        self.rows = 0
+        self.row_groups = 0
+
+    def _reset(self):
+        self._uids = []
+        self._values = {question_id: [] for question_id, _ in self.columns}
+
+    def add(self, row):
+        """Buffer one response row; returns True when a row group was written"""
+        answers = {}
+        for answer in row.get('answers') or []:
+            if isinstance(answer, dict):
+                answers[answer.get('question_id')] = answer.get('response')
+        self._uids.append(row['UID_fk'])
+        for question_id, convert in self.columns:
+            self._values[question_id].append(convert(answers.get(question_id)))
+        if len(self._uids) >= self.row_group_size:
+            self._write_group()
+            return True
+        return False
+
+    def _write_group(self):
+        if not self._uids:
+            return
+        arrays = [pa.array(self._uids, type=pa.string())] + [
+            pa.array(self._values[question_id], type=self.schema.field(question_id).type)
+            for question_id, _ in self.columns
+        ]
+        # One batch per call, so each becomes its own Parquet row group
+        self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.rows += len(self._uids)
+        self.row_groups += 1
+        self._reset()
+
+    def close(self):
+        self._write_group()
+        self._writer.close()
+
+
+def write_columnar(survey, pages, sink, export_format='parquet', row_group_size=RESPONSES_COLUMNAR_ROW_GROUP_SIZE):
+    """
+    Write pages of response rows to a path or file object
+
+    Returns:
+        int: Rows written
+    """
+    writer = ColumnarWriter(survey, sink, export_format, row_group_size)
+    for page in pages:
+        for row in page:
+            writer.add(row)
+    writer.close()
+    return writer.rows
+
+
+def stream_columnar(survey, pages, export_format='parquet', row_group_size=RESPONSES_COLUMNAR_ROW_GROUP_SIZE):
+    """Yield the encoded file in chunks, one per row group, as pages are read"""
+    sink = _ChunkSink()
+    writer = ColumnarWriter(survey, sink, export_format, row_group_size)
+    for page in pages:
+        for row in page:
+            if writer.add(row):
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+    writer.close()
+    yield sink.drain()
+
+
+def survey_pages(supabase, survey_id, page_size=None, first_page=None):
+    """Keyset pages of a survey's responses with just the columns the export needs"""
+    kwargs = {'page_size': page_size} if page_size else {}
+    return iter_pages(supabase, survey_id, first_page=first_page, columns='survey_id_fk,UID_fk,answers', **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('survey_id')
+    parser.add_argument('output_path')
+    parser.add_argument('--format', choices=COLUMNAR_FORMATS, default='parquet')
+    parser.add_argument('--row-group-size', type=int, default=RESPONSES_COLUMNAR_ROW_GROUP_SIZE)
+    args = parser.parse_args()
+    if not columnar_available():
+        raise SystemExit("pyarrow is required: pip install pyarrow")
+
+    from shared.db import Database
+    db = Database()
+    survey = db.get_survey_by_id(args.survey_id)
+    if not survey:
+        raise SystemExit(f"Survey {args.survey_id} not found")
+    rows = write_columnar(survey, survey_pages(db.supabase, args.survey_id), args.output_path, args.format, args.row_group_size)
+    print(f"Wrote {rows} responses to {args.output_path}")
+
+
+if __name__ == '__main__':
+    main()
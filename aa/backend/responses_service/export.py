@@ -0,0 +1,148 @@
+# export.py
+import io
+import os
+import csv
+import json
+import uuid
+import base64
+
+# Rows fetched per database round trip when listing or exporting responses
+RESPONSES_PAGE_SIZE = int(os.getenv("RESPONSES_PAGE_SIZE", "1000"))
+# Upper bound for the page_size / limit query parameters
+RESPONSES_MAX_PAGE_SIZE = int(os.getenv("RESPONSES_MAX_PAGE_SIZE", "5000"))
+
+EXPORT_FORMATS = ('json', 'ndjson', 'csv')
+MIMETYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# Leading CSV columns; any other columns follow in the order the first row has them
+CSV_KEY_COLUMNS = ['survey_id_fk', 'UID_fk']
+
+
+class CursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def _uuid(value):
+    try:
+        return str(uuid.UUID(str(value)))
+    except (ValueError, TypeError):
+        raise CursorError("Invalid cursor")
+
+
+def encode_cursor(row, survey_id=None):
+    """Opaque cursor pointing just after `row`"""
+    key = [row['UID_fk']] if survey_id else [row['survey_id_fk'], row['UID_fk']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, survey_id=None):
+    """
+    Turn a cursor from encode_cursor back into its key
+
+    Returns:
+        list: [UID_fk] for a survey's responses, [survey_id_fk, UID_fk] for all responses
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise CursorError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != (1 if survey_id else 2):
+        raise CursorError("Invalid cursor")
+    # Values end up in PostgREST filters, so only well-formed UUIDs are accepted
+    return [_uuid(value) for value in key]
+
+
+def page_size_arg(value, default=RESPONSES_PAGE_SIZE):
+    """Parse a page size query parameter, clamped to 1..RESPONSES_MAX_PAGE_SIZE"""
+    if value in (None, ''):
+        return min(default, RESPONSES_MAX_PAGE_SIZE)
+    size = int(value)  # ValueError for the caller to turn into a 400
+    return max(1, min(size, RESPONSES_MAX_PAGE_SIZE))
+
+
+def fetch_page(supabase, survey_id=None, after=None, limit=RESPONSES_PAGE_SIZE, columns='*'):
+    """
+    One page of responses in key order (survey_id_fk, UID_fk), starting after the key `after`
+
+    Uses keyset pagination, so every page costs the same however deep into the
+    table it is, unlike offset-based paging.
+    """
+    query = supabase.table('responses').select(columns)
+    if survey_id:
+        query = query.eq('survey_id_fk', survey_id)
+        if after:
+            query = query.gt('UID_fk', after[0])
+    elif after:
+        after_survey, after_uid = after
+        query = query.or_(f"survey_id_fk.gt.{after_survey},and(survey_id_fk.eq.{after_survey},UID_fk.gt.{after_uid})")
+    if not survey_id:
+        query = query.order('survey_id_fk')
+    response = query.order('UID_fk').limit(limit).execute()
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Error retrieving responses: {response.error}")
+    return response.data or []
+
+
+def iter_pages(supabase, survey_id=None, after=None, page_size=RESPONSES_PAGE_SIZE, first_page=None, columns='*'):
+    """
+    Yield pages of responses until the table (or survey) is exhausted
+
+    Args:
+        first_page (list, optional): Page already fetched from `after`, yielded as-is
+        columns (str): Projection; must include survey_id_fk and UID_fk
+    """
+    page = first_page if first_page is not None else fetch_page(supabase, survey_id, after, page_size, columns)
+    while page:
+        yield page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+        after = [last['UID_fk']] if survey_id else [last['survey_id_fk'], last['UID_fk']]
+        page = fetch_page(supabase, survey_id, after, page_size, columns)
+
+
+def _json_rows(pages):
+    """The {"success": true, "data": [...]} envelope, written one page at a time"""
+    yield '{"success": true, "data": ['
+    first = True
+    for page in pages:
+        chunk = ','.join(json.dumps(row, default=str) for row in page)
+        yield chunk if first else ',' + chunk
+        first = False
+    yield ']}'
+
+
+def _ndjson_rows(pages):
+    for page in pages:
+        yield ''.join(json.dumps(row, default=str) + '\n' for row in page)
+
+
+def _csv_cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def _csv_rows(pages):
+    writer = None
+    buffer = io.StringIO()
+    for page in pages:
+        if writer is None:
+            columns = CSV_KEY_COLUMNS + [column for column in page[0] if column not in CSV_KEY_COLUMNS]
+            writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+        for row in page:
+            writer.writerow({column: _csv_cell(value) for column, value in row.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if writer is None:
+        yield ','.join(CSV_KEY_COLUMNS) + '\r\n'
+
+
+def render(pages, export_format):
+    """Serialise pages of responses as a stream of text chunks in the given format"""
+    if export_format == 'ndjson':
+        return _ndjson_rows(pages)
+    if export_format == 'csv':
+        return _csv_rows(pages)
+    return _json_rows(pages)
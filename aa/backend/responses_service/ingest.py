@@ -0,0 +1,331 @@
+# ingest.py
+import os
+import json
+import time
+import sqlite3
+import threading
+import traceback
+from postgrest.exceptions import APIError
+
+# "sync" inserts each response during the request; "write_behind" queues it locally
+# and acknowledges with 202, inserting queued responses in batches
+RESPONSE_WRITE_MODE = os.getenv("RESPONSE_WRITE_MODE", "sync")
+RESPONSE_QUEUE_PATH = os.getenv("RESPONSE_QUEUE_PATH", "response_queue.db")
+# A flush starts once this many responses are queued, or after the interval, whichever is first
+RESPONSE_FLUSH_BATCH_SIZE = int(os.getenv("RESPONSE_FLUSH_BATCH_SIZE", "200"))
+RESPONSE_FLUSH_INTERVAL_SECONDS = float(os.getenv("RESPONSE_FLUSH_INTERVAL_SECONDS", "0.5"))
+# Longest wait between retries while the database is unreachable
+RESPONSE_FLUSH_MAX_BACKOFF_SECONDS = float(os.getenv("RESPONSE_FLUSH_MAX_BACKOFF_SECONDS", "30"))
+# A claim this old (its replica died before queueing the response) may be taken over
+RESPONSE_CLAIM_STALE_SECONDS = float(os.getenv("RESPONSE_CLAIM_STALE_SECONDS", "86400"))
+
+UNIQUE_VIOLATION = '23505'
+
+
+class ResponseQueue:
+    """
+    Responses waiting to be inserted, in a local SQLite file.
+
+    Each enqueue is committed with synchronous=FULL before the request is
+    acknowledged, so an accepted response survives a crash or restart. The
+    (survey_id, UID) primary key rejects a second submission while the first
+    is still queued. Rows the database refuses are moved to a dead letter table.
+    """
+
+    def __init__(self, path=RESPONSE_QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_responses ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, survey_id TEXT NOT NULL, uid TEXT NOT NULL,"
+            " answers TEXT NOT NULL, enqueued_at REAL NOT NULL, UNIQUE (survey_id, uid))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_responses ("
+            " survey_id TEXT NOT NULL, uid TEXT NOT NULL, answers TEXT NOT NULL,"
+            " error TEXT, failed_at REAL NOT NULL)"
+        )
+
+    def enqueue(self, survey_id, uid, answers):
+        """Queue a response; returns False if one for (survey_id, uid) is already queued"""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT INTO pending_responses (survey_id, uid, answers, enqueued_at) VALUES (?, ?, ?, ?)",
+                    (survey_id, uid, json.dumps(answers), time.time()),
+                )
+            except sqlite3.IntegrityError:
+                return False
+            return True
+
+    def is_pending(self, survey_id, uid):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM pending_responses WHERE survey_id = ? AND uid = ?", (survey_id, uid)
+            ).fetchone() is not None
+
+    def get_answers(self, survey_id, uid):
+        """A queued response's answers, or None if it is not queued"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT answers FROM pending_responses WHERE survey_id = ? AND uid = ?", (survey_id, uid)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_answers(self, survey_id, uid, answers):
+        """Replace a queued response's answers; returns True if one was queued"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE pending_responses SET answers = ? WHERE survey_id = ? AND uid = ?",
+                (json.dumps(answers), survey_id, uid),
+            )
+            return cursor.rowcount > 0
+
+    def remove(self, survey_id, uid):
+        """Drop a queued response; returns True if one was queued"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM pending_responses WHERE survey_id = ? AND uid = ?", (survey_id, uid)
+            )
+            return cursor.rowcount > 0
+
+    def peek(self, limit):
+        """Oldest queued responses as (seq, row) pairs"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, survey_id, uid, answers FROM pending_responses ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        return [
+            (seq, {'survey_id_fk': survey_id, 'UID_fk': uid, 'answers': json.loads(answers)})
+            for seq, survey_id, uid, answers in rows
+        ]
+
+    def ack(self, seqs):
+        """Remove responses that have been written (or given up on)"""
+        if not seqs:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending_responses WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def dead_letter(self, seq, row, error):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO dead_responses (survey_id, uid, answers, error, failed_at) VALUES (?, ?, ?, ?, ?)",
+                (row['survey_id_fk'], row['UID_fk'], json.dumps(row['answers']), error, time.time()),
+            )
+            self._conn.execute("DELETE FROM pending_responses WHERE seq = ?", (seq,))
+            self._conn.execute("COMMIT")
+
+    def counts(self):
+        with self._lock:
+            pending = self._conn.execute("SELECT COUNT(*) FROM pending_responses").fetchone()[0]
+            dead = self._conn.execute("SELECT COUNT(*) FROM dead_responses").fetchone()[0]
+        return {'pending': pending, 'dead': dead}
+
+
+class WriteBehindIngestor:
+    """
+    Accepts responses into the local queue and inserts them in multi-row batches.
+
+    A submission is rejected as a duplicate if the same (survey_id, UID) is
+    queued here or listed in the submitted-response filter, without a database
+    round trip. Any other submission is claimed in the database first
+    (sql/response_claims.sql), which fails if the user already has a saved
+    response or another replica holds the claim, so every duplicate gets 409
+    before it is acknowledged. The claim is released when the row is inserted,
+    withdrawn or dead-lettered.
+
+    A failed batch is retried row by row: duplicates are dropped, rows refused
+    for another reason are dead-lettered, and connection errors leave the rows
+    queued to retry with backoff.
+    """
+
+    def __init__(self, supabase, queue=None, batch_size=RESPONSE_FLUSH_BATCH_SIZE,
+                 interval=RESPONSE_FLUSH_INTERVAL_SECONDS, on_inserted=None, submitted=None):
+        self.supabase = supabase
+        # SubmittedFilter of pairs already saved; a pair found there needs no claim
+        self.submitted = submitted
+        self.queue = queue or ResponseQueue()
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        # Called with each inserted row, e.g. to update result counters
+        self.on_inserted = on_inserted
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._queued_since_flush = 0
+        # Updated from request threads and the flusher thread
+        self._stats_lock = threading.Lock()
+        self.stats_counters = {'accepted': 0, 'duplicates': 0, 'inserted': 0, 'conflicts': 0,
+                               'dead_lettered': 0, 'batches': 0, 'flush_errors': 0, 'claims': 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats_counters[name] += 1
+
+    def _claim(self, survey_id, uid):
+        """True if this replica may queue the response: nobody has saved or claimed it"""
+        self._count('claims')
+        response = self.supabase.rpc('claim_response', {
+            'p_survey_id': survey_id, 'p_uid': uid, 'p_stale_seconds': RESPONSE_CLAIM_STALE_SECONDS
+        }).execute()
+        return bool(response.data)
+
+    def _release(self, survey_id, uid):
+        try:
+            self.supabase.table('response_claims').delete().eq('survey_id_fk', survey_id).eq('UID_fk', uid).execute()
+        except Exception as e:
+            # Harmless: the claim goes stale after RESPONSE_CLAIM_STALE_SECONDS
+            print(f"Releasing the claim on survey {survey_id} / {uid} failed: {e}")
+
+    def submit(self, survey_id, uid, answers):
+        """
+        Queue a response
+
+        Raises if the claim cannot be made (database unreachable), so nothing
+        is acknowledged that might turn out to be a duplicate.
+
+        Returns:
+            bool: False if this user already submitted (queued, claimed or saved)
+        """
+        if self.queue.is_pending(survey_id, uid):
+            self._count('duplicates')
+            return False
+        if self.submitted is not None and (survey_id, uid) in self.submitted:
+            self._count('duplicates')
+            return False
+        if not self._claim(survey_id, uid):
+            self._count('duplicates')
+            return False
+        if not self.queue.enqueue(survey_id, uid, answers):
+            self._count('duplicates')
+            return False
+        self._count('accepted')
+        with self._stats_lock:
+            self._queued_since_flush += 1
+            full = self._queued_since_flush >= self.batch_size
+        if full:
+            self._wake.set()
+        return True
+
+    def update_pending(self, survey_id, uid, update):
+        """
+        Change the answers of a response that is still queued
+
+        Args:
+            update (callable): Takes the queued answers, returns (new answers, error);
+                               the queue is only written when error is None
+
+        Returns:
+            tuple | None: What update returned, or None if the response is not queued
+        """
+        # Waits for a flush in progress, so the change is not lost to a batch already being written
+        with self._flush_lock:
+            current = self.queue.get_answers(survey_id, uid)
+            if current is None:
+                return None
+            answers, error = update(current)
+            if error is None:
+                self.queue.update_answers(survey_id, uid, answers)
+            return answers, error
+
+    def remove_pending(self, survey_id, uid):
+        """Withdraw a response that is still queued; False if it is not queued"""
+        with self._flush_lock:
+            removed = self.queue.remove(survey_id, uid)
+        if removed:
+            self._release(survey_id, uid)
+        return removed
+
+    def _inserted(self, row):
+        self._count('inserted')
+        if self.on_inserted:
+            self.on_inserted(row)
+
+    def _flush_rows_individually(self, batch):
+        # Each row is acknowledged as soon as it is settled, so a connection error
+        # part way through only leaves the remaining rows queued
+        for seq, row in batch:
+            try:
+                self.supabase.table('responses').insert(row).execute()
+            except APIError as e:
+                if e.code == UNIQUE_VIOLATION:
+                    print(f"Queued response for survey {row['survey_id_fk']} / {row['UID_fk']} was already submitted, dropping it")
+                    self._count('conflicts')
+                    self.queue.ack([seq])
+                else:
+                    print(f"Database refused queued response for survey {row['survey_id_fk']}: {e}")
+                    self.queue.dead_letter(seq, row, str(e))
+                    self._release(row['survey_id_fk'], row['UID_fk'])
+                    self._count('dead_lettered')
+                continue
+            self.queue.ack([seq])
+            self._inserted(row)
+
+    def flush(self):
+        """
+        Insert everything queued, one batch at a time
+
+        Returns:
+            int: Responses removed from the queue; raises if the database is unreachable
+        """
+        flushed = 0
+        with self._flush_lock:
+            with self._stats_lock:
+                self._queued_since_flush = 0
+            while True:
+                batch = self.queue.peek(self.batch_size)
+                if not batch:
+                    return flushed
+                try:
+                    self.supabase.table('responses').insert([row for _, row in batch]).execute()
+                except APIError as e:
+                    print(f"Batch insert of {len(batch)} responses failed ({e.code}), retrying one by one")
+                    self._flush_rows_individually(batch)
+                else:
+                    self.queue.ack([seq for seq, _ in batch])
+                    for _, row in batch:
+                        self._inserted(row)
+                self._count('batches')
+                flushed += len(batch)
+                if len(batch) < self.batch_size:
+                    return flushed
+
+    def _run(self):
+        backoff = self.interval
+        while not self._stop.is_set():
+            self._wake.wait(timeout=backoff)
+            self._wake.clear()
+            try:
+                self.flush()
+                backoff = self.interval
+            except Exception as e:
+                # Rows stay queued; back off while the database is unavailable
+                self._count('flush_errors')
+                print(f"Flushing queued responses failed: {type(e).__name__} - {e}")
+                traceback.print_exc()
+                backoff = min(max(backoff * 2, self.interval), RESPONSE_FLUSH_MAX_BACKOFF_SECONDS)
+
+    def start(self):
+        """Start the background flusher (responses left queued by a previous run go first)"""
+        self._thread = threading.Thread(target=self._run, name="response-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write out whatever is still queued"""
+        self._stop.set()
+        self._wake.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Final flush of queued responses failed, they stay queued for the next start: {e}")
+
+    def stats(self):
+        with self._stats_lock:
+            counters = dict(self.stats_counters)
+        return dict(counters, **self.queue.counts(), batch_size=self.batch_size, interval=self.interval)
@@ -0,0 +1,54 @@
+# patches.py
+import os
+import json
+import hashlib
+
+# Compare-and-set attempts for a patch without base_version before giving up with 409
+RESPONSE_PATCH_MAX_ATTEMPTS = int(os.getenv("RESPONSE_PATCH_MAX_ATTEMPTS", "3"))
+
+
+class PatchError(ValueError):
+    """Raised when a patch body is malformed"""
+
+
+def answers_version(answers):
+    """
+    Version tag of a saved answers array, used to detect concurrent saves
+
+    It is a hash of the answers themselves, so no version column is needed;
+    any save that changes the answers changes the tag.
+    """
+    payload = json.dumps(answers, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def merge_answers(current, patch):
+    """
+    Apply changed answers to a saved answers array
+
+    Args:
+        current (list): Saved [{question_id, response}, ...]
+        patch (list): Changed answers; a null response removes the question's answer
+
+    Returns:
+        list: Saved answers in their original order, then newly answered questions in patch order
+    """
+    if not isinstance(patch, list):
+        raise PatchError("patch must be a list of {question_id, response} objects")
+    changes = {}
+    for answer in patch:
+        if not isinstance(answer, dict) or 'question_id' not in answer:
+            raise PatchError("Every patched answer needs a question_id")
+        changes[answer['question_id']] = answer
+
+    merged = []
+    for answer in current or []:
+        question_id = answer.get('question_id') if isinstance(answer, dict) else None
+        if question_id in changes:
+            change = changes.pop(question_id)
+            if change.get('response') is not None:
+                merged.append(dict(answer, **change))
+        else:
+            merged.append(answer)
+    merged.extend(change for change in changes.values() if change.get('response') is not None)
+    return merged
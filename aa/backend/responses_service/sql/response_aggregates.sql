@@ -0,0 +1,34 @@
+-- Per-survey, per-question result counters maintained by responses_service (aggregates.py).
+-- question_id '_survey' / bucket 'responses' counts a survey's responses; bucket '_answered'
+-- counts non-empty answers to a question; other buckets count answers by value.
+create table if not exists response_aggregates (
+  survey_id uuid not null,
+  question_id text not null,
+  bucket text not null,
+  count bigint not null default 0,
+  primary key (survey_id, question_id, bucket)
+);
+
+-- Add deltas ([{question_id, bucket, delta}], one entry per counter) in a single statement,
+-- so concurrent submissions to the same survey never overwrite each other's counts.
+create or replace function apply_response_aggregates(p_survey_id uuid, p_deltas jsonb)
+returns void
+language sql
+as $$
+  insert into response_aggregates (survey_id, question_id, bucket, count)
+  select p_survey_id, d->>'question_id', d->>'bucket', (d->>'delta')::bigint
+  from jsonb_array_elements(p_deltas) as d
+  on conflict (survey_id, question_id, bucket)
+  do update set count = response_aggregates.count + excluded.count;
+$$;
+
+-- Swap a survey's counters for freshly recounted ones ([{question_id, bucket, count}]).
+create or replace function replace_response_aggregates(p_survey_id uuid, p_counts jsonb)
+returns void
+language sql
+as $$
+  delete from response_aggregates where survey_id = p_survey_id;
+  insert into response_aggregates (survey_id, question_id, bucket, count)
+  select p_survey_id, c->>'question_id', c->>'bucket', (c->>'count')::bigint
+  from jsonb_array_elements(p_counts) as c;
+$$;
@@ -0,0 +1,44 @@
+-- Used by responses_service in write-behind mode (RESPONSE_WRITE_MODE=write_behind).
+-- A replica claims (survey, user) here before acknowledging a queued submission, so a
+-- second submission through any replica gets 409 even before the first is inserted.
+-- All replicas should run in the same write mode: a synchronous insert does not claim.
+create table if not exists response_claims (
+  survey_id_fk uuid not null,
+  "UID_fk" uuid not null,
+  claimed_at timestamptz not null default now(),
+  primary key (survey_id_fk, "UID_fk")
+);
+
+-- True if the caller now holds the claim; false if the user already has a saved
+-- response or a live claim. A claim older than p_stale_seconds (left by a replica
+-- that died before queueing the response) may be taken over.
+create or replace function claim_response(p_survey_id uuid, p_uid uuid, p_stale_seconds double precision default 86400)
+returns boolean
+language plpgsql
+as $$
+begin
+  if exists (select 1 from responses where survey_id_fk = p_survey_id and "UID_fk" = p_uid) then
+    return false;
+  end if;
+  insert into response_claims (survey_id_fk, "UID_fk") values (p_survey_id, p_uid)
+  on conflict (survey_id_fk, "UID_fk") do update set claimed_at = now()
+  where response_claims.claimed_at < now() - make_interval(secs => p_stale_seconds);
+  return found;
+end;
+$$;
+
+-- Once the response is inserted, the responses table's own unique key takes over.
+create or replace function release_response_claim()
+returns trigger
+language plpgsql
+as $$
+begin
+  delete from response_claims where survey_id_fk = new.survey_id_fk and "UID_fk" = new."UID_fk";
+  return null;
+end;
+$$;
+
+drop trigger if exists responses_release_claim on responses;
+create trigger responses_release_claim
+  after insert on responses
+  for each row execute function release_response_claim();
@@ -0,0 +1,38 @@
+-- Used by PUT /responses/survey/<id>: conditional saves (patches and base_version) and full replaces.
+-- Every update of answers bumps revision, so a save can compare-and-set on this small
+-- column instead of filtering on the whole answers array.
+alter table responses add column if not exists revision integer not null default 0;
+
+create or replace function bump_response_revision()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.revision := old.revision + 1;
+  return new;
+end;
+$$;
+
+drop trigger if exists responses_bump_revision on responses;
+create trigger responses_bump_revision
+  before update of answers on responses
+  for each row execute function bump_response_revision();
+
+-- Unconditional replace: set a response's answers and return the ones replaced. The
+-- row is locked while its old answers are read, so two concurrent replaces each get
+-- the answers the other left (result counters are moved from those).
+create or replace function replace_response_answers(p_survey_id uuid, p_uid uuid, p_answers jsonb)
+returns table (previous_answers jsonb)
+language sql
+as $$
+  update responses
+  set answers = p_answers
+  from (
+    select survey_id_fk, "UID_fk", answers
+    from responses
+    where survey_id_fk = p_survey_id and "UID_fk" = p_uid
+    for update
+  ) as previous
+  where responses.survey_id_fk = previous.survey_id_fk and responses."UID_fk" = previous."UID_fk"
+  returning previous.answers::jsonb;
+$$;
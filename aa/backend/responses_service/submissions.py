@@ -0,0 +1,171 @@
+# submissions.py
+import os
+import json
+import hashlib
+import threading
+from flask import jsonify
+
+from shared.cache import LRUCache
+from export import iter_pages
+
+# Results of requests sent with an Idempotency-Key, replayed when the client retries
+RESPONSE_IDEMPOTENCY_CACHE_SIZE = int(os.getenv("RESPONSE_IDEMPOTENCY_CACHE_SIZE", "10000"))
+RESPONSE_IDEMPOTENCY_TTL_SECONDS = float(os.getenv("RESPONSE_IDEMPOTENCY_TTL_SECONDS", "3600"))
+# (survey_id, UID) pairs known to have submitted, reloaded from the database this often
+RESPONSE_SUBMITTED_FILTER = os.getenv("RESPONSE_SUBMITTED_FILTER", "1") == "1"
+RESPONSE_SUBMITTED_FILTER_REFRESH_SECONDS = float(os.getenv("RESPONSE_SUBMITTED_FILTER_REFRESH_SECONDS", "600"))
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+
+def _request_fingerprint(data):
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Replays the result of a POST retried with the same Idempotency-Key.
+
+    Keys are scoped to the submitting UID. Any completed result except a 5xx is
+    kept for the TTL; a retry while the first request is still running gets 409,
+    and reusing a key for a different body gets 422.
+    """
+
+    def __init__(self, maxsize=RESPONSE_IDEMPOTENCY_CACHE_SIZE, ttl=RESPONSE_IDEMPOTENCY_TTL_SECONDS):
+        self.results = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    def begin(self, uid, key, data):
+        """
+        Claim a key before handling a request
+
+        Returns:
+            tuple | None: A (response, status) to send instead, or None to go ahead
+        """
+        if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            return jsonify({'success': False, 'error': f'Idempotency-Key is longer than {MAX_IDEMPOTENCY_KEY_LENGTH} characters'}), 400
+        fingerprint = _request_fingerprint(data)
+        with self._lock:
+            stored = self.results.get((uid, key))
+            if stored is not None:
+                stored_fingerprint, body, status = stored
+                if stored_fingerprint != fingerprint:
+                    return jsonify({'success': False, 'error': 'Idempotency-Key was already used for a different request'}), 422
+                self.replays += 1
+                response = jsonify(body)
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response, status
+            if (uid, key) in self._in_flight:
+                return jsonify({'success': False, 'error': 'A request with this Idempotency-Key is still in progress'}), 409
+            self._in_flight.add((uid, key))
+        return None
+
+    def finish(self, uid, key, data, result):
+        """Release the key, keeping the result of `result` = (response, status) unless it is a server error"""
+        response, status = result
+        with self._lock:
+            self._in_flight.discard((uid, key))
+            if status < 500:
+                self.results.set((uid, key), (_request_fingerprint(data), response.get_json(), status))
+
+    def abandon(self, uid, key):
+        """Release the key without a result (the request raised)"""
+        with self._lock:
+            self._in_flight.discard((uid, key))
+
+    def stats(self):
+        return dict(self.results.stats(), replays=self.replays, in_flight=len(self._in_flight))
+
+
+def _pair_digest(survey_id, uid):
+    # 8-byte digests keep the set small; a false match is a 2^-64 event
+    digest = hashlib.blake2b(f"{survey_id}:{uid}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class SubmittedFilter:
+    """
+    (survey_id, UID) pairs that already have a response, held in memory.
+
+    A pair found here is a duplicate and is rejected without a database round
+    trip. A pair not found here still goes to the database, whose unique key is
+    the authority; the filter only knows this replica's writes plus what it
+    loaded at the last refresh. A response deleted through another replica
+    stays listed until the next refresh.
+    """
+
+    def __init__(self, supabase, refresh_seconds=RESPONSE_SUBMITTED_FILTER_REFRESH_SECONDS):
+        self.supabase = supabase
+        self.refresh_seconds = refresh_seconds
+        self._pairs = set()
+        self._loading = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.ready = False
+        self.loads = 0
+        self.hits = 0
+
+    def __contains__(self, pair):
+        if not self.ready:
+            return False
+        hit = _pair_digest(*pair) in self._pairs
+        if hit:
+            self.hits += 1
+        return hit
+
+    def add(self, survey_id, uid):
+        digest = _pair_digest(survey_id, uid)
+        with self._lock:
+            self._pairs.add(digest)
+            if self._loading is not None:
+                self._loading.add(digest)
+
+    def discard(self, survey_id, uid):
+        digest = _pair_digest(survey_id, uid)
+        with self._lock:
+            self._pairs.discard(digest)
+            if self._loading is not None:
+                self._loading.discard(digest)
+
+    def load(self):
+        """Reload every pair from the responses table, in keyset pages"""
+        pairs = set()
+        # Writes made during the scan go into both sets, so the swap does not lose them
+        with self._lock:
+            self._loading = pairs
+        try:
+            for page in iter_pages(self.supabase, columns='survey_id_fk,UID_fk'):
+                digests = [_pair_digest(row['survey_id_fk'], row['UID_fk']) for row in page]
+                with self._lock:
+                    pairs.update(digests)
+        except Exception:
+            with self._lock:
+                self._loading = None
+            raise
+        with self._lock:
+            self._loading = None
+            self._pairs = pairs
+            self.ready = True
+            self.loads += 1
+        print(f"Submitted-response filter loaded {len(pairs)} pairs")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Loading the submitted-response filter failed: {type(e).__name__} - {e}")
+            self._stop.wait(self.refresh_seconds)
+
+    def start(self):
+        threading.Thread(target=self._run, name="submitted-filter", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._pairs)
+        return {'ready': self.ready, 'pairs': size, 'hits': self.hits, 'loads': self.loads}
@@ -1,17 +1,32 @@
 # scheduler_service.py
 import os
 import time
+import atexit
 import requests
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 from flask_cors import CORS
 from flask_apscheduler import APScheduler
-from supabase import create_client
+from shared.clients import get_supabase_client
 from dotenv import load_dotenv
 
+from survey_lists import ToBeAnsweredUpdater
+from job_leases import JobCoordinator, make_lease_store, SCHEDULER_MODE
+from job_metrics import JobMetrics
+
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+
+# A run that is still going when the next one is due is not started twice
+# (max_instances); runs missed while busy are folded into one (coalesce) if
+# they are no later than the grace time, otherwise skipped
+app.config['SCHEDULER_JOB_DEFAULTS'] = {
+    'coalesce': os.getenv("SCHEDULER_COALESCE", "1") == "1",
+    'max_instances': int(os.getenv("SCHEDULER_MAX_INSTANCES", "1")),
+    'misfire_grace_time': int(os.getenv("SCHEDULER_MISFIRE_GRACE_SECONDS", "30")),
+}
+
 scheduler = APScheduler()
 scheduler.init_app(app)
 scheduler.start()
@@ -29,43 +44,56 @@ supabase_key = os.getenv("SUPABASE_KEY")
 if not supabase_url or not supabase_key:
     raise ValueError("Missing Supabase credentials")
 
-supabase = create_client(supabase_url, supabase_key)
+supabase = get_supabase_client(supabase_url, supabase_key)
 print("Supabase initialized for Scheduler Service!")
 
+updater = ToBeAnsweredUpdater(supabase)
+
+# Both jobs write the same lists, so they share one lease
+LEASE_NAME = 'to_be_answered_surveys'
+coordinator = JobCoordinator(make_lease_store(supabase) if SCHEDULER_MODE != 'local' else None)
+atexit.register(coordinator.leave)
+
+# How often the full scan runs to reconcile anything the incremental runs missed
+RECONCILE_INTERVAL_MINUTES = int(os.getenv("RECONCILE_INTERVAL_MINUTES", "60"))
+
+job_metrics = JobMetrics()
+job_metrics.register('update_user_surveys', interval_seconds=60)
+job_metrics.register('reconcile_user_surveys', interval_seconds=RECONCILE_INTERVAL_MINUTES * 60)
+
 @scheduler.task('cron', id='update_user_surveys', minute='*/1')
 def update_user_surveys():
-    """Job that runs every 1 minute to update users' to-be-answered survey lists"""
+    """Job that runs every 1 minute to update the to-be-answered lists of users affected
+    by new or deleted surveys, or by surveys they answered since the last run"""
     try:
         print("Running scheduled task to update user surveys...")
-        
-        # Get all available surveys
-        surveys_response = supabase.table('surveys').select("survey_id").execute()
-        all_survey_ids = [survey["survey_id"] for survey in surveys_response.data]
-        
-        # Get all users
-        users_response = supabase.table('users').select("UID,answered_surveys").execute()
-        
-        for user in users_response.data:
-            user_id = user["UID"]
-            
-            # Get the list of surveys this user has already answered
-            answered_surveys = []
-            if 'answered_surveys' in user and user['answered_surveys']:
-                answered_surveys = [survey_item['survey_id'] for survey_item in user.get('answered_surveys', [])]
-            
-            # Find surveys the user hasn't answered yet
-            to_be_answered = [survey_id for survey_id in all_survey_ids if survey_id not in answered_surveys]
-            
-            # Update the user's to_be_answered_surveys field
-            supabase.table('users').update({
-                'to_be_answered_surveys': [{'survey_id': survey_id} for survey_id in to_be_answered]
-            }).eq('UID', user_id).execute()
-            
-        print(f"Successfully updated to-be-answered surveys for {len(users_response.data)} users")
+        with job_metrics.track('update_user_surveys') as run:
+            stats = coordinator.run(LEASE_NAME, lambda owns: updater.run(full=False, owns=owns))
+            if stats is None:
+                run.skip()
+                return
+            run.update(stats)
+        print(f"Updated to-be-answered surveys for {stats['users_updated']} of {stats['users_scanned']} users ({stats})")
         
     except Exception as e:
         print(f"Error updating user surveys: {str(e)}")
 
+@scheduler.task('interval', id='reconcile_user_surveys', minutes=RECONCILE_INTERVAL_MINUTES)
+def reconcile_user_surveys():
+    """Periodic full scan that recomputes every user's to-be-answered list"""
+    try:
+        print("Running scheduled full reconciliation of user surveys...")
+        with job_metrics.track('reconcile_user_surveys') as run:
+            stats = coordinator.run(LEASE_NAME, lambda owns: updater.run(full=True, owns=owns))
+            if stats is None:
+                run.skip()
+                return
+            run.update(stats)
+        print(f"Reconciled to-be-answered surveys for {stats['users_updated']} of {stats['users_scanned']} users ({stats})")
+
+    except Exception as e:
+        print(f"Error reconciling user surveys: {str(e)}")
+
 @app.route('/scheduler/status', methods=['GET'])
 def get_scheduler_status():
     """Endpoint to check the status of scheduled jobs"""
@@ -75,10 +103,17 @@ def get_scheduler_status():
         "success": True,
         "data": {
             "active_jobs": len(jobs),
-            "jobs": job_details
+            "jobs": job_details,
+            "coordination": coordinator.stats(),
+            "telemetry": job_metrics.snapshot()
         }
     })
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Job telemetry in the Prometheus text format"""
+    return Response(job_metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy", "service": "scheduler"})
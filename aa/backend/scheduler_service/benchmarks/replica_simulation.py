@@ -0,0 +1,78 @@
+# scheduler_service/benchmarks/replica_simulation.py
+"""
+Run several scheduler "replicas" against an in-memory lease store.
+
+Usage (from scheduler_service/):
+    python benchmarks/replica_simulation.py [--replicas 3] [--users 10000] [--rounds 3]
+
+Every replica fires the same job at the same moment each round, as they would
+off a shared cron. For each mode the script reports how often each user was
+processed per round: lease mode should process every user exactly once (by a
+single replica) and partitioned mode every user exactly once (spread over the
+replicas).
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_leases import InMemoryLeaseStore, JobCoordinator  # noqa: E402
+
+
+def simulate(mode, replicas, user_ids, rounds, job_seconds):
+    store = InMemoryLeaseStore()
+    coordinators = [JobCoordinator(store, mode=mode, replica_id=f"replica-{i}", lease_ttl=30) for i in range(replicas)]
+    # Register everyone first, as a running deployment would be
+    for coordinator in coordinators:
+        store.heartbeat(coordinator.replica_id, coordinator.lease_ttl)
+
+    for round_number in range(rounds):
+        processed = Counter()
+        per_replica = Counter()
+        lock = threading.Lock()
+
+        def job(owns, replica_id):
+            time.sleep(job_seconds)
+            handled = [user_id for user_id in user_ids if owns is None or owns(user_id)]
+            with lock:
+                processed.update(handled)
+                per_replica[replica_id] += len(handled)
+            return len(handled)
+
+        threads = [
+            threading.Thread(target=c.run, args=('to_be_answered_surveys', lambda owns, r=c.replica_id: job(owns, r)))
+            for c in coordinators
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        counts = Counter(processed[user_id] for user_id in user_ids)
+        print(f"{mode:<12} round {round_number + 1}: users by times processed {dict(sorted(counts.items()))}, "
+              f"per replica {dict(sorted(per_replica.items()))}")
+
+    skipped = sum(c.skipped for c in coordinators)
+    print(f"{mode:<12} runs {sum(c.runs for c in coordinators)}, skipped {skipped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--job-seconds", type=float, default=0.05, help="simulated run time, so runs overlap")
+    args = parser.parse_args()
+
+    user_ids = [str(uuid.uuid4()) for _ in range(args.users)]
+    for mode in ('lease', 'partitioned'):
+        simulate(mode, args.replicas, user_ids, args.rounds, args.job_seconds)
+
+
+if __name__ == "__main__":
+    main()
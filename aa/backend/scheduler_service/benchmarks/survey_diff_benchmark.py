@@ -0,0 +1,101 @@
+# scheduler_service/benchmarks/survey_diff_benchmark.py
+"""
+Size the to-be-answered computation for a given catalogue and user count.
+
+Usage (from scheduler_service/):
+    python benchmarks/survey_diff_benchmark.py [--surveys 10000] [--users 100000]
+        [--answered 20] [--sample 1000] [--full]
+
+Each strategy is timed over `--sample` users and extrapolated to `--users`
+(the list-search baseline is far too slow to run in full at 10k x 100k).
+Pass --full to also run the set and bitmap strategies over every user.
+
+Strategies:
+    list      [s for s in catalogue if s not in answered_list]  (the old job)
+    set       catalogue filtered against a hashed answered set
+    bitmap    integer bitmaps, materialised into a survey ID list
+    mask      integer bitmaps, open set kept as a mask (no list)
+    diff      mask plus added/removed IDs against the previous run's mask
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from survey_diff import SurveyDifferenceEngine  # noqa: E402
+
+
+def make_data(surveys, users, answered, seed=0):
+    rng = random.Random(seed)
+    catalogue = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(surveys)]
+    answered_lists = [rng.sample(catalogue, min(answered, surveys)) for _ in range(users)]
+    return catalogue, answered_lists
+
+
+def run(label, fn, answered_lists, total_users):
+    start = time.perf_counter()
+    for answered in answered_lists:
+        fn(answered)
+    elapsed = time.perf_counter() - start
+    per_user = elapsed / max(len(answered_lists), 1)
+    print(f"{label:<8} {per_user * 1e6:>10.1f} us/user  -> {per_user * total_users:>10.1f} s for {total_users:,} users")
+    return per_user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--surveys", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--answered", type=int, default=20, help="surveys answered per user")
+    parser.add_argument("--sample", type=int, default=1000, help="users timed per strategy")
+    parser.add_argument("--full", action="store_true", help="also run set/bitmap over every user")
+    args = parser.parse_args()
+
+    sample = min(args.sample, args.users)
+    catalogue, answered_lists = make_data(args.surveys, args.full and args.users or sample, args.answered)
+    sampled = answered_lists[:sample]
+    answered_sets = [set(answered) for answered in answered_lists]
+
+    set_engine = SurveyDifferenceEngine(catalogue, use_bitmaps=False)
+    bitmap_engine = SurveyDifferenceEngine(catalogue)
+    previous = [bitmap_engine.open_mask(answered[1:]) for answered in sampled]
+    rng = random.Random(1)
+    previous_for = dict(zip(map(id, sampled), previous))
+
+    print(f"{args.surveys:,} surveys x {args.users:,} users, {args.answered} answered each, {sample:,} users sampled")
+    baseline = run("list", lambda answered: [s for s in catalogue if s not in answered], sampled, args.users)
+    results = {
+        "set": run("set", lambda answered: set_engine.to_be_answered(set(answered)), sampled, args.users),
+        "bitmap": run("bitmap", bitmap_engine.to_be_answered, sampled, args.users),
+        "mask": run("mask", bitmap_engine.open_mask, sampled, args.users),
+        "diff": run("diff", lambda answered: bitmap_engine.diff(previous_for[id(answered)], bitmap_engine.open_mask(answered)), sampled, args.users),
+    }
+    for label, per_user in results.items():
+        print(f"speedup  {label:<8} {baseline / per_user:>8.1f}x vs list")
+
+    mask_bytes = (args.surveys + 7) // 8
+    print(f"memory   {mask_bytes:,} bytes per user mask -> {mask_bytes * args.users / 2 ** 20:,.1f} MiB for all users")
+
+    if args.full:
+        print("full run")
+        start = time.perf_counter()
+        for answered in answered_sets:
+            set_engine.to_be_answered(answered)
+        print(f"set      {time.perf_counter() - start:>10.1f} s")
+        start = time.perf_counter()
+        masks = bitmap_engine.compute((i, answered) for i, answered in enumerate(answered_sets))
+        print(f"mask     {time.perf_counter() - start:>10.1f} s")
+        start = time.perf_counter()
+        bitmap_engine.compute(
+            ((i, answered[rng.randrange(len(answered)):]) for i, answered in enumerate(answered_lists)),
+            previous={i: result["mask"] for i, result in masks.items()},
+        )
+        print(f"diff     {time.perf_counter() - start:>10.1f} s")
+
+
+if __name__ == "__main__":
+    main()
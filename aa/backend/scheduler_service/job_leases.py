@@ -0,0 +1,224 @@
+# job_leases.py
+import os
+import time
+import socket
+import hashlib
+import threading
+import uuid
+
+# local: every replica runs every job (single-container deployments)
+# lease: one replica at a time runs the job, guarded by a lease with a TTL
+# partitioned: every replica runs the job for the users in its own hash range
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "local")
+# supabase (sql/scheduler_leases.sql) or memory (single process, for local runs)
+SCHEDULER_LEASE_STORE = os.getenv("SCHEDULER_LEASE_STORE", "supabase")
+# Must comfortably exceed the gap between renewals (a third of the TTL)
+LEASE_TTL_SECONDS = float(os.getenv("SCHEDULER_LEASE_TTL_SECONDS", "120"))
+REPLICA_ID = os.getenv("SCHEDULER_REPLICA_ID") or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+MODES = ('local', 'lease', 'partitioned')
+HASH_SPACE = 1 << 32
+
+
+def uid_hash(user_id):
+    """Stable 32-bit hash of a user ID, identical on every replica and to users.uid_hash (sql/users_uid_hash.sql)"""
+    return int(hashlib.sha256(str(user_id).encode()).hexdigest()[:8], 16)
+
+
+def hash_range(index, count):
+    """The [start, end) slice of the hash space owned by replica `index` of `count`"""
+    return index * HASH_SPACE // count, (index + 1) * HASH_SPACE // count
+
+
+class Partition:
+    """
+    A replica's [hash_start, hash_end) slice of users.
+
+    Queries filter on users.uid_hash with these bounds so the replica reads only
+    its own users; calling the partition with a user ID tells whether it is in it.
+    """
+
+    def __init__(self, hash_start, hash_end):
+        self.hash_start = hash_start
+        self.hash_end = hash_end
+
+    def __call__(self, user_id):
+        return self.hash_start <= uid_hash(user_id) < self.hash_end
+
+
+class InMemoryLeaseStore:
+    """
+    Lease and replica registry held in process memory.
+
+    Share one instance between several JobCoordinators to run multiple
+    "replicas" locally; `clock` can be replaced to step time by hand.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._leases = {}
+        self._replicas = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name, holder, ttl):
+        with self._lock:
+            now = self.clock()
+            current = self._leases.get(name)
+            if current is not None and current[0] != holder and current[1] > now:
+                return False
+            self._leases[name] = (holder, now + ttl)
+            return True
+
+    def release(self, name, holder):
+        with self._lock:
+            current = self._leases.get(name)
+            if current is not None and current[0] == holder:
+                del self._leases[name]
+
+    def heartbeat(self, replica_id, ttl):
+        with self._lock:
+            now = self.clock()
+            self._replicas[replica_id] = now + ttl
+            return sorted(r for r, expires_at in self._replicas.items() if expires_at > now)
+
+    def leave(self, replica_id):
+        with self._lock:
+            self._replicas.pop(replica_id, None)
+
+
+class SupabaseLeaseStore:
+    """Leases and replica registry in Supabase, using the functions in sql/scheduler_leases.sql"""
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def acquire(self, name, holder, ttl):
+        result = self.supabase.rpc('try_acquire_lease', {
+            'p_name': name, 'p_holder': holder, 'p_ttl_seconds': ttl
+        }).execute()
+        return bool(result.data)
+
+    def release(self, name, holder):
+        self.supabase.rpc('release_lease', {'p_name': name, 'p_holder': holder}).execute()
+
+    def heartbeat(self, replica_id, ttl):
+        result = self.supabase.rpc('scheduler_heartbeat', {
+            'p_replica_id': replica_id, 'p_ttl_seconds': ttl
+        }).execute()
+        return sorted(row['replica_id'] for row in (result.data or []))
+
+    def leave(self, replica_id):
+        self.supabase.table('scheduler_replicas').delete().eq('replica_id', replica_id).execute()
+
+
+def make_lease_store(supabase, kind=SCHEDULER_LEASE_STORE):
+    if kind == 'memory':
+        return InMemoryLeaseStore()
+    if kind == 'supabase':
+        return SupabaseLeaseStore(supabase)
+    raise ValueError(f"Unknown lease store: {kind}")
+
+
+class JobCoordinator:
+    """
+    Decides whether, and for which users, this replica runs a scheduled job.
+
+    In partitioned mode the replicas' views of the membership can disagree for
+    up to one TTL after a replica joins or leaves, so a user may be processed
+    twice, or missed until the next full reconciliation. Both are harmless
+    because every write is recomputed from the stored lists.
+    """
+
+    def __init__(self, store=None, mode=SCHEDULER_MODE, replica_id=REPLICA_ID, lease_ttl=LEASE_TTL_SECONDS):
+        if mode not in MODES:
+            raise ValueError(f"Unknown scheduler mode: {mode}")
+        if mode != 'local' and store is None:
+            raise ValueError(f"Scheduler mode '{mode}' needs a lease store")
+        self.store = store
+        self.mode = mode
+        self.replica_id = replica_id
+        self.lease_ttl = lease_ttl
+        self.partition = None
+        # Jobs sharing a lease in this process run one after another, so one of
+        # them cannot release the lease while the other is still running
+        self._local_lock = threading.Lock()
+        self.runs = 0
+        self.skipped = 0
+        self.renewal_failures = 0
+
+    def _keep_alive(self, renew):
+        """Call renew() every third of the TTL until the returned event is set"""
+        done = threading.Event()
+
+        def loop():
+            while not done.wait(self.lease_ttl / 3):
+                try:
+                    if renew() is False:
+                        self.renewal_failures += 1
+                        print(f"Replica {self.replica_id} lost its lease while running")
+                except Exception as e:
+                    self.renewal_failures += 1
+                    print(f"Lease renewal failed: {str(e)}")
+
+        threading.Thread(target=loop, name="scheduler-lease-renewal", daemon=True).start()
+        return done
+
+    def run(self, name, job):
+        """
+        Run job(owns) if this replica should run `name` now
+
+        `owns` is None when the job covers every user, otherwise the Partition
+        of users this replica handles.
+
+        Returns:
+            The job's return value, or None when this replica skipped the run
+        """
+        if self.mode == 'local':
+            self.runs += 1
+            return job(None)
+
+        if self.mode == 'lease':
+            with self._local_lock:
+                if not self.store.acquire(name, self.replica_id, self.lease_ttl):
+                    self.skipped += 1
+                    print(f"Skipping {name}: lease held by another replica")
+                    return None
+                done = self._keep_alive(lambda: self.store.acquire(name, self.replica_id, self.lease_ttl))
+                try:
+                    self.runs += 1
+                    return job(None)
+                finally:
+                    done.set()
+                    self.store.release(name, self.replica_id)
+
+        members = self.store.heartbeat(self.replica_id, self.lease_ttl)
+        if self.replica_id not in members:
+            self.skipped += 1
+            print(f"Skipping {name}: replica {self.replica_id} is not registered")
+            return None
+
+        index = members.index(self.replica_id)
+        start, end = hash_range(index, len(members))
+        self.partition = {'index': index, 'replicas': len(members), 'hash_start': start, 'hash_end': end}
+        done = self._keep_alive(lambda: self.store.heartbeat(self.replica_id, self.lease_ttl))
+        try:
+            self.runs += 1
+            return job(Partition(start, end))
+        finally:
+            done.set()
+
+    def leave(self):
+        """Drop out of the partition membership (on shutdown)"""
+        if self.mode == 'partitioned':
+            self.store.leave(self.replica_id)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'replica_id': self.replica_id,
+            'lease_ttl': self.lease_ttl,
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'renewal_failures': self.renewal_failures,
+            'partition': self.partition,
+        }
@@ -0,0 +1,213 @@
+# job_metrics.py
+import os
+import time
+import threading
+from collections import deque
+
+# Upper bounds (seconds) of the duration histogram buckets
+DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 15, 30, 45, 60, 120, 300, 600)
+# Runs kept per job for the rolling histogram on /scheduler/status
+JOB_METRICS_WINDOW = int(os.getenv("JOB_METRICS_WINDOW", "100"))
+
+COUNTER_FIELDS = ('users_scanned', 'users_updated', 'write_errors')
+
+
+class _JobRun:
+    """Handle for one run; the job reports its counters through it"""
+
+    def __init__(self):
+        self.stats = {}
+        self.skipped = False
+
+    def update(self, stats):
+        self.stats.update(stats)
+
+    def skip(self):
+        self.skipped = True
+
+
+class _JobSeries:
+    def __init__(self, interval_seconds, window):
+        self.interval_seconds = interval_seconds
+        self.durations = deque(maxlen=window)
+        self.bucket_counts = [0] * len(DURATION_BUCKETS)
+        self.duration_sum = 0.0
+        self.duration_count = 0
+        self.runs = {'ok': 0, 'error': 0, 'skipped': 0}
+        self.running = False
+        self.last = {
+            'start': None, 'finish': None, 'duration': None, 'status': None, 'error': None,
+            'users_scanned': None, 'users_updated': None, 'write_errors': None,
+        }
+
+
+class JobMetrics:
+    """
+    Per-job runtime telemetry for the scheduled jobs.
+
+    Each job keeps its last run (start, finish, duration, user counters), run
+    counts by outcome, a cumulative duration histogram for Prometheus and a
+    rolling window of recent durations for /scheduler/status.
+    """
+
+    def __init__(self, window=JOB_METRICS_WINDOW):
+        self.window = window
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def register(self, job_id, interval_seconds=None):
+        """Declare a job up front so it is reported before its first run"""
+        with self._lock:
+            if job_id not in self._jobs:
+                self._jobs[job_id] = _JobSeries(interval_seconds, self.window)
+            elif interval_seconds is not None:
+                self._jobs[job_id].interval_seconds = interval_seconds
+
+    def _series(self, job_id):
+        series = self._jobs.get(job_id)
+        if series is None:
+            series = self._jobs[job_id] = _JobSeries(None, self.window)
+        return series
+
+    def track(self, job_id):
+        """Context manager recording one run of job_id; exceptions are recorded and re-raised"""
+        return _Tracker(self, job_id)
+
+    def _start(self, job_id):
+        with self._lock:
+            self._series(job_id).running = True
+
+    def _finish(self, job_id, run, started, duration, error):
+        with self._lock:
+            series = self._series(job_id)
+            series.running = False
+            if run.skipped and error is None:
+                series.runs['skipped'] += 1
+                return
+
+            status = 'error' if error is not None or run.stats.get('write_errors') else 'ok'
+            series.runs[status] += 1
+            series.last.update({
+                'start': started,
+                'finish': time.time(),
+                'duration': duration,
+                'status': status,
+                'error': str(error) if error is not None else None,
+            })
+            for field in COUNTER_FIELDS:
+                series.last[field] = run.stats.get(field)
+
+            series.durations.append(duration)
+            series.duration_sum += duration
+            series.duration_count += 1
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    series.bucket_counts[i] += 1
+
+    def snapshot(self):
+        """Per-job telemetry for /scheduler/status"""
+        with self._lock:
+            jobs = {}
+            for job_id, series in self._jobs.items():
+                durations = sorted(series.durations)
+                # Cumulative like the Prometheus histogram: le_X counts runs of at most X seconds
+                histogram = {f"le_{bound}": sum(1 for d in durations if d <= bound) for bound in DURATION_BUCKETS}
+                histogram['le_inf'] = len(durations)
+
+                jobs[job_id] = {
+                    'running': series.running,
+                    'interval_seconds': series.interval_seconds,
+                    'last_run': dict(series.last),
+                    'runs': dict(series.runs),
+                    'recent_durations': {
+                        'window': len(durations),
+                        'max_window': self.window,
+                        'p50': _percentile(durations, 0.5),
+                        'p95': _percentile(durations, 0.95),
+                        'max': durations[-1] if durations else None,
+                        'histogram': histogram,
+                    },
+                    # Above 1.0 the job no longer fits between two scheduled runs
+                    'cadence_utilisation': _utilisation(series),
+                }
+            return jobs
+
+    def prometheus(self):
+        """All job metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+
+        with self._lock:
+            jobs = sorted(self._jobs.items())
+            metric('scheduler_job_runs_total', 'counter', 'Completed runs by outcome',
+                   [({'job': job_id, 'status': status}, count) for job_id, series in jobs for status, count in series.runs.items()])
+            metric('scheduler_job_running', 'gauge', 'Whether the job is running now',
+                   [({'job': job_id}, int(series.running)) for job_id, series in jobs])
+            metric('scheduler_job_last_start_timestamp_seconds', 'gauge', 'Start time of the last run',
+                   [({'job': job_id}, series.last['start']) for job_id, series in jobs])
+            metric('scheduler_job_last_finish_timestamp_seconds', 'gauge', 'Finish time of the last run',
+                   [({'job': job_id}, series.last['finish']) for job_id, series in jobs])
+            metric('scheduler_job_last_duration_seconds', 'gauge', 'Duration of the last run',
+                   [({'job': job_id}, series.last['duration']) for job_id, series in jobs])
+            for field in COUNTER_FIELDS:
+                metric(f'scheduler_job_last_{field}', 'gauge', f'{field.replace("_", " ").capitalize()} in the last run',
+                       [({'job': job_id}, series.last[field]) for job_id, series in jobs])
+            metric('scheduler_job_interval_seconds', 'gauge', 'Configured time between runs',
+                   [({'job': job_id}, series.interval_seconds) for job_id, series in jobs])
+            metric('scheduler_job_cadence_utilisation', 'gauge', 'Last run duration divided by the run interval',
+                   [({'job': job_id}, _utilisation(series)) for job_id, series in jobs])
+
+            lines.append("# HELP scheduler_job_duration_seconds Run duration")
+            lines.append("# TYPE scheduler_job_duration_seconds histogram")
+            for job_id, series in jobs:
+                # bucket_counts are already cumulative (a run counts towards every bound above it)
+                for bound, count in zip(DURATION_BUCKETS, series.bucket_counts):
+                    lines.append(f'scheduler_job_duration_seconds_bucket{{job="{job_id}",le="{bound}"}} {count}')
+                lines.append(f'scheduler_job_duration_seconds_bucket{{job="{job_id}",le="+Inf"}} {series.duration_count}')
+                lines.append(f'scheduler_job_duration_seconds_sum{{job="{job_id}"}} {_format_value(series.duration_sum)}')
+                lines.append(f'scheduler_job_duration_seconds_count{{job="{job_id}"}} {series.duration_count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class _Tracker:
+    def __init__(self, metrics, job_id):
+        self.metrics = metrics
+        self.job_id = job_id
+        self.run = _JobRun()
+
+    def __enter__(self):
+        self.metrics._start(self.job_id)
+        self._started_at = time.time()
+        self._started = time.perf_counter()
+        return self.run
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics._finish(self.job_id, self.run, self._started_at, time.perf_counter() - self._started, exc)
+        return False
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _utilisation(series):
+    if not series.interval_seconds or series.last['duration'] is None:
+        return None
+    return round(series.last['duration'] / series.interval_seconds, 3)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
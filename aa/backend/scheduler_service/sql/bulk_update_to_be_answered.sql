@@ -0,0 +1,18 @@
+-- Used by scheduler_service (USER_WRITE_METHOD=rpc, the default). Update-only: users missing here are skipped, never inserted.
+-- updates: [{"UID": "<uuid>", "to_be_answered_surveys": [...]}, ...]
+create or replace function bulk_update_to_be_answered(updates jsonb)
+returns integer
+language sql
+as $$
+  with rows as (
+    select (item->>'UID')::uuid as uid, item->'to_be_answered_surveys' as to_be_answered
+    from jsonb_array_elements(updates) as item
+  ), updated as (
+    update users
+    set to_be_answered_surveys = rows.to_be_answered
+    from rows
+    where users."UID" = rows.uid
+    returning 1
+  )
+  select count(*)::integer from updated;
+$$;
@@ -0,0 +1,48 @@
+-- Used by scheduler_service when SCHEDULER_MODE=lease or SCHEDULER_MODE=partitioned.
+-- Expiry times come from the database clock so replicas never compare their own clocks.
+
+create table if not exists scheduler_leases (
+  name text primary key,
+  holder text not null,
+  expires_at timestamptz not null
+);
+
+create table if not exists scheduler_replicas (
+  replica_id text primary key,
+  expires_at timestamptz not null
+);
+
+-- Take (or extend) a lease; true when p_holder holds it afterwards
+create or replace function try_acquire_lease(p_name text, p_holder text, p_ttl_seconds double precision)
+returns boolean
+language sql
+as $$
+  with acquired as (
+    insert into scheduler_leases (name, holder, expires_at)
+    values (p_name, p_holder, now() + make_interval(secs => p_ttl_seconds))
+    on conflict (name) do update
+      set holder = excluded.holder, expires_at = excluded.expires_at
+      where scheduler_leases.holder = excluded.holder or scheduler_leases.expires_at < now()
+    returning 1
+  )
+  select exists (select 1 from acquired);
+$$;
+
+create or replace function release_lease(p_name text, p_holder text)
+returns void
+language sql
+as $$
+  delete from scheduler_leases where name = p_name and holder = p_holder;
+$$;
+
+-- Register/refresh a replica and return every live replica
+create or replace function scheduler_heartbeat(p_replica_id text, p_ttl_seconds double precision)
+returns table (replica_id text)
+language sql
+as $$
+  insert into scheduler_replicas (replica_id, expires_at)
+  values (p_replica_id, now() + make_interval(secs => p_ttl_seconds))
+  on conflict (replica_id) do update set expires_at = excluded.expires_at;
+
+  select r.replica_id from scheduler_replicas r where r.expires_at > now() order by r.replica_id;
+$$;
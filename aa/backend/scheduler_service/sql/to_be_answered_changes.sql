@@ -0,0 +1,63 @@
+-- Used by scheduler_service's incremental update_user_surveys job (run users_uid_hash.sql first).
+
+-- When a user's answered surveys last changed (or the user was created). The job
+-- only reads users changed since its previous run; writes to to_be_answered_surveys
+-- alone do not touch it, so the job's own writes do not show up as changes.
+alter table users add column if not exists lists_changed_at timestamptz;
+create index if not exists users_lists_changed_at on users (lists_changed_at);
+
+create or replace function touch_lists_changed_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.lists_changed_at := clock_timestamp();
+  return new;
+end;
+$$;
+
+drop trigger if exists users_lists_changed_at on users;
+create trigger users_lists_changed_at
+  before insert or update of answered_surveys on users
+  for each row execute function touch_lists_changed_at();
+
+-- Apply surveys added to / removed from the catalogue to every user's list inside
+-- the database, so a catalogue change does not make the job read the users table.
+-- Added surveys are appended in p_added order unless answered or already listed;
+-- removed ones are dropped. Only users whose list changes are written. With a hash
+-- range, only that replica's users (users_uid_hash.sql) are touched.
+drop function if exists apply_catalogue_changes(text[], text[]);
+create or replace function apply_catalogue_changes(
+  p_added text[], p_removed text[], p_hash_start bigint default null, p_hash_end bigint default null
+)
+returns integer
+language sql
+as $$
+  with computed as (
+    select u."UID" as uid,
+           coalesce(u.to_be_answered_surveys, '[]'::jsonb) as old_list,
+           (
+             select coalesce(jsonb_agg(entry.item order by entry.part, entry.ord), '[]'::jsonb)
+             from (
+               select stored.item, 0 as part, stored.ord
+               from jsonb_array_elements(coalesce(u.to_be_answered_surveys, '[]'::jsonb)) with ordinality as stored(item, ord)
+               where not coalesce(stored.item->>'survey_id' = any(p_removed), false)
+               union all
+               select jsonb_build_object('survey_id', added.survey_id), 1, added.ord
+               from unnest(p_added) with ordinality as added(survey_id, ord)
+               where not coalesce(u.to_be_answered_surveys, '[]'::jsonb) @> jsonb_build_array(jsonb_build_object('survey_id', added.survey_id))
+                 and not coalesce(u.answered_surveys, '[]'::jsonb) @> jsonb_build_array(jsonb_build_object('survey_id', added.survey_id))
+             ) as entry
+           ) as new_list
+    from users u
+    where (p_hash_start is null or u.uid_hash >= p_hash_start)
+      and (p_hash_end is null or u.uid_hash < p_hash_end)
+  ), updated as (
+    update users
+    set to_be_answered_surveys = computed.new_list
+    from computed
+    where users."UID" = computed.uid and computed.new_list is distinct from computed.old_list
+    returning 1
+  )
+  select count(*)::integer from updated;
+$$;
@@ -0,0 +1,8 @@
+-- Used by scheduler_service when SCHEDULER_MODE=partitioned (and by apply_catalogue_changes,
+-- so run this before to_be_answered_changes.sql).
+-- Stable 32-bit hash of a user's UID, identical to job_leases.uid_hash(): the first
+-- 8 hex digits of sha256(UID). Each replica reads only users whose hash falls in its
+-- own [start, end) range, so N replicas together read the users table once.
+alter table users add column if not exists uid_hash bigint
+  generated always as (('x' || left(encode(sha256("UID"::text::bytea), 'hex'), 8))::bit(32)::bigint) stored;
+create index if not exists users_uid_hash on users (uid_hash);
@@ -0,0 +1,112 @@
+# survey_diff.py
+"""
+Set/bitmap engine for "which surveys has this user not answered yet".
+
+Every survey in the catalogue gets an integer index, and a user's answered or
+open surveys are stored as a bitmap (a Python int with one bit per survey). The
+open surveys are then `catalogue & ~answered`, and the change since the last
+result is `new ^ old`. Both are word-level operations instead of one list search
+per (user, survey) pair, and a diff only costs as much as the surveys that
+actually changed.
+"""
+from itertools import compress
+
+# Maps b'0'/b'1' to 0/1 so a binary string can drive itertools.compress
+_BIT_TABLE = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def _popcount(mask):
+    return bin(mask).count('1')
+
+
+class SurveyDifferenceEngine:
+    """
+    Computes open (to-be-answered) surveys for users against a fixed catalogue.
+
+    Args:
+        survey_ids (list): The survey catalogue, in the order results should use
+        use_bitmaps (bool): Use integer bitmaps (default) or plain hashed sets
+    """
+
+    def __init__(self, survey_ids, use_bitmaps=True):
+        self.survey_ids = list(dict.fromkeys(survey_ids))
+        self.survey_set = set(self.survey_ids)
+        self.index = {survey_id: i for i, survey_id in enumerate(self.survey_ids)}
+        self.all_mask = (1 << len(self.survey_ids)) - 1
+        self.use_bitmaps = use_bitmaps
+
+    def mask(self, survey_ids):
+        """Bitmap of the given surveys (IDs outside the catalogue are ignored)"""
+        mask = 0
+        index = self.index
+        for survey_id in survey_ids:
+            i = index.get(survey_id)
+            if i is not None:
+                mask |= 1 << i
+        return mask
+
+    def ids(self, mask):
+        """Survey IDs set in a bitmap, in catalogue order"""
+        if not mask:
+            return []
+        survey_ids = self.survey_ids
+        # Bit i of the mask is character i of the reversed binary string
+        bits = bin(mask)[:1:-1]
+        if bits.count('1') * 8 > len(bits):
+            return list(compress(survey_ids, bits.encode().translate(_BIT_TABLE)))
+        # Sparse masks (typically diffs): jump straight to the set bits
+        result = []
+        i = bits.find('1')
+        while i != -1:
+            result.append(survey_ids[i])
+            i = bits.find('1', i + 1)
+        return result
+
+    def open_mask(self, answered):
+        """Bitmap of catalogue surveys not in `answered` (an iterable of survey IDs)"""
+        return self.all_mask & ~self.mask(answered)
+
+    def to_be_answered(self, answered):
+        """
+        Catalogue surveys the user has not answered yet
+
+        Args:
+            answered (iterable): Survey IDs the user has answered
+
+        Returns:
+            list: Open survey IDs in catalogue order
+        """
+        if self.use_bitmaps:
+            return self.ids(self.open_mask(answered))
+        answered = answered if isinstance(answered, (set, frozenset)) else set(answered)
+        return [survey_id for survey_id in self.survey_ids if survey_id not in answered]
+
+    def diff(self, previous_mask, current_mask):
+        """
+        Surveys that appeared in / disappeared from a user's open set
+
+        Returns:
+            tuple: (added survey IDs, removed survey IDs)
+        """
+        return self.ids(current_mask & ~previous_mask), self.ids(previous_mask & ~current_mask)
+
+    def compute(self, users, previous=None):
+        """
+        Open surveys for many users at once
+
+        Args:
+            users (iterable): (user_id, answered survey IDs) pairs
+            previous (dict, optional): user_id -> open bitmap from an earlier compute()
+
+        Returns:
+            dict: user_id -> {'mask', 'count'} plus 'added'/'removed' survey IDs when
+                  `previous` is given (users missing from `previous` diff against nothing)
+        """
+        results = {}
+        for user_id, answered in users:
+            mask = self.open_mask(answered)
+            result = {'mask': mask, 'count': _popcount(mask)}
+            if previous is not None:
+                result['added'], result['removed'] = self.diff(previous.get(user_id, 0), mask)
+            results[user_id] = result
+        return results
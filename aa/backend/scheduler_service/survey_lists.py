@@ -0,0 +1,199 @@
+# survey_lists.py
+import time
+import threading
+
+from survey_diff import SurveyDifferenceEngine
+from user_writes import BulkUserWriter
+
+PAGE_SIZE = 1000
+# Mark before any change; users never changed since the migration have a NULL lists_changed_at
+NO_CHANGES = '-infinity'
+
+
+def answered_survey_ids(user):
+    """Set of survey IDs in a user's answered_surveys column"""
+    return {item['survey_id'] for item in (user.get('answered_surveys') or []) if 'survey_id' in item}
+
+
+def compute_to_be_answered(engine, answered, stored):
+    """
+    Merge a user's stored to-be-answered list with the survey catalogue
+
+    Entries that are still open keep their position (and any extra fields such as
+    timestamps), entries for answered or deleted surveys are dropped, and surveys
+    the user has never seen are appended in catalogue order.
+
+    Args:
+        engine (SurveyDifferenceEngine): Engine built over the current catalogue
+        answered (set): Survey IDs the user has answered
+        stored (list): The user's current to_be_answered_surveys value
+
+    Returns:
+        list: The new to_be_answered_surveys value
+    """
+    open_mask = engine.open_mask(answered)
+    index = engine.index
+    kept = []
+    kept_mask = 0
+    for item in stored:
+        i = index.get(item.get('survey_id'))
+        if i is None:
+            continue
+        bit = 1 << i
+        if open_mask & bit and not kept_mask & bit:
+            kept.append(item)
+            kept_mask |= bit
+
+    additions = [{'survey_id': survey_id} for survey_id in engine.ids(open_mask & ~kept_mask)]
+    return kept + additions
+
+
+def _latest(current, value):
+    """Later of two timestamptz strings from PostgREST (same offset, so text order is time order)"""
+    if value is None:
+        return current
+    return value if current is None or value > current else current
+
+
+class ToBeAnsweredUpdater:
+    """
+    Keeps every user's to_be_answered_surveys in line with the survey catalogue.
+
+    run(full=True) reads and recomputes every user. run(full=False) is
+    incremental and reads only what changed since the previous run:
+    surveys added to or removed from the catalogue are applied to every list
+    inside the database (apply_catalogue_changes), and only users whose
+    answered surveys changed since the high-water mark (lists_changed_at,
+    sql/to_be_answered_changes.sql) are read and recomputed. In both modes a
+    user is only written when the computed list differs from the stored one.
+    """
+
+    def __init__(self, supabase, writer=None):
+        self.supabase = supabase
+        self.writer = writer or BulkUserWriter(supabase)
+        # High-water marks from the previous runs
+        self.known_survey_ids = None
+        self.known_survey_order = []
+        # lists_changed_at marks of the last two runs. Reading from the older one
+        # re-reads one run's worth of users, so a change whose transaction
+        # committed after a run, with an earlier timestamp, is still picked up.
+        self.change_marks = (NO_CHANGES, NO_CHANGES)
+        self._lock = threading.Lock()
+
+    def fetch_catalogue(self):
+        """All survey IDs in a stable order"""
+        survey_ids = []
+        last_id = None
+        while True:
+            query = self.supabase.table('surveys').select("survey_id").order('survey_id').limit(PAGE_SIZE)
+            if last_id is not None:
+                query = query.gt('survey_id', last_id)
+            page = query.execute().data or []
+            survey_ids.extend(survey["survey_id"] for survey in page)
+            if len(page) < PAGE_SIZE:
+                return survey_ids
+            last_id = page[-1]["survey_id"]
+
+    def iter_users(self, changed_after=None, partition=None):
+        """
+        Page through users with the columns needed to compute their lists
+
+        Args:
+            changed_after (str, optional): Only users whose lists_changed_at is later
+            partition (Partition, optional): Only users in this uid_hash range
+        """
+        last_uid = None
+        while True:
+            query = self.supabase.table('users').select(
+                "UID,answered_surveys,to_be_answered_surveys,lists_changed_at"
+            ).order('UID').limit(PAGE_SIZE)
+            if changed_after is not None:
+                query = query.gt('lists_changed_at', changed_after)
+            if partition is not None:
+                query = query.gte('uid_hash', partition.hash_start).lt('uid_hash', partition.hash_end)
+            if last_uid is not None:
+                query = query.gt('UID', last_uid)
+            page = query.execute().data or []
+            yield from page
+            if len(page) < PAGE_SIZE:
+                return
+            last_uid = page[-1]["UID"]
+
+    def apply_catalogue_changes(self, added, removed, partition=None):
+        """Add/remove surveys in every user's (or the partition's) list inside the database; returns users updated"""
+        params = {'p_added': added, 'p_removed': removed}
+        if partition is not None:
+            params.update(p_hash_start=partition.hash_start, p_hash_end=partition.hash_end)
+        result = self.supabase.rpc('apply_catalogue_changes', params).execute()
+        return result.data or 0
+
+    def run(self, full=False, owns=None):
+        """
+        Recompute to-be-answered lists
+
+        Args:
+            full (bool): Recompute every user instead of only the affected ones
+            owns (Partition, optional): This replica's partition; only users in its
+                uid_hash range are read and written, other users are left alone
+
+        Returns:
+            dict: Counters describing the run
+        """
+        with self._lock:
+            started = time.perf_counter()
+            self.writer.reset()
+            catalogue = self.fetch_catalogue()
+            engine = SurveyDifferenceEngine(catalogue)
+            catalogue_set = engine.survey_set
+
+            full = full or self.known_survey_ids is None
+            previous_survey_ids = self.known_survey_ids or set()
+            added = [survey_id for survey_id in catalogue if survey_id not in previous_survey_ids]
+            removed = [survey_id for survey_id in self.known_survey_order if survey_id not in catalogue_set]
+
+            stats = {
+                'mode': 'full' if full else 'incremental',
+                'surveys': len(catalogue),
+                'new_surveys': len(added) if self.known_survey_ids is not None else 0,
+                'removed_surveys': len(removed),
+                'users_scanned': 0,
+                'users_recomputed': 0,
+                'users_updated': 0,
+                'catalogue_users_updated': 0,
+            }
+
+            if not full and (added or removed):
+                stats['catalogue_users_updated'] = self.apply_catalogue_changes(added, removed, owns)
+
+            older_mark, last_mark = self.change_marks
+            mark = last_mark
+            pending = []
+            for user in self.iter_users(changed_after=None if full else older_mark, partition=owns):
+                user_id = user["UID"]
+                mark = _latest(mark, user.get('lists_changed_at'))
+                stats['users_scanned'] += 1
+                stats['users_recomputed'] += 1
+                stored = user.get('to_be_answered_surveys') or []
+                to_be_answered = compute_to_be_answered(engine, answered_survey_ids(user), stored)
+                if to_be_answered == stored:
+                    continue
+
+                pending.append((user_id, to_be_answered))
+                if len(pending) >= self.writer.buffer_size:
+                    self.writer.write(pending)
+                    pending = []
+
+            self.writer.write(pending)
+            stats.update(self.writer.stats())
+            stats['users_updated'] = self.writer.rows_written + stats['catalogue_users_updated']
+            stats['seconds'] = round(time.perf_counter() - started, 3)
+
+            # The catalogue mark always advances: catalogue changes were applied in full
+            self.known_survey_ids = catalogue_set
+            self.known_survey_order = catalogue
+            # The change mark only advances when every write succeeded, so users whose
+            # write failed in an incremental run are read again by the next one
+            # (after a full run they wait for the next reconciliation)
+            if not self.writer.failed_user_ids:
+                self.change_marks = (mark, mark) if full else (last_mark, mark)
+            return stats
@@ -0,0 +1,100 @@
+# user_writes.py
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from postgrest.types import ReturnMethod
+
+USER_WRITE_CHUNK_SIZE = int(os.getenv("USER_WRITE_CHUNK_SIZE", "500"))
+USER_WRITE_WORKERS = int(os.getenv("USER_WRITE_WORKERS", "4"))
+# "rpc" calls bulk_update_to_be_answered (sql/bulk_update_to_be_answered.sql), one UPDATE
+# per chunk; "update" sends one UPDATE per user for databases without the function.
+# Neither inserts, so a user deleted mid-run is not recreated.
+USER_WRITE_METHOD = os.getenv("USER_WRITE_METHOD", "rpc")
+
+
+class BulkUserWriter:
+    """
+    Writes to_be_answered_surveys for many users in multi-row chunks.
+
+    Chunks are sent concurrently by at most `max_workers` threads. Counters for
+    the current run are kept until reset() is called.
+    """
+
+    def __init__(self, supabase, chunk_size=USER_WRITE_CHUNK_SIZE, max_workers=USER_WRITE_WORKERS, method=USER_WRITE_METHOD):
+        if method not in ('rpc', 'update'):
+            raise ValueError(f"Unknown write method: {method}")
+        self.supabase = supabase
+        self.chunk_size = max(1, chunk_size)
+        self.max_workers = max(1, max_workers)
+        self.method = method
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear the per-run counters"""
+        self.rows_written = 0
+        self.chunks_written = 0
+        self.failed_rows = 0
+        self.failed_user_ids = []
+        self.errors = []
+        self.write_seconds = 0.0
+
+    def _write_chunk(self, rows):
+        if self.method == 'rpc':
+            self.supabase.rpc('bulk_update_to_be_answered', {'updates': rows}).execute()
+        else:
+            for row in rows:
+                self.supabase.table('users').update(
+                    {'to_be_answered_surveys': row['to_be_answered_surveys']}, returning=ReturnMethod.minimal
+                ).eq('UID', row['UID']).execute()
+
+    def _send(self, rows):
+        try:
+            self._write_chunk(rows)
+        except Exception as e:
+            with self._lock:
+                self.failed_rows += len(rows)
+                self.failed_user_ids.extend(row['UID'] for row in rows)
+                self.errors.append(str(e))
+            print(f"Bulk write of {len(rows)} users failed: {str(e)}")
+            return
+        with self._lock:
+            self.rows_written += len(rows)
+            self.chunks_written += 1
+
+    def write(self, updates):
+        """
+        Write a batch of updates
+
+        Args:
+            updates (list): (user_id, to_be_answered_surveys) pairs
+        """
+        if not updates:
+            return
+
+        rows = [{'UID': user_id, 'to_be_answered_surveys': to_be_answered} for user_id, to_be_answered in updates]
+        chunks = [rows[i:i + self.chunk_size] for i in range(0, len(rows), self.chunk_size)]
+
+        start = time.perf_counter()
+        if len(chunks) == 1:
+            self._send(chunks[0])
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+                list(executor.map(self._send, chunks))
+        self.write_seconds += time.perf_counter() - start
+
+    @property
+    def buffer_size(self):
+        """Updates worth buffering before a write, enough to keep every worker busy"""
+        return self.chunk_size * self.max_workers
+
+    def stats(self):
+        return {
+            'method': self.method,
+            'rows_written': self.rows_written,
+            'chunks_written': self.chunks_written,
+            'failed_rows': self.failed_rows,
+            'write_errors': len(self.errors),
+            'write_seconds': round(self.write_seconds, 3),
+        }
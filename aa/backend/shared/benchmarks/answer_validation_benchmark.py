@@ -0,0 +1,137 @@
+# shared/benchmarks/answer_validation_benchmark.py
+"""
+Measure the cost of validating one survey submission.
+
+Usage (with the shared package installed, e.g. `pip install -e .`):
+    python benchmarks/answer_validation_benchmark.py [--questions 20] [--submissions 20000]
+
+Strategies:
+    cached     compile_survey() cache hit plus clean_answers() (the service path:
+               flow checks and value checks)
+    cold       CompiledSurvey built from the survey on every submission
+    values     only the compiled per-question value checks
+    interpret  the same value checks, re-reading settings from the question dicts
+               for every answer (no compilation)
+"""
+import argparse
+import random
+import re
+import time
+import uuid
+from datetime import date
+
+from shared.cache import LRUCache
+from shared.conditional_logic import CompiledSurvey, compile_survey
+
+QUESTION_TYPES = ['SHORT_TEXT', 'SINGLE_CHOICE', 'MULTIPLE_CHOICE', 'RATING', 'YES_NO', 'EMAIL', 'DATE', 'LONG_TEXT']
+OPTIONS = ['Option 1', 'Option 2', 'Option 3', 'Option 4', 'Option 5']
+
+
+def make_survey(questions):
+    return {
+        'survey_id': str(uuid.uuid4()),
+        'version': 1,
+        'conditional_logic': {},
+        'questions': [
+            {
+                'id': f"q{i + 1}",
+                'type': QUESTION_TYPES[i % len(QUESTION_TYPES)],
+                'options': OPTIONS,
+                'scale': 5,
+                'maxSelections': 3,
+                'validation': {'required': True, 'maxLength': 500, 'minDate': '2020-01-01'},
+            }
+            for i in range(questions)
+        ],
+    }
+
+
+def make_answers(survey, rng):
+    answers = []
+    for question in survey['questions']:
+        question_type = question['type']
+        if question_type == 'SINGLE_CHOICE':
+            response = rng.choice(OPTIONS)
+        elif question_type == 'MULTIPLE_CHOICE':
+            response = rng.sample(OPTIONS, rng.randint(1, 3))
+        elif question_type == 'RATING':
+            response = rng.randint(1, 5)
+        elif question_type == 'YES_NO':
+            response = rng.choice(['yes', 'no'])
+        elif question_type == 'EMAIL':
+            response = f"user{rng.randint(1, 10**6)}@example.com"
+        elif question_type == 'DATE':
+            response = f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        else:
+            response = 'some free text answer ' * rng.randint(1, 5)
+        answers.append({'question_id': question['id'], 'response': response})
+    return answers
+
+
+def interpret(survey, answers):
+    """Baseline: the same checks, looking every setting up per answer"""
+    questions = {question['id']: question for question in survey['questions']}
+    errors = []
+    for answer in answers:
+        question = questions.get(answer['question_id'])
+        if question is None:
+            errors.append(f"{answer['question_id']} is not a question in this survey")
+            continue
+        response = answer['response']
+        question_type = question['type']
+        validation = question.get('validation') or {}
+        if question_type in ('SHORT_TEXT', 'LONG_TEXT'):
+            if not isinstance(response, str) or len(response) > int(validation.get('maxLength') or 10000):
+                errors.append(question['id'])
+        elif question_type == 'EMAIL':
+            if not re.match(r'^[^@\s]+@[^@\s]+\.[^@\s]+$', response):
+                errors.append(question['id'])
+        elif question_type == 'SINGLE_CHOICE':
+            if response not in question['options']:
+                errors.append(question['id'])
+        elif question_type == 'MULTIPLE_CHOICE':
+            if any(item not in question['options'] for item in response) or len(response) > int(question['maxSelections']):
+                errors.append(question['id'])
+        elif question_type == 'RATING':
+            if not 1 <= response <= int(question['scale']):
+                errors.append(question['id'])
+        elif question_type == 'YES_NO':
+            if str(response).lower() not in ('yes', 'no'):
+                errors.append(question['id'])
+        elif question_type == 'DATE':
+            if date.fromisoformat(response) < date.fromisoformat(validation['minDate']):
+                errors.append(question['id'])
+    return errors
+
+
+def run(label, validate, submissions):
+    start = time.perf_counter()
+    for answers in submissions:
+        validate(answers)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {len(submissions) / elapsed:>12,.0f} submissions/s  ({elapsed * 1e6 / len(submissions):.1f} us each)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--submissions', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    survey = make_survey(args.questions)
+    submissions = [make_answers(survey, rng) for _ in range(args.submissions)]
+    cache = LRUCache(maxsize=16)
+    assert not compile_survey(survey, cache).clean_answers(submissions[0])[2]
+
+    print(f"{args.questions} questions, {args.submissions} submissions")
+    run('cached', lambda answers: compile_survey(survey, cache).clean_answers(answers), submissions)
+    run('cold', lambda answers: CompiledSurvey(survey['questions'], survey['conditional_logic']).clean_answers(answers), submissions)
+    compiled = compile_survey(survey, cache)
+    validators = dict(zip(compiled.ids, compiled.validators))
+    run('values', lambda answers: [validators[a['question_id']](a['response']) for a in answers], submissions)
+    run('interpret', lambda answers: interpret(survey, answers), submissions)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# shared/benchmarks/token_cache_benchmark.py
+"""
+Compare cached and uncached JWT verification throughput.
+
+Usage (with the shared package installed, e.g. `pip install -e .`):
+    python benchmarks/token_cache_benchmark.py [--tokens 20] [--iterations 100000]
+
+Each iteration verifies one of `--tokens` distinct tokens in round-robin order,
+which mimics a handful of active users firing several requests per page.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+
+from shared.auth import TokenCache
+
+SECRET = "benchmark-secret"
+
+
+def make_tokens(count):
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+    return [
+        jwt.encode({"sub": f"user-{i}", "exp": int(expires.timestamp())}, SECRET, algorithm="HS256")
+        for i in range(count)
+    ]
+
+
+def run(label, verify, tokens, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        verify(tokens[i % len(tokens)])
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {iterations / elapsed:>12,.0f} verifications/s  ({elapsed * 1e6 / iterations:.2f} us each)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    tokens = make_tokens(args.tokens)
+    cache = TokenCache(maxsize=max(args.tokens, 1))
+
+    uncached = run("uncached", lambda token: jwt.decode(token, SECRET, algorithms=["HS256"])["sub"], tokens, args.iterations)
+    cached = run("cached", lambda token: cache.verify(token, SECRET), tokens, args.iterations)
+
+    print(f"speedup    {uncached / cached:.1f}x")
+    print(f"cache      {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,12 @@ setup(
     version="0.1.0",
     packages=find_packages(),
     install_requires=[
-        "supabase",
+        # shared.clients overrides private supabase/postgrest session hooks and reads
+        # httpx's pool to report connections; upgrade these together after checking them
+        "supabase==2.15.1",
+        "postgrest==1.0.2",
+        "httpx[http2]==0.28.1",
         "pyjwt",
+        "python-dotenv",
     ],
 )
\ No newline at end of file
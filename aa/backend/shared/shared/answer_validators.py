@@ -0,0 +1,160 @@
+# shared/shared/answer_validators.py
+import os
+import re
+import math
+from datetime import date
+
+# Cap for text answers whose question sets no maxLength
+ANSWER_MAX_TEXT_LENGTH = int(os.getenv("ANSWER_MAX_TEXT_LENGTH", "10000"))
+
+# Same shape the builder's email field accepts: something@something.tld
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def _int_setting(value):
+    """Builder settings arrive as ints, numeric strings or blanks; None when unusable"""
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _date_setting(value):
+    if isinstance(value, str) and DATE_PATTERN.match(value):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _text_validator(min_length, max_length):
+    def validate(response):
+        if not isinstance(response, str):
+            return "must be text"
+        if min_length is not None and len(response) < min_length:
+            return f"must be at least {min_length} characters"
+        if len(response) > max_length:
+            return f"must be at most {max_length} characters"
+        return None
+    return validate
+
+
+def _email_validator(check_format):
+    def validate(response):
+        if not isinstance(response, str):
+            return "must be text"
+        if len(response) > ANSWER_MAX_TEXT_LENGTH:
+            return f"must be at most {ANSWER_MAX_TEXT_LENGTH} characters"
+        if check_format and not EMAIL_PATTERN.match(response):
+            return "must be an email address"
+        return None
+    return validate
+
+
+def _single_choice_validator(options):
+    def validate(response):
+        if not isinstance(response, str):
+            return "must be one of the options"
+        if options and response not in options:
+            return f"{response!r} is not one of the options"
+        return None
+    return validate
+
+
+def _multiple_choice_validator(options, max_selections):
+    def validate(response):
+        if not isinstance(response, list) or not all(isinstance(item, str) for item in response):
+            return "must be a list of options"
+        if options:
+            unknown = [item for item in response if item not in options]
+            if unknown:
+                return f"{unknown[0]!r} is not one of the options"
+        if len(set(response)) != len(response):
+            return "selects an option more than once"
+        if max_selections is not None and len(response) > max_selections:
+            return f"selects more than {max_selections} options"
+        return None
+    return validate
+
+
+def _rating_validator(scale):
+    def validate(response):
+        if isinstance(response, bool) or not isinstance(response, (int, float)):
+            return "must be a number"
+        if not math.isfinite(response):
+            return "must be a finite number"
+        if response != int(response):
+            return "must be a whole number"
+        if response < 1 or (scale is not None and response > scale):
+            return f"must be between 1 and {scale}" if scale is not None else "must be at least 1"
+        return None
+    return validate
+
+
+def _yes_no_validator(response):
+    if isinstance(response, bool):
+        return None
+    if isinstance(response, str) and response.strip().lower() in ('yes', 'no'):
+        return None
+    return "must be yes or no"
+
+
+def _date_validator(min_date, max_date):
+    def validate(response):
+        if not isinstance(response, str) or not DATE_PATTERN.match(response):
+            return "must be a date (YYYY-MM-DD)"
+        try:
+            value = date.fromisoformat(response)
+        except ValueError:
+            return "must be a date (YYYY-MM-DD)"
+        if min_date and value < min_date:
+            return f"must be on or after {min_date.isoformat()}"
+        if max_date and value > max_date:
+            return f"must be on or before {max_date.isoformat()}"
+        return None
+    return validate
+
+
+def compile_answer_validator(question):
+    """
+    Build the check for one question's answers from its builder settings
+
+    Settings are read once here, so validating a submission only runs the
+    returned closures. Settings that cannot be used (e.g. a blank maxLength)
+    are ignored rather than rejected.
+
+    Args:
+        question (dict): Question as saved by the survey builder
+
+    Returns:
+        callable: response -> error message or None, or None for types without checks
+    """
+    question_type = question.get('type')
+    validation = question.get('validation') or {}
+    if question_type in ('SHORT_TEXT', 'LONG_TEXT'):
+        max_length = _int_setting(validation.get('maxLength'))
+        max_length = min(max_length, ANSWER_MAX_TEXT_LENGTH) if max_length and max_length > 0 else ANSWER_MAX_TEXT_LENGTH
+        min_length = _int_setting(validation.get('minLength'))
+        return _text_validator(min_length if min_length and min_length > 0 else None, max_length)
+    if question_type == 'EMAIL':
+        return _email_validator(validation.get('emailFormat') is not False)
+    if question_type == 'SINGLE_CHOICE':
+        return _single_choice_validator(frozenset(option for option in question.get('options') or [] if isinstance(option, str)))
+    if question_type == 'MULTIPLE_CHOICE':
+        max_selections = _int_setting(question.get('maxSelections'))
+        return _multiple_choice_validator(
+            frozenset(option for option in question.get('options') or [] if isinstance(option, str)),
+            max_selections if max_selections and max_selections > 0 else None
+        )
+    if question_type == 'RATING':
+        scale = _int_setting(question.get('scale'))
+        return _rating_validator(scale if scale and scale > 0 else None)
+    if question_type == 'YES_NO':
+        return _yes_no_validator
+    if question_type == 'DATE':
+        return _date_validator(_date_setting(validation.get('minDate')), _date_setting(validation.get('maxDate')))
+    return None
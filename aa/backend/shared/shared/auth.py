@@ -1,18 +1,136 @@
 import os
+import time
+import hmac
+import hashlib
+import functools
 import jwt
-from flask import jsonify
+from flask import jsonify, request
+
+from shared.cache import LRUCache
+
+# Verified tokens are remembered until their `exp` (or this many seconds if they have none)
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "4096"))
+JWT_CACHE_MAX_TTL = float(os.getenv("JWT_CACHE_MAX_TTL", "300"))
+# Shared secret that service-to-service calls send in the X-Service-Token header
+SERVICE_TOKEN = os.getenv("SERVICE_TOKEN")
+SERVICE_TOKEN_HEADER = "X-Service-Token"
+
+
+class TokenCache:
+    """
+    Bounded cache of verified JWT subjects keyed by a hash of the secret and token.
+    
+    Only successfully verified tokens are stored, and each entry expires with the
+    token itself, so a cache hit never outlives the token's validity.
+    """
+
+    def __init__(self, maxsize=JWT_CACHE_SIZE, max_ttl=JWT_CACHE_MAX_TTL):
+        self.max_ttl = max_ttl
+        self._cache = LRUCache(maxsize=maxsize)
+
+    @staticmethod
+    def _key(token, secret_key):
+        return hashlib.sha256(f"{secret_key}\0{token}".encode()).digest()
+
+    def verify(self, token, secret_key, algorithms=("HS256",)):
+        """
+        Verify a token, reusing an earlier verification when possible
+        
+        Args:
+            token (str): Encoded JWT
+            secret_key (str): Signing secret
+            algorithms (tuple): Accepted signing algorithms
+        
+        Returns:
+            str: The token's `sub` claim (None if the claim is missing)
+        
+        Raises:
+            jwt.ExpiredSignatureError: The token has expired
+            jwt.InvalidTokenError: The token is malformed or its signature is invalid
+        """
+        key = self._key(token, secret_key)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        decoded_token = jwt.decode(token, secret_key, algorithms=list(algorithms))
+        user_id = decoded_token.get("sub")
+
+        if user_id:
+            ttl = self.max_ttl
+            exp = decoded_token.get("exp")
+            if isinstance(exp, (int, float)):
+                ttl = min(ttl, exp - time.time())
+            if ttl > 0:
+                self._cache.set(key, user_id, ttl=ttl)
+
+        return user_id
+
+    def invalidate(self, token, secret_key):
+        """Forget a single token"""
+        return self._cache.invalidate(self._key(token, secret_key))
+
+    def clear(self):
+        """Forget every token"""
+        self._cache.clear()
+
+    def stats(self):
+        """Cache counters (size, hits, misses, evictions, hit_rate)"""
+        return self._cache.stats()
+
+
+# Process-wide cache shared by Auth and the services' own decode helpers
+token_cache = TokenCache()
+
+
+def verify_token(token, secret_key, cache=None):
+    """
+    Verify a HS256 token through the token cache
+    
+    Args:
+        token (str): Encoded JWT
+        secret_key (str): Signing secret
+        cache (TokenCache, optional): Defaults to the process-wide token_cache
+    
+    Returns:
+        str: The token's `sub` claim (None if the claim is missing)
+    
+    Raises:
+        jwt.ExpiredSignatureError, jwt.InvalidTokenError
+    """
+    return (cache or token_cache).verify(token, secret_key)
+
+
+def require_service_token(view):
+    """
+    Restrict an internal endpoint to callers holding SERVICE_TOKEN
+
+    Without a configured SERVICE_TOKEN every call is refused, so an internal
+    endpoint is never left open by a missing variable.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get(SERVICE_TOKEN_HEADER, '')
+        if not SERVICE_TOKEN or not hmac.compare_digest(token.encode(), SERVICE_TOKEN.encode()):
+            return jsonify({
+                'success': False,
+                'error': 'Service token missing or invalid'
+            }), 403
+        return view(*args, **kwargs)
+    return wrapper
+
 
 class Auth:
-    def __init__(self):
+    def __init__(self, cache=None):
         self.jwt_secret_key = os.getenv("JWT_SECRET_KEY")
         if not self.jwt_secret_key:
             raise ValueError("Missing JWT_SECRET_KEY")
+        self.token_cache = cache or token_cache
 
     def decode_token(self, token):
-        """Decodes and validates a JWT token"""
+        """Decodes and validates a JWT token, reusing cached verifications"""
         try:
-            decoded_token = jwt.decode(token, self.jwt_secret_key, algorithms=["HS256"])
-            user_id = decoded_token.get("sub")
+            user_id = self.token_cache.verify(token, self.jwt_secret_key)
             
             if not user_id:
                 return jsonify({
@@ -0,0 +1,134 @@
+# shared/shared/cache.py
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with optional per-entry time-to-live.
+
+    Entries are evicted least-recently-used first once `maxsize` is reached,
+    and are treated as missing once their expiry has passed. Expired entries
+    stay in place until evicted, so callers can revalidate them with get_stale().
+    """
+
+    def __init__(self, maxsize=256, ttl=None):
+        """
+        Args:
+            maxsize (int): Maximum number of entries kept (0 disables caching)
+            ttl (float, optional): Default time-to-live in seconds, None for no expiry
+        """
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Retrieve a cached value and mark it as recently used
+
+        Args:
+            key: Cache key
+            default: Value returned on a miss
+
+        Returns:
+            The cached value, or `default` if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key, default=None):
+        """
+        Retrieve a value even if it has expired, without touching the counters
+
+        Args:
+            key: Cache key
+            default: Value returned if nothing is stored under the key
+
+        Returns:
+            The stored value, or `default`
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else default
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value, evicting the least recently used entry if full
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl (float, optional): Overrides the default time-to-live for this entry
+        """
+        if self.maxsize == 0:
+            return
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Drop a single entry
+
+        Returns:
+            bool: True if an entry was removed
+        """
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Snapshot of the cache counters
+
+        Returns:
+            dict: size, maxsize, ttl, hits, misses, evictions and hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
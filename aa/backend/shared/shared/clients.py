@@ -0,0 +1,168 @@
+# shared/shared/clients.py
+import os
+import threading
+import httpx
+from postgrest import SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_TIMEOUT
+from postgrest.utils import SyncClient
+from supabase import Client
+from dotenv import load_dotenv
+
+# Load environment variables once per process
+load_dotenv()
+
+# Connection pool tuning for the PostgREST HTTP session
+POOL_MAX_CONNECTIONS = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30"))
+POOL_HTTP2 = os.getenv("SUPABASE_HTTP2", "1") == "1"
+
+
+class _PoolCounters:
+    """Session and request counters fed by httpx event hooks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sessions_created = 0
+        self.requests = 0
+        self.responses = 0
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+
+    def on_response(self, response):
+        with self._lock:
+            self.responses += 1
+
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    """
+    PostgREST client whose HTTP session uses the tuned keep-alive pool
+
+    supabase 2.15 has no public option for the HTTP client, so this overrides
+    create_session (and PooledSupabaseClient._init_postgrest_client) with the
+    signatures of the versions pinned in setup.py.
+    """
+
+    def __init__(self, base_url, counters=None, **kwargs):
+        # Set before the base constructor, which calls create_session
+        self.counters = counters
+        super().__init__(base_url, **kwargs)
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        event_hooks = {}
+        if self.counters is not None:
+            with self.counters._lock:
+                self.counters.sessions_created += 1
+            event_hooks = {'request': [self.counters.on_request], 'response': [self.counters.on_response]}
+
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=verify,
+            proxy=proxy,
+            follow_redirects=True,
+            http2=POOL_HTTP2,
+            limits=httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+            ),
+            event_hooks=event_hooks,
+        )
+
+
+class PooledSupabaseClient(Client):
+    """Supabase client that builds its PostgREST client through PooledPostgrestClient"""
+
+    def __init__(self, *args, **kwargs):
+        self.pool_counters = _PoolCounters()
+        super().__init__(*args, **kwargs)
+
+    def _init_postgrest_client(self, rest_url, headers, schema, timeout=DEFAULT_POSTGREST_CLIENT_TIMEOUT, verify=True, proxy=None):
+        return PooledPostgrestClient(
+            rest_url,
+            counters=self.pool_counters,
+            headers=headers,
+            schema=schema,
+            timeout=timeout,
+            verify=verify,
+            proxy=proxy,
+        )
+
+
+# Process-wide registry: one client (and one connection pool) per Supabase project
+_clients = {}
+_registry_lock = threading.Lock()
+
+
+def get_supabase_client(supabase_url=None, supabase_key=None):
+    """
+    Return the process-wide Supabase client, creating it on first use
+
+    Args:
+        supabase_url (str, optional): Defaults to the SUPABASE_URL environment variable
+        supabase_key (str, optional): Defaults to the SUPABASE_KEY environment variable
+
+    Returns:
+        Client: Shared client reused across blueprints and requests
+    """
+    supabase_url = supabase_url or os.getenv("SUPABASE_URL")
+    supabase_key = supabase_key or os.getenv("SUPABASE_KEY")
+
+    if not supabase_url or not supabase_key:
+        raise ValueError("Missing Supabase credentials")
+
+    key = (supabase_url, supabase_key)
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = PooledSupabaseClient.create(supabase_url, supabase_key)
+            _clients[key] = client
+        return client
+
+
+def _connection_stats(client):
+    """Open/idle connection counts of the client's current PostgREST session (httpx private pool, pinned in setup.py)"""
+    postgrest = client._postgrest
+    if postgrest is None:
+        return {'open': 0, 'idle': 0, 'active': 0}
+
+    pool = getattr(getattr(postgrest.session, '_transport', None), '_pool', None)
+    connections = list(getattr(pool, 'connections', []))
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {'open': len(connections), 'idle': idle, 'active': len(connections) - idle}
+
+
+def get_pool_stats():
+    """
+    Connection pool usage for every registered client
+
+    Returns:
+        dict: Pool limits plus per-client session, request and connection counts
+    """
+    with _registry_lock:
+        clients = list(_clients.items())
+
+    stats = []
+    for (supabase_url, _), client in clients:
+        counters = client.pool_counters
+        stats.append({
+            'url': supabase_url,
+            'sessions_created': counters.sessions_created,
+            'requests': counters.requests,
+            'responses': counters.responses,
+            'connections': _connection_stats(client),
+        })
+
+    return {
+        'limits': {
+            'max_connections': POOL_MAX_CONNECTIONS,
+            'max_keepalive_connections': POOL_MAX_KEEPALIVE,
+            'keepalive_expiry': POOL_KEEPALIVE_EXPIRY,
+            'http2': POOL_HTTP2,
+        },
+        'clients': stats,
+    }
@@ -0,0 +1,360 @@
+# shared/shared/conditional_logic.py
+import os
+import json
+import hashlib
+
+from shared.cache import LRUCache
+from shared.answer_validators import compile_answer_validator
+
+# Compiled surveys kept per process, keyed by survey_id and version (or a fingerprint
+# of the questions and rules for unversioned rows) so an edited survey is recompiled
+COMPILED_SURVEY_CACHE_SIZE = int(os.getenv("COMPILED_SURVEY_CACHE_SIZE", "512"))
+
+QUESTION_TYPES = (
+    'SHORT_TEXT', 'LONG_TEXT', 'SINGLE_CHOICE', 'MULTIPLE_CHOICE', 'RATING', 'YES_NO', 'EMAIL', 'DATE'
+)
+# Question types the survey builder offers as the "depends on" side of a rule
+CONDITION_SOURCE_TYPES = ('SINGLE_CHOICE', 'YES_NO', 'RATING')
+CONDITION_TYPES = ('answerValueIs', 'answerValueNotIs', 'answerValueGreaterThan', 'answerValueLessThan')
+# Comparisons that only make sense on a rating scale
+ORDERED_CONDITION_TYPES = ('answerValueGreaterThan', 'answerValueLessThan')
+
+
+class ConditionalLogicError(ValueError):
+    """Raised when a survey's conditional_logic cannot be compiled"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("; ".join(self.errors))
+
+
+def question_ids(questions):
+    """IDs of the questions in order, "qN" by position when a question has no id"""
+    return [question.get('id') or f"q{index + 1}" for index, question in enumerate(questions)]
+
+
+def _yes_no(value):
+    """Normalise a YES_NO answer or condition value ("Yes", "yes", True) to "yes"/"no" """
+    if isinstance(value, bool):
+        return 'yes' if value else 'no'
+    if isinstance(value, str):
+        return value.strip().lower()
+    return None
+
+
+def _rating(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _compile_condition(source, condition_type, condition_value):
+    """
+    Build a predicate over the source question's answer
+
+    Returns:
+        tuple: (predicate, error); predicate is None when the rule is invalid
+    """
+    source_type = source.get('type')
+
+    if source_type == 'RATING':
+        target = _rating(condition_value)
+        if target is None:
+            return None, f"condition_value {condition_value!r} is not a number"
+        scale = source.get('scale')
+        if isinstance(scale, int) and not 1 <= target <= scale:
+            return None, f"condition_value {condition_value!r} is outside the rating scale 1-{scale}"
+        normalise = _rating
+    elif condition_type in ORDERED_CONDITION_TYPES:
+        return None, f"{condition_type} is only supported for RATING questions"
+    elif source_type == 'YES_NO':
+        target = _yes_no(condition_value)
+        if target not in ('yes', 'no'):
+            return None, f"condition_value {condition_value!r} must be Yes or No"
+        normalise = _yes_no
+    else:
+        options = source.get('options') or []
+        if condition_value not in options:
+            return None, f"condition_value {condition_value!r} is not one of the question's options"
+        target = condition_value
+        normalise = lambda value: value if isinstance(value, str) else None  # noqa: E731
+
+    # An unanswered source never satisfies a condition, including answerValueNotIs
+    if condition_type == 'answerValueIs':
+        def predicate(answer):
+            value = normalise(answer)
+            return value is not None and value == target
+    elif condition_type == 'answerValueNotIs':
+        def predicate(answer):
+            value = normalise(answer)
+            return value is not None and value != target
+    elif condition_type == 'answerValueGreaterThan':
+        def predicate(answer):
+            value = normalise(answer)
+            return value is not None and value > target
+    else:
+        def predicate(answer):
+            value = normalise(answer)
+            return value is not None and value < target
+    return predicate, None
+
+
+class CompiledSurvey:
+    """
+    A survey's questions and conditional_logic compiled into a dependency DAG.
+
+    Each question has at most one rule (depends_on another question), so the
+    graph is a forest. Questions are stored in topological order, which lets
+    visibility for a whole answer set be computed in one pass.
+
+    A question is visible when it has no rule, or when the question it depends
+    on is visible and its answer satisfies the condition. A rule whose
+    condition_value is still empty (the builder's starting state) is ignored.
+    """
+
+    def __init__(self, questions, conditional_logic=None):
+        questions = questions or []
+        conditional_logic = conditional_logic or {}
+        if not isinstance(questions, list) or not all(isinstance(question, dict) for question in questions):
+            raise ConditionalLogicError(["questions must be a list of objects"])
+        errors = []
+
+        ids = question_ids(questions)
+        index_of = {}
+        for index, question_id in enumerate(ids):
+            if question_id in index_of:
+                errors.append(f"Duplicate question id {question_id}")
+            index_of[question_id] = index
+        for question in questions:
+            if question.get('type') not in QUESTION_TYPES:
+                errors.append(f"Question {question.get('id')!r} has unknown type {question.get('type')!r}")
+
+        if not isinstance(conditional_logic, dict):
+            raise ConditionalLogicError(["conditional_logic must be an object keyed by question id"])
+
+        # parent[i] = (source index, predicate) for questions with a rule
+        parent = [None] * len(questions)
+        for target_id, rule in conditional_logic.items():
+            prefix = f"Rule for {target_id}"
+            if target_id not in index_of:
+                errors.append(f"{prefix}: no such question")
+                continue
+            if not isinstance(rule, dict):
+                errors.append(f"{prefix}: must be an object")
+                continue
+
+            condition_value = rule.get('condition_value')
+            if condition_value is None or (isinstance(condition_value, str) and not condition_value.strip()):
+                # Not filled in yet in the builder; the question stays unconditional
+                continue
+
+            source_id = rule.get('depends_on')
+            condition_type = rule.get('condition_type') or 'answerValueIs'
+            if source_id not in index_of:
+                errors.append(f"{prefix}: depends_on {source_id!r} is not a question in this survey")
+                continue
+            if source_id == target_id:
+                errors.append(f"{prefix}: a question cannot depend on itself")
+                continue
+            source = questions[index_of[source_id]]
+            if source.get('type') not in CONDITION_SOURCE_TYPES:
+                errors.append(f"{prefix}: {source_id} ({source.get('type')}) cannot be a condition source, "
+                              f"use one of {', '.join(CONDITION_SOURCE_TYPES)}")
+                continue
+            if condition_type not in CONDITION_TYPES:
+                errors.append(f"{prefix}: unknown condition_type {condition_type!r}")
+                continue
+
+            predicate, error = _compile_condition(source, condition_type, condition_value)
+            if error:
+                errors.append(f"{prefix}: {error}")
+                continue
+            parent[index_of[target_id]] = (index_of[source_id], predicate)
+
+        order = self._topological_order(parent, ids, errors)
+        if errors:
+            raise ConditionalLogicError(errors)
+
+        self.questions = questions
+        self.ids = ids
+        self.index_of = index_of
+        self.order = order
+        self.parent = parent
+        self.points = [question.get('points', 0) or 0 for question in questions]
+        self.required = [bool((question.get('validation') or {}).get('required')) for question in questions]
+        # Per-question value checks (options, rating range, formats, lengths), built once per version
+        self.validators = [compile_answer_validator(question) for question in questions]
+
+    @staticmethod
+    def _topological_order(parent, ids, errors):
+        """Sources before their dependants; cycles are reported in `errors`"""
+        order = []
+        state = [0] * len(parent)  # 0 = unvisited, 1 = on the current path, 2 = placed
+        for start in range(len(parent)):
+            path = []
+            node = start
+            while node is not None and state[node] == 0:
+                state[node] = 1
+                path.append(node)
+                node = parent[node][0] if parent[node] else None
+            if node is not None and state[node] == 1:
+                cycle = path[path.index(node):]
+                errors.append(f"Conditional logic has a cycle: {' -> '.join(ids[i] for i in cycle)}")
+                for i in cycle:
+                    parent[i] = None
+            for i in reversed(path):
+                state[i] = 2
+                order.append(i)
+        return order
+
+    @staticmethod
+    def answers_by_id(answers):
+        """Map question_id -> response for a list of {question_id, response}"""
+        return {
+            answer.get('question_id'): answer.get('response')
+            for answer in (answers or []) if isinstance(answer, dict)
+        }
+
+    def visibility(self, answers):
+        """
+        Which questions are visible for an answer set
+
+        Args:
+            answers (list | dict): [{question_id, response}, ...] or question_id -> response
+
+        Returns:
+            list: One bool per question, in question order
+        """
+        if not isinstance(answers, dict):
+            answers = self.answers_by_id(answers)
+        visible = [True] * len(self.ids)
+        for i in self.order:
+            rule = self.parent[i]
+            if rule is not None:
+                source, predicate = rule
+                visible[i] = visible[source] and predicate(answers.get(self.ids[source]))
+        return visible
+
+    def visible_question_ids(self, answers):
+        visible = self.visibility(answers)
+        return [question_id for question_id, shown in zip(self.ids, visible) if shown]
+
+    def reachable_points(self, answers):
+        """Points for answered questions that were visible to the respondent"""
+        if not isinstance(answers, dict):
+            answers = self.answers_by_id(answers)
+        visible = self.visibility(answers)
+        return sum(
+            points for question_id, shown, points in zip(self.ids, visible, self.points)
+            if shown and answers.get(question_id) not in (None, '', [])
+        )
+
+    def clean_answers(self, answers):
+        """
+        Check a submission against the survey flow and each question's settings
+
+        Only answers that cannot belong to the survey (malformed entries, unknown
+        question ids) reject the submission. Answers the respondent's client may
+        still send, to questions hidden by their condition, repeated for the same
+        question, or breaking a question's settings (e.g. over maxLength), are
+        dropped and reported instead, so the rest of the response is kept.
+        Required questions are not enforced here, since the respondent UI does
+        not enforce them either.
+
+        Returns:
+            tuple: (answers to save, [dropped answer messages], [error messages])
+                   errors is empty when the submission can be saved
+        """
+        if not isinstance(answers, list):
+            return None, [], ["answers must be a list of {question_id, response} objects"]
+
+        errors = []
+        dropped = []
+        by_id = {}
+        for answer in answers:
+            if not isinstance(answer, dict) or 'question_id' not in answer:
+                errors.append("Every answer needs a question_id")
+                continue
+            question_id = answer['question_id']
+            if question_id not in self.index_of:
+                errors.append(f"{question_id} is not a question in this survey")
+                continue
+            if question_id in by_id:
+                dropped.append(f"{question_id} is answered more than once, the last answer is kept")
+            by_id[question_id] = answer
+        if errors:
+            return None, dropped, errors
+
+        visible = self.visibility({question_id: answer.get('response') for question_id, answer in by_id.items()})
+        kept = []
+        for answer in answers:
+            question_id = answer['question_id']
+            if by_id.get(question_id) is not answer:
+                continue
+            i = self.index_of[question_id]
+            response = answer.get('response')
+            answered = response not in (None, '', [])
+            if answered and not visible[i]:
+                dropped.append(f"{question_id} is answered but hidden by its condition")
+                continue
+            if answered and self.validators[i] is not None:
+                error = self.validators[i](response)
+                if error:
+                    dropped.append(f"{question_id} {error}")
+                    continue
+            kept.append(answer)
+        return kept, dropped, errors
+
+
+compiled_survey_cache = LRUCache(maxsize=COMPILED_SURVEY_CACHE_SIZE)
+
+
+def survey_fingerprint(survey):
+    """Hash of the parts of a survey that affect its compiled form"""
+    payload = json.dumps(
+        [survey.get('questions') or [], survey.get('conditional_logic') or {}],
+        sort_keys=True, separators=(',', ':'), default=str
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def compile_survey(survey, cache=None):
+    """
+    Compile a survey row, reusing the cached result while its version (questions and rules) is unchanged
+
+    Args:
+        survey (dict): Row with survey_id, questions and conditional_logic
+        cache (LRUCache, optional): Defaults to the process-wide compiled_survey_cache
+
+    Returns:
+        CompiledSurvey: Raises ConditionalLogicError if the rules are invalid
+    """
+    cache = cache if cache is not None else compiled_survey_cache
+    version = survey.get('version')
+    key = (survey.get('survey_id'), f"v{version}" if version is not None else survey_fingerprint(survey))
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = CompiledSurvey(survey.get('questions'), survey.get('conditional_logic'))
+        cache.set(key, compiled)
+    return compiled
+
+
+def validate_conditional_logic(questions, conditional_logic):
+    """
+    Validate rules before a survey is saved
+
+    Returns:
+        list: Error messages, empty when the rules compile
+    """
+    try:
+        CompiledSurvey(questions, conditional_logic)
+    except ConditionalLogicError as e:
+        return e.errors
+    return []
@@ -1,14 +1,80 @@
 # shared/shared/db.py
 import os
-from supabase import create_client
+import re
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from flask import jsonify
 from dotenv import load_dotenv
 
+from shared.cache import LRUCache
+from shared.clients import get_supabase_client
+
 # Load environment variables
 load_dotenv()
 
+# Process-wide survey document cache, shared by every Database instance so that
+# invalidations reach all blueprints in the service
+SURVEY_CACHE_SIZE = int(os.getenv("SURVEY_CACHE_SIZE", "512"))
+SURVEY_CACHE_TTL = float(os.getenv("SURVEY_CACHE_TTL", "300"))
+survey_cache = LRUCache(maxsize=SURVEY_CACHE_SIZE, ttl=SURVEY_CACHE_TTL)
+
+# Bulk survey fetches are split into `in_` queries of this many IDs, run concurrently
+SURVEY_FETCH_CHUNK_SIZE = int(os.getenv("SURVEY_FETCH_CHUNK_SIZE", "50"))
+SURVEY_FETCH_MAX_WORKERS = int(os.getenv("SURVEY_FETCH_MAX_WORKERS", "4"))
+
+# Keyset pagination bounds for survey listings
+SURVEY_PAGE_SIZE = int(os.getenv("SURVEY_PAGE_SIZE", "50"))
+SURVEY_MAX_PAGE_SIZE = int(os.getenv("SURVEY_MAX_PAGE_SIZE", "200"))
+
+# Projections are plain column lists; anything else (embeds, casts, JSON paths) is rejected
+_COLUMN_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def summarize_survey(survey):
+    """
+    Reduce a survey to the fields needed to render a survey card
+    
+    Args:
+        survey (dict): Survey row with either its questions or the question_count and
+                       total_points computed columns (survey_service/sql/survey_summary.sql)
+        
+    Returns:
+        dict: survey_id, title, description, question_count and total_points
+    """
+    if 'question_count' in survey:
+        question_count = survey.get('question_count') or 0
+        total_points = survey.get('total_points') or 0
+    else:
+        questions = survey.get('questions') or []
+        question_count = len(questions)
+        total_points = sum(question.get('points', 0) or 0 for question in questions)
+    return {
+        'survey_id': survey.get('survey_id'),
+        'title': survey.get('title'),
+        'description': survey.get('description'),
+        'question_count': question_count,
+        'total_points': total_points
+    }
+
+def survey_etag(survey):
+    """
+    Entity tag for a survey document
+    
+    Args:
+        survey (dict): Survey row
+        
+    Returns:
+        str: "<survey_id>-v<version>" when the row carries a version (maintained by
+             survey_publisher), otherwise a hash of the document
+    """
+    version = survey.get('version')
+    if version is not None:
+        return f"{survey.get('survey_id')}-v{version}"
+    payload = json.dumps(survey, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
 class Database:
-    def __init__(self):
+    def __init__(self, cache=None):
         # Initialize Supabase
         self.supabase_url = os.getenv("SUPABASE_URL")
         self.supabase_key = os.getenv("SUPABASE_KEY")
@@ -16,34 +82,212 @@ class Database:
         if not self.supabase_url or not self.supabase_key:
             raise ValueError("Missing Supabase credentials")
 
-        self.supabase = create_client(self.supabase_url, self.supabase_key)
+        # Reuse the process-wide client so every blueprint shares one connection pool
+        self.supabase = get_supabase_client(self.supabase_url, self.supabase_key)
+        self.survey_cache = cache if cache is not None else survey_cache
+        # Expired cache entries confirmed unchanged by a version check / refetched in full
+        self.survey_revalidations = 0
+        self.survey_refetches = 0
         print("Supabase initialized!")
 
     # Survey-related methods
-    def get_all_surveys(self):
+    def get_all_surveys(self, fields=None, summary=False, limit=None, cursor=None):
         """
-        Retrieve all surveys from Supabase
+        Retrieve surveys from Supabase, optionally projected and keyset-paginated
+        
+        Args:
+            fields (list, optional): Columns to return instead of every column
+            summary (bool): Return summarize_survey() cards instead of full rows
+            limit (int, optional): Maximum number of surveys to return
+            cursor (str, optional): Only return surveys whose survey_id sorts after this one
         
         Returns:
-            list: List of surveys
+            list: List of surveys, ordered by survey_id when paginating
         """
-        response = self.supabase.table("surveys").select("*").execute()
+        if summary:
+            # Counted in the database, so the questions JSON is not transferred
+            columns = ['survey_id', 'title', 'description', 'question_count', 'total_points']
+        elif fields:
+            columns = list(dict.fromkeys(fields))
+            invalid = [field for field in columns if not _COLUMN_NAME.match(field)]
+            if invalid:
+                raise ValueError(f"Invalid field names: {', '.join(invalid)}")
+        else:
+            columns = None
+
+        paginate = limit is not None or cursor is not None
+        if paginate and columns is not None and 'survey_id' not in columns:
+            # The cursor is the last survey_id of the page, so it must always be selected
+            columns.insert(0, 'survey_id')
+
+        query = self.supabase.table("surveys").select(",".join(columns) if columns else "*")
+        if paginate:
+            if cursor is not None:
+                query = query.gt('survey_id', cursor)
+            query = query.order('survey_id').limit(limit if limit is not None else SURVEY_PAGE_SIZE)
+
+        response = query.execute()
         if hasattr(response, 'error') and response.error:
             raise Exception(f"Error retrieving surveys: {response.error}")
+
+        if summary:
+            return [summarize_survey(survey) for survey in response.data]
         return response.data
 
-    def get_survey_by_id(self, survey_id):
+    def get_survey_by_id(self, survey_id, use_cache=True):
         """
-        Retrieve a specific survey by ID
+        Retrieve a specific survey by ID, served from the survey cache when possible
         
         Args:
             survey_id (str): The survey's unique identifier
+            use_cache (bool): Set to False to bypass the cache and read from Supabase
             
         Returns:
-            dict: Survey data if found, None otherwise
+            dict: Survey data if found, None otherwise. Cached documents are shared
+                  between callers and must be treated as read-only.
         """
+        if use_cache:
+            survey_data = self.survey_cache.get(survey_id)
+            if survey_data is not None:
+                return survey_data
+
+            # An expired copy is still good if the version hasn't moved; checking costs
+            # one tiny query instead of re-downloading the questions
+            stale = self.survey_cache.get_stale(survey_id)
+            if stale is not None and stale.get('version') is not None:
+                if survey_id in self._unchanged_survey_ids({survey_id: stale}):
+                    return stale
+
         response = self.supabase.table("surveys").select("*").eq('survey_id', survey_id).execute()
-        return response.data[0] if response.data else None
+        survey_data = response.data[0] if response.data else None
+
+        # Missing surveys are not cached so newly published ones show up immediately
+        if survey_data is not None:
+            self.survey_cache.set(survey_id, survey_data)
+        return survey_data
+
+    def get_surveys_by_ids(self, survey_ids, use_cache=True, chunk_size=None, max_workers=None):
+        """
+        Retrieve several surveys at once, keeping the order of `survey_ids`
+        
+        Cached surveys are served locally, expired ones are kept if their version
+        is unchanged, and the rest are fetched with chunked `in_` queries issued
+        in parallel instead of one request per survey.
+        
+        Args:
+            survey_ids (list): Survey IDs in the order they should be returned
+            use_cache (bool): Set to False to bypass the cache and read from Supabase
+            chunk_size (int, optional): IDs per query, defaults to SURVEY_FETCH_CHUNK_SIZE
+            max_workers (int, optional): Concurrent queries, defaults to SURVEY_FETCH_MAX_WORKERS
+            
+        Returns:
+            list: Surveys found, in request order (IDs that do not exist are skipped)
+        """
+        found = {}
+        missing = []
+        stale = {}
+        for survey_id in dict.fromkeys(survey_ids):
+            survey_data = self.survey_cache.get(survey_id) if use_cache else None
+            if survey_data is not None:
+                found[survey_id] = survey_data
+                continue
+            stale_data = self.survey_cache.get_stale(survey_id) if use_cache else None
+            if stale_data is not None and stale_data.get('version') is not None:
+                stale[survey_id] = stale_data
+            else:
+                missing.append(survey_id)
+
+        if stale:
+            unchanged = self._unchanged_survey_ids(stale, chunk_size, max_workers)
+            for survey_id, survey_data in stale.items():
+                if survey_id in unchanged:
+                    found[survey_id] = survey_data
+                else:
+                    missing.append(survey_id)
+
+        for rows in self._fetch_in_chunks("*", missing, chunk_size, max_workers):
+            for survey_data in rows:
+                found[survey_data['survey_id']] = survey_data
+                self.survey_cache.set(survey_data['survey_id'], survey_data)
+
+        return [found[survey_id] for survey_id in survey_ids if survey_id in found]
+
+    def _fetch_in_chunks(self, columns, survey_ids, chunk_size=None, max_workers=None):
+        """Run chunked `in_` queries for survey_ids concurrently, returning one row list per chunk"""
+        chunk_size = max(1, chunk_size or SURVEY_FETCH_CHUNK_SIZE)
+        max_workers = max(1, max_workers or SURVEY_FETCH_MAX_WORKERS)
+        chunks = [survey_ids[i:i + chunk_size] for i in range(0, len(survey_ids), chunk_size)]
+
+        def fetch_chunk(chunk):
+            response = self.supabase.table("surveys").select(columns).in_('survey_id', chunk).execute()
+            if hasattr(response, 'error') and response.error:
+                raise Exception(f"Error retrieving surveys: {response.error}")
+            return response.data or []
+
+        if len(chunks) == 1:
+            return [fetch_chunk(chunks[0])]
+        if not chunks:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            return list(executor.map(fetch_chunk, chunks))
+
+    def _unchanged_survey_ids(self, stale, chunk_size=None, max_workers=None):
+        """
+        Compare expired cached surveys with their current version
+        
+        Surveys whose version is unchanged are re-cached for another TTL; the rest
+        are dropped from the cache.
+        
+        Args:
+            stale (dict): survey_id -> expired cached survey carrying a version
+            
+        Returns:
+            set: IDs whose cached copy is still current
+        """
+        current = {}
+        for rows in self._fetch_in_chunks("survey_id,version", list(stale), chunk_size, max_workers):
+            for row in rows:
+                current[row['survey_id']] = row.get('version')
+
+        unchanged = set()
+        for survey_id, survey_data in stale.items():
+            if current.get(survey_id) == survey_data['version']:
+                self.survey_cache.set(survey_id, survey_data)
+                unchanged.add(survey_id)
+            else:
+                self.survey_cache.invalidate(survey_id)
+        self.survey_revalidations += len(unchanged)
+        self.survey_refetches += len(stale) - len(unchanged)
+        return unchanged
+
+    def invalidate_survey(self, survey_id):
+        """
+        Drop a survey from the cache after it has been updated or deleted
+        
+        Args:
+            survey_id (str): The survey's unique identifier
+            
+        Returns:
+            bool: True if a cached copy was removed
+        """
+        return self.survey_cache.invalidate(survey_id)
+
+    def invalidate_all_surveys(self):
+        """Drop every cached survey"""
+        self.survey_cache.clear()
+
+    def get_survey_cache_stats(self):
+        """
+        Retrieve the survey cache counters
+        
+        Returns:
+            dict: size, maxsize, ttl, hits, misses, evictions and hit_rate, plus how many
+                  expired entries were revalidated by version or refetched
+        """
+        stats = self.survey_cache.stats()
+        stats['revalidated'] = self.survey_revalidations
+        stats['refetched'] = self.survey_refetches
+        return stats
 
     # User-related methods
     def get_user_by_id(self, user_id, select_fields="*"):
@@ -77,7 +321,7 @@ class Database:
         return response.data
     
     # Response formatting utility
-    def format_response(self, success, data=None, error=None, status_code=200):
+    def format_response(self, success, data=None, error=None, status_code=200, extra=None):
         """
         Format response in a consistent way
         
@@ -86,6 +330,7 @@ class Database:
             data (any, optional): Data to return
             error (str, optional): Error message
             status_code (int, optional): HTTP status code
+            extra (dict, optional): Additional top-level keys, e.g. pagination cursors
             
         Returns:
             tuple: (response_json, status_code)
@@ -99,5 +344,8 @@ class Database:
             
         if error is not None:
             response['error'] = str(error)
+
+        if extra:
+            response.update(extra)
             
         return jsonify(response), status_code
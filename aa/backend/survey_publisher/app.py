@@ -1,12 +1,18 @@
 # --- START OF FILE app.py (Survey Publisher @ :5004) ---
 
 import os
-from flask import Flask, request, jsonify
+import json
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 # from datetime import datetime, timezone # No longer needed for basic schema
-from supabase import create_client
+from shared.clients import get_supabase_client
+from shared.auth import SERVICE_TOKEN, SERVICE_TOKEN_HEADER
+from shared.conditional_logic import validate_conditional_logic
 from dotenv import load_dotenv
-import uuid
+import requests
+
+from fanout import SurveyFanout
+from bulk_import import BulkSurveyImporter, build_survey
 
 # Load environment variables
 load_dotenv()
@@ -16,7 +22,7 @@ app = Flask(__name__)
 # Configure CORS
 CORS(app, resources={r"/*": {
     "origins": "*",
-    "methods": ["POST", "PUT", "DELETE", "OPTIONS", "GET"], # Allow GET only for /health
+    "methods": ["POST", "PUT", "DELETE", "OPTIONS", "GET"], # GET for /health and fan-out status
     "allow_headers": ["Content-Type", "Authorization"]
 }})
 
@@ -30,9 +36,35 @@ print(f"Loaded Supabase Key: {'SET' if supabase_key else 'NOT SET'}")
 if not supabase_url or not supabase_key:
     raise ValueError("Missing Supabase credentials. Please set SUPABASE_URL and SUPABASE_KEY environment variables.")
 
-supabase = create_client(supabase_url, supabase_key)
+supabase = get_supabase_client(supabase_url, supabase_key)
 print("Supabase initialized successfully for Survey Publisher!")
 
+# Services holding a survey cache (shared.db.Database) that must drop stale copies
+# when a survey changes. Comma separated base URLs, docker-compose service names by default.
+SURVEY_CACHE_SUBSCRIBERS = [
+    url.strip().rstrip('/')
+    for url in os.getenv("SURVEY_CACHE_SUBSCRIBERS", "http://survey-service:5000,http://user-service:5001,http://responses:5101").split(',')
+    if url.strip()
+]
+SURVEY_CACHE_INVALIDATION_TIMEOUT = float(os.getenv("SURVEY_CACHE_INVALIDATION_TIMEOUT", "2"))
+
+# Background worker adding published surveys to users' to-be-answered lists
+survey_fanout = SurveyFanout(supabase)
+survey_fanout.start()
+
+
+def invalidate_survey_caches(survey_id):
+    """Best-effort notification to every survey cache holder. Failures are only logged,
+    the caches' TTL bounds how long a missed invalidation can serve stale data."""
+    for base_url in SURVEY_CACHE_SUBSCRIBERS:
+        try:
+            response = requests.delete(f"{base_url}/cache/surveys/{survey_id}", headers={SERVICE_TOKEN_HEADER: SERVICE_TOKEN or ''},
+                                       timeout=SURVEY_CACHE_INVALIDATION_TIMEOUT)
+            if not response.ok:
+                print(f"Cache invalidation for survey {survey_id} at {base_url} was refused: {response.status_code}")
+        except requests.RequestException as e:
+            print(f"Cache invalidation for survey {survey_id} at {base_url} failed: {e}")
+
 """API Endpoints"""
 
 # REMOVED GET /surveys endpoint
@@ -43,23 +75,14 @@ def create_survey():
     """Create a new survey (strictly id, title, description, questions ONLY)"""
     try:
         data = request.json
-        if not data or 'title' not in data or 'questions' not in data:
-             return jsonify({'success': False, 'error': 'Missing required fields: title and questions'}), 400
-
-        # Prepare survey data with ONLY the 4 required fields
-        survey_data = {
-            'survey_id': str(uuid.uuid4()),
-            'title': data['title'],
-            'description': data.get('description', ''), # Use .get for optional description
-            'questions': data['questions'], 
-            'conditional_logic': data.get('conditional_logic', {})
-            # --- REMOVED ALL OTHER FIELDS ---
-            # 'status': 'draft',
-            # 'is_published': False,
-            # 'published_at': None,
-            # 'created_at': datetime.now(timezone.utc).isoformat(),
-            # 'updated_at': datetime.now(timezone.utc).isoformat()
-        }
+
+        # Prepare survey data with ONLY the survey fields (shared with POST /surveys/bulk)
+        survey_data, error = build_survey(data)
+        if error:
+            body = {'success': False, 'error': error[0]}
+            if error[1]:
+                body['details'] = error[1]
+            return jsonify(body), 400
         # print(f"Attempting to insert minimal survey data: {survey_data}")
 
         # Insert into database
@@ -87,6 +110,26 @@ def create_survey():
         return jsonify({'success': False, 'error': f"An unexpected server error occurred: {str(e)}"}), 500
 
 
+@app.route('/surveys/bulk', methods=['POST'])
+def bulk_create_surveys():
+    """Create surveys from an NDJSON body (one survey object per line), streaming one result line per input line"""
+    importer = BulkSurveyImporter(supabase)
+    # Read the raw body as it arrives instead of letting Flask buffer it
+    stream = request.stream
+
+    def generate():
+        try:
+            for result in importer.run(stream):
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            print(f"Server Error in bulk_create_surveys: {e}")
+            yield json.dumps({'success': False, 'error': f"An unexpected server error occurred: {str(e)}"}) + '\n'
+        print(f"Bulk survey import finished: {importer.summary}")
+        yield json.dumps({'summary': importer.summary}) + '\n'
+
+    return Response(stream_with_context(generate()), status=200, mimetype='application/x-ndjson')
+
+
 @app.route('/surveys/<survey_id>', methods=['PUT'])
 def update_survey(survey_id):
     """Update an existing survey (title, description, questions ONLY)"""
@@ -95,10 +138,11 @@ def update_survey(survey_id):
         if not data:
              return jsonify({'success': False, 'error': 'Missing request body'}), 400
 
-        # Check if survey exists
-        count_response = supabase.table('surveys').select('survey_id', count='exact').eq('survey_id', survey_id).execute()
-        if count_response.count == 0:
+        # Check if survey exists (and fetch what the conditional logic check needs)
+        existing_response = supabase.table('surveys').select('survey_id,questions,conditional_logic,version').eq('survey_id', survey_id).execute()
+        if not existing_response.data:
             return jsonify({'success': False, 'error': f'Survey with ID {survey_id} not found'}), 404
+        existing = existing_response.data[0]
 
         # Prepare update data - ONLY these fields
         update_data = {}
@@ -110,22 +154,42 @@ def update_survey(survey_id):
         if not update_data:
              return jsonify({'success': False, 'error': 'No updatable fields provided (title, description, or questions)'}), 400
 
+        if 'questions' in update_data or 'conditional_logic' in update_data:
+            # Rules are checked against the questions they will be saved with
+            logic_errors = validate_conditional_logic(
+                update_data.get('questions', existing.get('questions')),
+                update_data.get('conditional_logic', existing.get('conditional_logic'))
+            )
+            if logic_errors:
+                return jsonify({'success': False, 'error': 'Invalid conditional logic', 'details': logic_errors}), 400
+
         # --- REMOVED updated_at ---
         # update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
 
+        # Every change bumps the version that ETags and survey caches key on. The update
+        # only applies if nobody else bumped it since we read it.
+        current_version = existing.get('version')
+        update_data['version'] = (current_version or 0) + 1
+
         print(f"Attempting to update survey {survey_id} with: {list(update_data.keys())}")
         # Update in database
-        response = supabase.table('surveys').update(update_data).eq('survey_id', survey_id).execute()
+        query = supabase.table('surveys').update(update_data).eq('survey_id', survey_id)
+        query = query.eq('version', current_version) if current_version is not None else query.is_('version', 'null')
+        response = query.execute()
 
         if hasattr(response, 'error') and response.error:
             print(f"Supabase Error updating survey {survey_id}: {response.error.message} (Code: {response.error.code})")
             return jsonify({'success': False, 'error': f"Database error: {response.error.message}"}), 500
+        if not response.data:
+            return jsonify({'success': False, 'error': 'Survey was modified concurrently, please retry'}), 409
 
         print(f"Update successful for survey: {survey_id}")
+        invalidate_survey_caches(survey_id)
         return jsonify({
             'success': True,
             'data': {
-                'message': 'Survey updated successfully'
+                'message': 'Survey updated successfully',
+                'version': update_data['version']
             }
         }), 200
     except Exception as e:
@@ -152,6 +216,7 @@ def delete_survey(survey_id):
             return jsonify({'success': False, 'error': f"Database error: {response.error.message}"}), 500
 
         print(f"Delete successful for survey: {survey_id}")
+        invalidate_survey_caches(survey_id)
         return jsonify({
             'success': True,
             'data': {
@@ -165,9 +230,9 @@ def delete_survey(survey_id):
 
 @app.route('/surveys/<survey_id>/publish', methods=['POST'])
 def publish_survey(survey_id):
-    """Acknowledge publish request (functionality depends on schema)"""
+    """Queue a fan-out adding the survey to users' to-be-answered lists"""
     # NOTE: This endpoint cannot truly publish without status/is_published columns.
-    # It will only check if the survey exists and potentially update user lists.
+    # It checks the survey exists and pushes it to users instead of waiting for the scheduler.
     try:
         # Check if survey exists
         survey_response = supabase.table('surveys').select('survey_id').eq('survey_id', survey_id).maybe_single().execute()
@@ -180,18 +245,18 @@ def publish_survey(survey_id):
         # update_data = { ... }
         # response = supabase.table('surveys').update(update_data)...
 
-        # --- User list update logic can remain, but might be less useful without status ---
-        print(f"Attempting to add survey {survey_id} to users' to_be_answered list (publish requested)...")
-        # (User list update code from previous version can be kept here if desired,
-        #  but it won't reflect a true "published" state without the DB columns)
-        # ... (omitted for brevity, add back if needed) ...
+        print(f"Queueing fan-out of survey {survey_id} to users' to_be_answered list (publish requested)...")
+        job = survey_fanout.submit(survey_id)
 
         return jsonify({
             'success': True, # Report success to frontend
             'data': {
-                'message': 'Publish request received. Note: Full publishing requires status/is_published columns in database.'
+                'message': 'Publish request received. Note: Full publishing requires status/is_published columns in database.',
+                'fanout_job_id': job['job_id'],
+                'fanout_status': job['status'],
+                'status_url': f"/fanout/jobs/{job['job_id']}"
             }
-        }), 200 # Acknowledge the request
+        }), 202 # Fan-out continues in the background
     except Exception as e:
         print(f"Server Error processing publish request for {survey_id}: {e}")
         return jsonify({'success': False, 'error': f"An unexpected server error occurred: {str(e)}"}), 500
@@ -229,6 +294,24 @@ def unpublish_survey(survey_id):
         return jsonify({'success': False, 'error': f"An unexpected server error occurred: {str(e)}"}), 500
 
 
+@app.route('/fanout/jobs/<job_id>', methods=['GET'])
+def get_fanout_job(job_id):
+    """Progress of a fan-out job"""
+    job = survey_fanout.queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': f'Fan-out job {job_id} not found'}), 404
+    return jsonify({'success': True, 'data': survey_fanout.status(job)}), 200
+
+
+@app.route('/surveys/<survey_id>/fanout', methods=['GET'])
+def get_survey_fanout(survey_id):
+    """Progress of the latest fan-out job for a survey"""
+    job = survey_fanout.queue.latest_for_survey(survey_id)
+    if not job:
+        return jsonify({'success': False, 'error': f'No fan-out job for survey {survey_id}'}), 404
+    return jsonify({'success': True, 'data': survey_fanout.status(job)}), 200
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Simple health check endpoint"""
@@ -242,7 +325,7 @@ def health_check():
         print(f"Health check DB error: {db_e}")
         db_status = f"error ({type(db_e).__name__})" # Include error type if possible
     finally:
-        return jsonify({"status": "healthy", "service": "survey-publisher", "db_connection": db_status})
+        return jsonify({"status": "healthy", "service": "survey-publisher", "db_connection": db_status, "fanout": survey_fanout.stats()})
 
 
 if __name__ == '__main__':
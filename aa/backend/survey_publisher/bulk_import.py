@@ -0,0 +1,138 @@
+# bulk_import.py
+import os
+import json
+import uuid
+
+from shared.conditional_logic import validate_conditional_logic
+
+# Surveys per multi-row insert
+SURVEY_BULK_BATCH_SIZE = int(os.getenv("SURVEY_BULK_BATCH_SIZE", "100"))
+# Longest accepted NDJSON line; longer lines are skipped without being held in memory
+SURVEY_BULK_MAX_LINE_BYTES = int(os.getenv("SURVEY_BULK_MAX_LINE_BYTES", str(1024 * 1024)))
+
+
+def build_survey(data):
+    """
+    Validate a survey payload and turn it into a row for the surveys table
+
+    Returns:
+        tuple: (row, None) when valid, otherwise (None, (error, details))
+    """
+    if not isinstance(data, dict) or 'title' not in data or 'questions' not in data:
+        return None, ('Missing required fields: title and questions', None)
+
+    logic_errors = validate_conditional_logic(data['questions'], data.get('conditional_logic', {}))
+    if logic_errors:
+        return None, ('Invalid conditional logic', logic_errors)
+
+    return {
+        'survey_id': str(uuid.uuid4()),
+        'title': data['title'],
+        'description': data.get('description', ''),
+        'questions': data['questions'],
+        'conditional_logic': data.get('conditional_logic', {}),
+        'version': 1
+    }, None
+
+
+def iter_lines(stream, max_line_bytes=SURVEY_BULK_MAX_LINE_BYTES):
+    """
+    Yield (line number, bytes or None) from a binary stream, one line at a time
+
+    Lines longer than max_line_bytes are drained in pieces and yielded as None.
+    """
+    line_number = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            # Discard the rest of the oversized line
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_bytes + 1)
+            yield line_number, None
+            continue
+        yield line_number, line
+
+
+class BulkSurveyImporter:
+    """
+    Imports surveys from an NDJSON stream in batched multi-row inserts.
+
+    Only the current batch is held in memory. Invalid lines are reported as
+    soon as they are read; valid ones once their batch has been written. If a
+    batch insert fails, its rows are retried one by one so the failure is
+    reported against the right lines.
+    """
+
+    def __init__(self, supabase, batch_size=SURVEY_BULK_BATCH_SIZE, max_line_bytes=SURVEY_BULK_MAX_LINE_BYTES):
+        self.supabase = supabase
+        self.batch_size = max(1, batch_size)
+        self.max_line_bytes = max_line_bytes
+        self.summary = {'lines': 0, 'created': 0, 'failed': 0, 'batches': 0}
+
+    def _failed(self, line_number, error, details=None):
+        self.summary['failed'] += 1
+        result = {'line': line_number, 'success': False, 'error': error}
+        if details:
+            result['details'] = details
+        return result
+
+    def _flush(self, batch):
+        """Insert a batch; yields one result per row"""
+        rows = [row for _, row in batch]
+        try:
+            self.supabase.table('surveys').insert(rows).execute()
+            self.summary['batches'] += 1
+        except Exception as e:
+            print(f"Bulk insert of {len(rows)} surveys failed, retrying one by one: {e}")
+            for line_number, row in batch:
+                try:
+                    self.supabase.table('surveys').insert(row).execute()
+                except Exception as row_error:
+                    yield self._failed(line_number, f"Database error: {row_error}")
+                    continue
+                self.summary['created'] += 1
+                yield {'line': line_number, 'success': True, 'id': row['survey_id']}
+            return
+
+        self.summary['created'] += len(rows)
+        for line_number, row in batch:
+            yield {'line': line_number, 'success': True, 'id': row['survey_id']}
+
+    def run(self, stream):
+        """
+        Import every survey in the stream
+
+        Yields:
+            dict: One result per non-blank line ({line, success, id} or {line, success, error})
+        """
+        batch = []
+        for line_number, line in iter_lines(stream, self.max_line_bytes):
+            if line is None:
+                self.summary['lines'] += 1
+                yield self._failed(line_number, f'Line exceeds {self.max_line_bytes} bytes')
+                continue
+            if not line.strip():
+                continue
+            self.summary['lines'] += 1
+
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                yield self._failed(line_number, f'Invalid JSON: {e}')
+                continue
+
+            row, error = build_survey(data)
+            if error:
+                yield self._failed(line_number, *error)
+                continue
+
+            batch.append((line_number, row))
+            if len(batch) >= self.batch_size:
+                yield from self._flush(batch)
+                batch = []
+
+        if batch:
+            yield from self._flush(batch)
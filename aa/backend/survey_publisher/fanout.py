@@ -0,0 +1,330 @@
+# fanout.py
+import os
+import uuid
+import sqlite3
+import threading
+import traceback
+from datetime import datetime, timezone
+from postgrest.types import ReturnMethod
+
+# sqlite keeps queued jobs across restarts; memory is for local runs and tests
+FANOUT_QUEUE = os.getenv("FANOUT_QUEUE", "sqlite")
+FANOUT_DB_PATH = os.getenv("FANOUT_DB_PATH", "fanout_jobs.db")
+# Users read per page; the rpc method writes each page in one statement
+FANOUT_PAGE_SIZE = int(os.getenv("FANOUT_PAGE_SIZE", "1000"))
+# "rpc" calls fanout_survey_to_users (sql/fanout_survey_to_users.sql), which appends in the
+# database without reading the lists; "update" reads the lists and sends one UPDATE per user,
+# for databases without the function. Neither inserts, so deleted users stay deleted.
+FANOUT_WRITE_METHOD = os.getenv("FANOUT_WRITE_METHOD", "rpc")
+
+ACTIVE_STATUSES = ('queued', 'running')
+JOB_FIELDS = (
+    'job_id', 'survey_id', 'status', 'total_users', 'users_scanned', 'users_added',
+    'batches_written', 'last_uid', 'error', 'created_at', 'started_at', 'finished_at',
+)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _new_job(survey_id):
+    return {
+        'job_id': str(uuid.uuid4()),
+        'survey_id': survey_id,
+        'status': 'queued',
+        'total_users': None,
+        'users_scanned': 0,
+        'users_added': 0,
+        'batches_written': 0,
+        'last_uid': None,
+        'error': None,
+        'created_at': _now(),
+        'started_at': None,
+        'finished_at': None,
+    }
+
+
+class InMemoryJobQueue:
+    """Fan-out jobs held in process memory (lost on restart)"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, survey_id):
+        """Queue a job for survey_id, or return the one already queued/running for it"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job['survey_id'] == survey_id and job['status'] in ACTIVE_STATUSES:
+                    return dict(job)
+            job = _new_job(survey_id)
+            self._jobs[job['job_id']] = job
+            return dict(job)
+
+    def claim(self):
+        """Mark the oldest queued job as running and return it (None if the queue is empty)"""
+        with self._lock:
+            queued = [job for job in self._jobs.values() if job['status'] == 'queued']
+            if not queued:
+                return None
+            job = min(queued, key=lambda j: j['created_at'])
+            job.update(status='running', started_at=job['started_at'] or _now())
+            return dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def latest_for_survey(self, survey_id):
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job['survey_id'] == survey_id]
+            return dict(max(jobs, key=lambda j: j['created_at'])) if jobs else None
+
+    def requeue_running(self):
+        """Put jobs interrupted by a restart back in the queue"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job['status'] == 'running':
+                    job['status'] = 'queued'
+
+    def counts(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+
+class SQLiteJobQueue:
+    """Fan-out jobs in a local SQLite file, so queued and interrupted jobs survive a restart"""
+
+    def __init__(self, path=FANOUT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fanout_jobs ("
+            " job_id TEXT PRIMARY KEY, survey_id TEXT NOT NULL, status TEXT NOT NULL,"
+            " total_users INTEGER, users_scanned INTEGER NOT NULL, users_added INTEGER NOT NULL,"
+            " batches_written INTEGER NOT NULL, last_uid TEXT, error TEXT,"
+            " created_at TEXT NOT NULL, started_at TEXT, finished_at TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fanout_jobs_status ON fanout_jobs (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fanout_jobs_survey ON fanout_jobs (survey_id, created_at)")
+
+    def _one(self, sql, params=()):
+        row = self._conn.execute(sql, params).fetchone()
+        return dict(row) if row else None
+
+    def enqueue(self, survey_id):
+        with self._lock:
+            active = self._one(
+                "SELECT * FROM fanout_jobs WHERE survey_id = ? AND status IN ('queued', 'running')"
+                " ORDER BY created_at LIMIT 1",
+                (survey_id,),
+            )
+            if active:
+                return active
+            job = _new_job(survey_id)
+            self._conn.execute(
+                f"INSERT INTO fanout_jobs ({', '.join(JOB_FIELDS)}) VALUES ({', '.join('?' for _ in JOB_FIELDS)})",
+                [job[field] for field in JOB_FIELDS],
+            )
+            return job
+
+    def claim(self):
+        with self._lock:
+            job = self._one("SELECT * FROM fanout_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1")
+            if job is None:
+                return None
+            job['status'] = 'running'
+            job['started_at'] = job['started_at'] or _now()
+            self._conn.execute(
+                "UPDATE fanout_jobs SET status = ?, started_at = ? WHERE job_id = ?",
+                (job['status'], job['started_at'], job['job_id']),
+            )
+            return job
+
+    def update(self, job_id, **fields):
+        columns = [field for field in fields if field in JOB_FIELDS and field != 'job_id']
+        if not columns:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE fanout_jobs SET {', '.join(f'{c} = ?' for c in columns)} WHERE job_id = ?",
+                [fields[c] for c in columns] + [job_id],
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            return self._one("SELECT * FROM fanout_jobs WHERE job_id = ?", (job_id,))
+
+    def latest_for_survey(self, survey_id):
+        with self._lock:
+            return self._one(
+                "SELECT * FROM fanout_jobs WHERE survey_id = ? ORDER BY created_at DESC LIMIT 1", (survey_id,)
+            )
+
+    def requeue_running(self):
+        with self._lock:
+            self._conn.execute("UPDATE fanout_jobs SET status = 'queued' WHERE status = 'running'")
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM fanout_jobs GROUP BY status").fetchall()
+            return {row['status']: row['n'] for row in rows}
+
+
+def make_job_queue(kind=FANOUT_QUEUE):
+    if kind == 'memory':
+        return InMemoryJobQueue()
+    if kind == 'sqlite':
+        return SQLiteJobQueue()
+    raise ValueError(f"Unknown fan-out queue: {kind}")
+
+
+class SurveyFanout:
+    """
+    Appends a newly published survey to users' to-be-answered lists.
+
+    Jobs are processed one at a time by a background thread. Users are paged by
+    UID and the job's position (last_uid) is saved after every page, so a job
+    interrupted by a restart resumes where it stopped. Users who already
+    answered the survey, or already have it in their list, are left alone.
+
+    The default rpc method appends inside the database in one statement per
+    page. The update fallback reads and rewrites each list, so a list changed
+    between the read and the write can lose that change; the scheduler's
+    periodic full reconciliation repairs it.
+    """
+
+    def __init__(self, supabase, queue=None, page_size=FANOUT_PAGE_SIZE, method=FANOUT_WRITE_METHOD):
+        if method not in ('rpc', 'update'):
+            raise ValueError(f"Unknown write method: {method}")
+        self.supabase = supabase
+        self.queue = queue or make_job_queue()
+        self.page_size = max(1, page_size)
+        self.method = method
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, survey_id):
+        """Queue a fan-out for survey_id and wake the worker"""
+        job = self.queue.enqueue(survey_id)
+        self._wake.set()
+        return job
+
+    def _count_users(self):
+        return self.supabase.table('users').select('UID', count='exact').limit(1).execute().count
+
+    def _iter_pages(self, columns, after=None):
+        last_uid = after
+        while True:
+            query = self.supabase.table('users').select(columns).order('UID').limit(self.page_size)
+            if last_uid is not None:
+                query = query.gt('UID', last_uid)
+            page = query.execute().data or []
+            if page:
+                yield page
+            if len(page) < self.page_size:
+                return
+            last_uid = page[-1]['UID']
+
+    def _append_page(self, survey_id, page):
+        """Add the survey to every eligible user in the page; returns the number of users updated"""
+        if self.method == 'rpc':
+            result = self.supabase.rpc('fanout_survey_to_users', {
+                'p_survey_id': survey_id, 'p_uids': [user['UID'] for user in page]
+            }).execute()
+            return result.data or 0, 1
+
+        rows = []
+        for user in page:
+            answered = user.get('answered_surveys') or []
+            to_be_answered = user.get('to_be_answered_surveys') or []
+            if any(item.get('survey_id') == survey_id for item in answered + to_be_answered):
+                continue
+            rows.append({'UID': user['UID'], 'to_be_answered_surveys': to_be_answered + [{'survey_id': survey_id}]})
+
+        for row in rows:
+            # UPDATE only: a user deleted since the page was read is skipped, not recreated
+            self.supabase.table('users').update(
+                {'to_be_answered_surveys': row['to_be_answered_surveys']}, returning=ReturnMethod.minimal
+            ).eq('UID', row['UID']).execute()
+        return len(rows), len(rows)
+
+    def process(self, job):
+        """Run one claimed job to completion (or failure)"""
+        job_id = job['job_id']
+        survey_id = job['survey_id']
+        print(f"Fan-out {job_id}: adding survey {survey_id} to users' to-be-answered lists")
+        try:
+            if job['total_users'] is None:
+                job['total_users'] = self._count_users()
+                self.queue.update(job_id, total_users=job['total_users'])
+
+            columns = 'UID' if self.method == 'rpc' else 'UID,answered_surveys,to_be_answered_surveys'
+            for page in self._iter_pages(columns, after=job['last_uid']):
+                added, batches = self._append_page(survey_id, page)
+                job['users_scanned'] += len(page)
+                job['users_added'] += added
+                job['batches_written'] += batches
+                job['last_uid'] = page[-1]['UID']
+                self.queue.update(
+                    job_id,
+                    users_scanned=job['users_scanned'],
+                    users_added=job['users_added'],
+                    batches_written=job['batches_written'],
+                    last_uid=job['last_uid'],
+                )
+        except Exception as e:
+            print(f"Fan-out {job_id} for survey {survey_id} failed: {str(e)}")
+            traceback.print_exc()
+            self.queue.update(job_id, status='failed', error=str(e), finished_at=_now())
+            return
+
+        self.queue.update(job_id, status='completed', finished_at=_now())
+        print(f"Fan-out {job_id} completed: survey {survey_id} added for {job['users_added']} of {job['users_scanned']} users")
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self._wake.wait(timeout=5)
+                self._wake.clear()
+                continue
+            self.process(job)
+
+    def start(self):
+        """Resume interrupted jobs and start the background worker"""
+        self.queue.requeue_running()
+        self._thread = threading.Thread(target=self._run, name="survey-fanout", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def status(self, job):
+        """Job record plus a progress percentage for the status endpoint"""
+        job = dict(job)
+        total = job.get('total_users')
+        if job['status'] == 'completed':
+            job['progress'] = 100.0
+        elif total:
+            job['progress'] = round(min(100.0, 100.0 * job['users_scanned'] / total), 1)
+        else:
+            job['progress'] = 0.0
+        return job
+
+    def stats(self):
+        return {'queue': type(self.queue).__name__, 'method': self.method, 'jobs': self.queue.counts()}
@@ -0,0 +1,18 @@
+-- Used by survey_publisher (FANOUT_WRITE_METHOD=rpc, the default). Update-only: never inserts users.
+-- Appends {"survey_id": p_survey_id} to the to-be-answered list of every user in
+-- p_uids who has neither answered the survey nor already has it listed.
+create or replace function fanout_survey_to_users(p_survey_id text, p_uids uuid[])
+returns integer
+language sql
+as $$
+  with updated as (
+    update users
+    set to_be_answered_surveys = coalesce(to_be_answered_surveys, '[]'::jsonb)
+                                 || jsonb_build_array(jsonb_build_object('survey_id', p_survey_id))
+    where "UID" = any(p_uids)
+      and not coalesce(to_be_answered_surveys, '[]'::jsonb) @> jsonb_build_array(jsonb_build_object('survey_id', p_survey_id))
+      and not coalesce(answered_surveys, '[]'::jsonb) @> jsonb_build_array(jsonb_build_object('survey_id', p_survey_id))
+    returning 1
+  )
+  select count(*)::integer from updated;
+$$;
@@ -0,0 +1,4 @@
+-- Content version of each survey, bumped by survey_publisher on every update.
+-- survey_service derives ETags from it and shared.db.Database uses it to keep
+-- cached survey documents that have not changed.
+alter table surveys add column if not exists version integer not null default 1;
@@ -4,6 +4,7 @@ from flask import Flask
 from flask_cors import CORS
 from flask_apscheduler import APScheduler
 from dotenv import load_dotenv
+from shared.clients import get_pool_stats
 
 # Import routes
 from routes.surveys import survey_bp
@@ -27,7 +28,7 @@ def create_app():
     # Health check endpoint
     @app.route('/health', methods=['GET'])
     def health_check():
-        return {"status": "healthy", "service": "survey"}
+        return {"status": "healthy", "service": "survey", "supabase_pool": get_pool_stats()}
     
     return app
 
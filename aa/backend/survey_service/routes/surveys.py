@@ -1,6 +1,7 @@
 # survey_service/routes/surveys.py
-from flask import Blueprint, request
-from shared.db import Database
+from flask import Blueprint, request, make_response
+from shared.db import Database, survey_etag, SURVEY_PAGE_SIZE, SURVEY_MAX_PAGE_SIZE
+from shared.auth import require_service_token
 
 # Initialize database connection
 db = Database()
@@ -9,22 +10,81 @@ survey_bp = Blueprint('surveys', __name__)
 
 @survey_bp.route('/survey', methods=['GET'])
 def get_all_surveys():    
-    """Endpoint to retrieve all surveys"""
+    """
+    Endpoint to retrieve all surveys
+    
+    Query parameters (all optional):
+        fields: comma separated columns to return, e.g. fields=survey_id,title
+        summary: 1/true to return id, title, description, question_count and total_points
+        limit: page size, enables keyset pagination (response carries next_cursor)
+        cursor: next_cursor value from the previous page
+    """
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    summary = request.args.get('summary', '').lower() in ('1', 'true', 'yes')
+    cursor = request.args.get('cursor') or None
+    limit = request.args.get('limit')
+
     try:
-        survey_data = db.get_all_surveys()
-        return db.format_response(True, survey_data)
+        if limit is None and cursor is None:
+            # Unpaginated listing, kept for existing clients
+            survey_data = db.get_all_surveys(fields=fields, summary=summary)
+            return db.format_response(True, survey_data)
+
+        try:
+            limit = int(limit) if limit is not None else SURVEY_PAGE_SIZE
+        except ValueError:
+            return db.format_response(False, error='limit must be an integer', status_code=400)
+        limit = max(1, min(limit, SURVEY_MAX_PAGE_SIZE))
+
+        # Fetch one extra row to know whether another page exists
+        survey_data = db.get_all_surveys(fields=fields, summary=summary, limit=limit + 1, cursor=cursor)
+        next_cursor = None
+        if len(survey_data) > limit:
+            survey_data = survey_data[:limit]
+            next_cursor = survey_data[-1]['survey_id']
+
+        return db.format_response(True, survey_data, extra={'next_cursor': next_cursor})
+    except ValueError as e:
+        return db.format_response(False, error=str(e), status_code=400)
     except Exception as e:
         return db.format_response(False, error=str(e), status_code=500)
 
 @survey_bp.route('/survey/<id>', methods=['GET'])
 def get_survey(id):
-    """Endpoint to retrieve a specific survey"""
+    """Endpoint to retrieve a specific survey (supports ETag / If-None-Match)"""
     try:
         survey_data = db.get_survey_by_id(id)
         
         if not survey_data:
             return db.format_response(False, error='Survey not found', status_code=404)
-            
-        return db.format_response(True, survey_data)
+
+        etag = survey_etag(survey_data)
+        if request.if_none_match.contains(etag):
+            # Client already holds this version
+            response = make_response('', 304)
+        else:
+            response = make_response(db.format_response(True, survey_data))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache' # Always revalidate, but reuse on 304
+        return response
     except Exception as e:
-        return db.format_response(False, error=str(e), status_code=500)
\ No newline at end of file
+        return db.format_response(False, error=str(e), status_code=500)
+
+@survey_bp.route('/cache/surveys', methods=['GET'])
+def get_survey_cache_stats():
+    """Endpoint to retrieve the survey cache hit/miss counters"""
+    return db.format_response(True, db.get_survey_cache_stats())
+
+@survey_bp.route('/cache/surveys', methods=['DELETE'])
+@require_service_token
+def invalidate_all_cached_surveys():
+    """Endpoint to drop every cached survey"""
+    db.invalidate_all_surveys()
+    return db.format_response(True)
+
+@survey_bp.route('/cache/surveys/<survey_id>', methods=['DELETE'])
+@require_service_token
+def invalidate_cached_survey(survey_id):
+    """Endpoint called by survey_publisher when a survey is updated or deleted"""
+    removed = db.invalidate_survey(survey_id)
+    return db.format_response(True, {'survey_id': survey_id, 'invalidated': removed})
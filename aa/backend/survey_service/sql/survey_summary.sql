@@ -0,0 +1,22 @@
+-- Used by survey_service for GET /survey?summary=1 (Database.get_all_surveys(summary=True)).
+-- PostgREST computed columns: selecting question_count / total_points runs these on the
+-- server, so survey cards are built without sending each survey's questions JSON.
+create or replace function question_count(surveys)
+returns integer
+language sql
+stable
+as $$
+  select case when jsonb_typeof($1.questions::jsonb) = 'array' then jsonb_array_length($1.questions::jsonb) else 0 end;
+$$;
+
+create or replace function total_points(surveys)
+returns numeric
+language sql
+stable
+as $$
+  select coalesce(sum((question->>'points')::numeric), 0)
+  from jsonb_array_elements(
+    case when jsonb_typeof($1.questions::jsonb) = 'array' then $1.questions::jsonb else '[]'::jsonb end
+  ) as question
+  where jsonb_typeof(question->'points') = 'number';
+$$;
@@ -3,6 +3,8 @@ import os
 from flask import Flask
 from flask_cors import CORS
 from dotenv import load_dotenv
+from shared.clients import get_pool_stats
+from shared.auth import token_cache
 
 # Import route modules
 from routes.user_profile import user_profile_bp
@@ -32,7 +34,7 @@ def create_app():
     # Health check endpoint
     @app.route('/health', methods=['GET'])
     def health_check():
-        return {"status": "healthy", "service": "user"}
+        return {"status": "healthy", "service": "user", "supabase_pool": get_pool_stats(), "token_cache": token_cache.stats()}
     
     return app
 
@@ -2,7 +2,7 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timezone
 from shared.db import Database
-from shared.auth import Auth
+from shared.auth import Auth, require_service_token
 
 survey_management_bp = Blueprint('survey_management', __name__)
 
@@ -35,13 +35,8 @@ def get_user_to_be_answered_surveys():
             # No surveys to answer
             return db.format_response(True, [])
         
-        # Fetch the actual survey documents
-        surveys = []
-        
-        for survey_id in survey_ids:
-            survey_data = db.get_survey_by_id(survey_id)
-            if survey_data:
-                surveys.append(survey_data)
+        # Fetch the actual survey documents in bulk, preserving list order
+        surveys = db.get_surveys_by_ids(survey_ids)
         
         return db.format_response(True, surveys)
         
@@ -73,13 +68,8 @@ def get_user_answered_surveys():
             # No answered surveys
             return db.format_response(True, [])
         
-        # Fetch the actual survey documents
-        surveys = []
-        
-        for survey_id in survey_ids:
-            survey_data = db.get_survey_by_id(survey_id)
-            if survey_data:
-                surveys.append(survey_data)
+        # Fetch the actual survey documents in bulk, preserving list order
+        surveys = db.get_surveys_by_ids(survey_ids)
         
         return db.format_response(True, surveys)
         
@@ -164,4 +154,23 @@ def add_to_be_answered_surveys():
 
         return db.format_response(True)
     except Exception as e:
-        return db.format_response(False, error=str(e), status_code=500)
\ No newline at end of file
+        return db.format_response(False, error=str(e), status_code=500)
+
+@survey_management_bp.route('/cache/surveys', methods=['GET'])
+def get_survey_cache_stats():
+    """Endpoint to retrieve the survey cache hit/miss counters"""
+    return db.format_response(True, db.get_survey_cache_stats())
+
+@survey_management_bp.route('/cache/surveys', methods=['DELETE'])
+@require_service_token
+def invalidate_all_cached_surveys():
+    """Endpoint to drop every cached survey"""
+    db.invalidate_all_surveys()
+    return db.format_response(True)
+
+@survey_management_bp.route('/cache/surveys/<survey_id>', methods=['DELETE'])
+@require_service_token
+def invalidate_cached_survey(survey_id):
+    """Endpoint called by survey_publisher when a survey is updated or deleted"""
+    removed = db.invalidate_survey(survey_id)
+    return db.format_response(True, {'survey_id': survey_id, 'invalidated': removed})
@@ -2,7 +2,7 @@
 import os
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from supabase import create_client
+from shared.clients import get_supabase_client
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -22,7 +22,7 @@ supabase_key = os.getenv("SUPABASE_KEY")
 if not supabase_url or not supabase_key:
     raise ValueError("Missing Supabase credentials")
 
-supabase = create_client(supabase_url, supabase_key)
+supabase = get_supabase_client(supabase_url, supabase_key)
 print("Supabase initialized for Voucher Service!")
 
 @app.route('/voucher', methods=['GET'])